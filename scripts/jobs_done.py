@@ -1,16 +1,49 @@
 from __future__ import unicode_literals
-from clikit.app import App
-from jobs_done10.generators.jenkins import ConfigureCommandLineInterface
+import sys
 
 
-# Create command line application
-jobs_done_application = App('jobs_done')
 
-# Configure application with available generators
-ConfigureCommandLineInterface(jobs_done_application)
+def main():
+    '''
+    Runs a jobs_done command.
+
+    Only the generator implementing the command is imported (.. seealso:: jobs_done10.registry),
+    and listing commands imports no generators at all. Commands of other packages are only listed
+    with "--plugins", since finding them is slow.
+    '''
+    from jobs_done10.registry import GetCommandConfigurator, ListCommands
+
+    argv = sys.argv[1:]
+    if not argv or argv[0] in ('-h', '--help', '--plugins'):
+        include_plugins = '--plugins' in argv
+        sys.stdout.write('Usage: jobs_done <command> [options]\n\nCommands:\n')
+        for name, description in sorted(ListCommands(include_plugins).iteritems()):
+            sys.stdout.write('    %-20s %s\n' % (name, description or ''))
+        if not include_plugins:
+            sys.stdout.write('\nUse "jobs_done --plugins" to list commands of other packages.\n')
+        return 0
+
+    from clikit.app import App
+
+    # Create command line application
+    jobs_done_application = App('jobs_done')
+
+    # Configure application with the generator of the command being executed
+    configure = GetCommandConfigurator(argv[0])
+    if configure is not None:
+        configure(jobs_done_application)
+    else:
+        # Unknown command, configure all generators and let the application report it
+        configurators = []
+        for name in sorted(ListCommands(include_plugins=True)):
+            configurator = GetCommandConfigurator(name)
+            if configurator not in configurators:
+                configurators.append(configurator)
+                configurator(jobs_done_application)
+
+    # Run application
+    return jobs_done_application.Main()
 
 
-# Run application
-main = jobs_done_application.Main
 if __name__ == '__main__':
-    main()
+    sys.exit(main())
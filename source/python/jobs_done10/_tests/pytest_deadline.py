@@ -0,0 +1,59 @@
+from __future__ import unicode_literals
+from jobs_done10.deadline import Deadline, DeadlineExceededError
+import pytest
+
+
+
+def testDeadline():
+    deadline = Deadline(60)
+    assert not deadline.IsExpired()
+    assert 0 < deadline.GetRemainingTime() <= 60
+
+    deadline.AddOperations(['first', 'second', 'third'])
+    assert deadline.Run('first', lambda x: x * 2, 21) == 42
+    assert deadline.finished_operations == ['first']
+    assert deadline.pending_operations == ['second', 'third']
+
+    # Expire deadline
+    deadline.expiration_time = 0
+    assert deadline.IsExpired()
+    assert deadline.GetRemainingTime() == 0
+
+    executed = []
+    with pytest.raises(DeadlineExceededError) as e:
+        deadline.Run('second', executed.append, 'second')
+    assert executed == []
+    assert e.value.finished_operations == ['first']
+    assert e.value.skipped_operations == ['second', 'third']
+
+
+
+def testDeadlineNeverExpires():
+    deadline = Deadline()
+    assert deadline.GetRemainingTime() is None
+    assert not deadline.IsExpired()
+    assert deadline.Run('operation', lambda: 'result') == 'result'
+    assert deadline.finished_operations == ['operation']
+    assert deadline.pending_operations == []
+
+
+
+def testDeadlineThreads():
+    import threading
+
+    deadline = Deadline(60)
+    operations = ['operation %d' % index for index in range(400)]
+
+    def _RunOperations(thread_index):
+        for operation in operations[thread_index::4]:
+            deadline.AddOperations([operation])
+            deadline.Run(operation, lambda: None)
+
+    threads = [threading.Thread(target=_RunOperations, args=(index,)) for index in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(deadline.finished_operations) == sorted(operations)
+    assert deadline.pending_operations == []
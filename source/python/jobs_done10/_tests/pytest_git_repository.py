@@ -0,0 +1,216 @@
+from __future__ import unicode_literals
+from ben10.filesystem import CreateDirectory, CreateFile
+from gitit.git import Git
+from jobs_done10.git_repository import (FetchBranch, GetBlobSha, GetBranchesCommitTimes,
+    GetBranchFromRefName, GetCurrentBranch, GetHeadCommit, GetRemoteUrl, GitObjectReader,
+    ListBranches)
+import jobs_done10.git_repository
+import os
+
+
+
+def testListBranches(embed_data):
+    repo_path = embed_data['git_repository']
+    CreateDirectory(repo_path)
+
+    git = Git()
+    git.Execute(['init'], repo_path)
+    git.AddRemote(repo_path, 'origin', 'http://server/space.git')
+    CreateFile(os.path.join(repo_path, '.gitignore'), '')
+    git.Add(repo_path, '.')
+    git.Commit(repo_path, 'First commit')
+    git.Execute(['branch', '-M', 'master'], repo_path)
+    git.Execute(['branch', 'milky_way'], repo_path)
+    git.Execute(['update-ref', 'refs/remotes/origin/master', 'master'], repo_path)
+
+    # Regular clones only have branches of "origin" (local branches may have never been pushed)
+    assert ListBranches(repo_path) == set(['master'])
+    assert GetRemoteUrl(repo_path) == 'http://server/space.git'
+
+    # Mirrors only have local branches
+    mirror_path = embed_data['mirror.git']
+    git.Execute(['clone', '--mirror', repo_path, mirror_path], embed_data['.'])
+    assert ListBranches(mirror_path) == set(['master', 'milky_way'])
+    assert GetRemoteUrl(mirror_path) == repo_path
+
+
+
+def testGetBranchesCommitTimes(embed_data, monkeypatch):
+    repo_path = embed_data['git_repository']
+    CreateDirectory(repo_path)
+
+    git = Git()
+    git.Execute(['init'], repo_path)
+    CreateFile(os.path.join(repo_path, '.gitignore'), '')
+    git.Add(repo_path, '.')
+    monkeypatch.setenv('GIT_AUTHOR_DATE', '2000-01-01T00:00:00+0000')
+    monkeypatch.setenv('GIT_COMMITTER_DATE', '2000-01-01T00:00:00+0000')
+    git.Commit(repo_path, 'Old commit')
+    monkeypatch.delenv('GIT_AUTHOR_DATE')
+    monkeypatch.delenv('GIT_COMMITTER_DATE')
+    git.Execute(['branch', '-M', 'master'], repo_path)
+    git.Execute(['branch', 'old'], repo_path)
+
+    CreateFile(os.path.join(repo_path, 'new'), '')
+    git.Add(repo_path, '.')
+    git.Commit(repo_path, 'New commit')
+
+    # Only branches of "origin" are considered (as if fetched), not local branches
+    git.Execute(['branch', 'local'], repo_path)
+    for branch in ('master', 'old'):
+        git.Execute(['update-ref', 'refs/remotes/origin/' + branch, branch], repo_path)
+
+    # Tags are ignored (annotated tags have no committer date)
+    git.Execute(['tag', '-a', 'v1.0', '-m', 'Annotated tag'], repo_path)
+    git.Execute(['tag', 'v1.1'], repo_path)
+
+    commit_times = GetBranchesCommitTimes(repo_path)
+    assert commit_times['old'] == 946684800
+    assert commit_times['master'] > 946684800
+    assert set(commit_times) == set(['master', 'old'])
+
+
+
+def testGetCurrentBranch(embed_data, monkeypatch):
+    repo_path = _CreateRepository(embed_data)
+    git = Git()
+    commit = git.Execute(['rev-parse', 'HEAD'], repo_path).strip()
+
+    # Git is not executed to read information available in git files
+    _ExecuteGit = jobs_done10.git_repository._ExecuteGit
+    monkeypatch.setattr(jobs_done10.git_repository, '_ExecuteGit', None)
+
+    assert GetCurrentBranch(repo_path) == 'master'
+    assert GetCurrentBranch(os.path.join(repo_path, 'subdir')) == 'master'
+    assert GetHeadCommit(repo_path) == commit
+    assert GetRemoteUrl(repo_path) == 'http://server/space.git'
+
+    # Packed refs
+    _ExecuteGit(repo_path, ['pack-refs', '--all'])
+    assert not os.path.exists(os.path.join(repo_path, '.git', 'refs', 'heads', 'master'))
+    assert GetHeadCommit(repo_path) == commit
+
+    # Detached HEAD
+    _ExecuteGit(repo_path, ['checkout', '-q', commit])
+    assert GetCurrentBranch(repo_path) is None
+    assert GetHeadCommit(repo_path) == commit
+
+
+
+def testGetCurrentBranchLinkedWorktree(embed_data, monkeypatch):
+    repo_path = _CreateRepository(embed_data)
+    worktree_path = embed_data['worktree']
+    Git().Execute(['worktree', 'add', '-b', 'milky_way', worktree_path], repo_path)
+    commit = Git().Execute(['rev-parse', 'HEAD'], repo_path).strip()
+
+    monkeypatch.setattr(jobs_done10.git_repository, '_ExecuteGit', None)
+
+    # Worktrees have their own HEAD, but share config and refs
+    assert GetCurrentBranch(worktree_path) == 'milky_way'
+    assert GetCurrentBranch(repo_path) == 'master'
+    assert GetHeadCommit(worktree_path) == commit
+    assert GetRemoteUrl(worktree_path) == 'http://server/space.git'
+
+
+
+def testGetRemoteUrlFallback(embed_data):
+    repo_path = _CreateRepository(embed_data)
+
+    # Quoted values are left to git
+    Git().Execute(['config', 'remote.origin.url', 'http://server/space.git#1'], repo_path)
+    assert GetRemoteUrl(repo_path) == 'http://server/space.git#1'
+
+
+
+def testGitObjectReader(embed_data):
+    repo_path = _CreateRepository(embed_data)
+    git = Git()
+    git.Execute(['checkout', '-b', 'milky_way'], repo_path)
+    CreateFile(os.path.join(repo_path, 'planets.txt'), 'mercury\nvenus\n')
+    git.Add(repo_path, '.')
+    git.Commit(repo_path, 'Planets')
+    commit = git.Execute(['rev-parse', 'HEAD'], repo_path).strip()
+    git.Execute(['checkout', 'master'], repo_path)
+
+    with GitObjectReader(repo_path) as object_reader:
+        assert object_reader.ReadFile('milky_way', 'planets.txt') == \
+            (GetBlobSha('mercury\nvenus\n'), 'mercury\nvenus\n')
+        assert object_reader.ReadFile('milky_way', 'subdir/.gitignore') == (GetBlobSha(''), '')
+        assert object_reader.ReadFile('master', 'planets.txt') is None
+        assert object_reader.ReadFile('unknown', 'planets.txt') is None
+
+        # Directories are not files
+        assert object_reader.ReadFile('milky_way', 'subdir') is None
+
+        assert object_reader.ResolveRef('milky_way') == commit
+        assert object_reader.ResolveRef('unknown') is None
+
+        # A single git process serves all reads
+        process = object_reader._process
+        object_reader.ReadFile(commit, 'planets.txt')
+        assert object_reader._process is process
+
+    assert object_reader._process is None
+
+
+
+def testFetchBranch(embed_data):
+    origin_path = _CreateRepository(embed_data)
+    git = Git()
+    mirror_path = embed_data['mirror']
+    git.Execute(['clone', '--quiet', '--mirror', origin_path, mirror_path], '.')
+    clone_path = embed_data['clone']
+    git.Execute(['clone', '--quiet', origin_path, clone_path], '.')
+
+    git.Execute(['checkout', '-b', 'milky_way'], origin_path)
+    CreateFile(os.path.join(origin_path, 'planets.txt'), 'mercury\n')
+    git.Add(origin_path, '.')
+    git.Commit(origin_path, 'Planets')
+
+    assert FetchBranch(mirror_path, 'milky_way') == 'refs/heads/milky_way'
+    assert FetchBranch(clone_path, 'milky_way') == 'refs/remotes/origin/milky_way'
+    for repo_path, ref in [(mirror_path, 'milky_way'), (clone_path, 'origin/milky_way')]:
+        with GitObjectReader(repo_path) as object_reader:
+            assert object_reader.ReadFile(ref, 'planets.txt')[1] == 'mercury\n'
+
+    # Branches deleted in origin are deleted locally
+    git.Execute(['checkout', 'master'], origin_path)
+    git.Execute(['branch', '-D', 'milky_way'], origin_path)
+    assert FetchBranch(mirror_path, 'milky_way') is None
+    assert FetchBranch(clone_path, 'milky_way') is None
+    assert ListBranches(mirror_path) == set(['master'])
+    assert ListBranches(clone_path) == set(['master'])
+
+
+
+def testGetBranchFromRefName():
+    assert GetBranchFromRefName('master') == 'master'
+    assert GetBranchFromRefName('origin/master') == 'master'
+    assert GetBranchFromRefName('refs/heads/feature/x') == 'feature/x'
+    assert GetBranchFromRefName('refs/remotes/origin/master') == 'master'
+
+
+
+def testGetBlobSha():
+    # Same as `git hash-object`
+    assert GetBlobSha('') == 'e69de29bb2d1d6434b8b29ae775ad8c2e48c5391'
+    assert GetBlobSha('hello\n') == 'ce013625030ba8dba906f756967f9e9ca394464a'
+
+
+
+def _CreateRepository(embed_data):
+    '''
+    :return unicode:
+        Path to a repository with a single commit in "master", and "origin" remote.
+    '''
+    repo_path = embed_data['git_repository']
+    CreateDirectory(repo_path)
+
+    git = Git()
+    git.Execute(['init'], repo_path)
+    git.AddRemote(repo_path, 'origin', 'http://server/space.git')
+    CreateFile(os.path.join(repo_path, 'subdir', '.gitignore'), '')
+    git.Add(repo_path, '.')
+    git.Commit(repo_path, 'First commit')
+    git.Execute(['branch', '-M', 'master'], repo_path)
+    return repo_path
@@ -0,0 +1,108 @@
+from __future__ import unicode_literals
+from ben10.filesystem import CreateFile
+from ben10.foundation.string import Dedent
+from jobs_done10.generators._tests import pytest_jenkins
+from jobs_done10.jenkins_batch import (JenkinsBatchEntry, ReadBatchManifest,
+    UploadJobsFromManifest, WriteBatchSummary)
+from jobs_done10.repository import Repository
+import os
+import pytest
+
+
+
+def testReadBatchManifest(embed_data):
+    manifest_filename = embed_data['manifest.yaml']
+    CreateFile(manifest_filename, Dedent(
+        '''
+        - space
+        - directory: /mirrors/space
+          ref: origin/milky_way
+          branch: milky_way
+        '''
+    ))
+
+    assert ReadBatchManifest(manifest_filename) == [
+        JenkinsBatchEntry(directory=os.path.join(os.path.dirname(manifest_filename), 'space')),
+        JenkinsBatchEntry(
+            directory='/mirrors/space', ref='origin/milky_way', branch='milky_way'),
+    ]
+
+    CreateFile(manifest_filename, '- directory: space\n  tag: v1')
+    with pytest.raises(ValueError):
+        ReadBatchManifest(manifest_filename)
+
+    CreateFile(manifest_filename, 'directory: space')
+    with pytest.raises(ValueError):
+        ReadBatchManifest(manifest_filename)
+
+
+
+def testUploadJobsFromManifest(embed_data, monkeypatch):
+    import json
+    import StringIO
+
+    mock_jenkins = pytest_jenkins.TestJenkinsPublisher()._MockJenkinsAPI(monkeypatch)
+    repo_path = pytest_jenkins.TestJenkinsActions()._CreateRepositoryWithBranches(
+        embed_data, ['milky_way', 'andromeda'], 'http://server/space.git')
+
+    entries = [
+        JenkinsBatchEntry(directory=repo_path, ref='andromeda'),
+        JenkinsBatchEntry(directory=repo_path, ref='milky_way'),
+        JenkinsBatchEntry(directory=repo_path, ref='unknown'),
+        JenkinsBatchEntry(directory=repo_path, ref='milky_way', branch='andromeda'),
+    ]
+    finished = []
+    results = UploadJobsFromManifest(
+        entries,
+        url='jenkins_url',
+        username='jenkins_user',
+        password='jenkins_pass',
+        parallel=2,
+        on_result=finished.append,
+    )
+    assert results == sorted(finished, key=lambda result: entries.index(result.entry))
+
+    # Entries publishing the same job group: only the last one is published
+    assert results[0].repository == \
+        Repository(url='http://server/space.git', branch='andromeda')
+    assert results[0].superseded
+    assert results[0].new is None
+
+    assert results[1].repository == \
+        Repository(url='http://server/space.git', branch='milky_way')
+    assert (results[1].new, results[1].updated, results[1].deleted) == (
+        ['space-milky_way-jupiter', 'space-milky_way-venus'],
+        ['space-milky_way-mercury'],
+        ['space-milky_way-saturn'],
+    )
+    assert results[1].error is None
+    assert not results[1].superseded
+
+    assert results[2].repository is None
+    assert results[2].error == 'ValueError: Unknown git ref: "unknown"'
+
+    assert results[3].repository == \
+        Repository(url='http://server/space.git', branch='andromeda')
+    assert results[3].new == [
+        'space-andromeda-jupiter', 'space-andromeda-mercury', 'space-andromeda-venus']
+    assert not results[3].superseded
+
+    # Jobs were listed only once for all repositories
+    assert len(mock_jenkins.LIST_THREADS) == 1
+
+    stream = StringIO.StringIO()
+    WriteBatchSummary(results, stream)
+    summary = json.loads(stream.getvalue())
+    assert [
+        (s['branch'], s['error'], s['superseded'], len(s['new'] or [])) for s in summary
+    ] == [
+        ('andromeda', None, True, 0),
+        ('milky_way', None, False, 2),
+        (None, 'ValueError: Unknown git ref: "unknown"', False, 0),
+        ('andromeda', None, False, 3),
+    ]
+
+    # Nothing to publish: Jenkins is not even reached
+    mock_jenkins.LIST_THREADS[:] = []
+    assert UploadJobsFromManifest([], url='jenkins_url') == []
+    assert mock_jenkins.LIST_THREADS == []
@@ -0,0 +1,130 @@
+from __future__ import unicode_literals
+from gitit.git import Git
+from jobs_done10.generators._tests import pytest_jenkins
+from jobs_done10.generators.jenkins import GetJobsFromFile
+from jobs_done10.jenkins_session import JenkinsSession, UploadJobsFromMirror
+from jobs_done10.repository import Repository
+import pytest
+
+
+
+def testJenkinsSession(monkeypatch):
+    mock_jenkins = pytest_jenkins.TestJenkinsPublisher()._MockJenkinsAPI(monkeypatch)
+    session = JenkinsSession('jenkins_url', 'jenkins_user', 'jenkins_pass')
+    jobs_done_file_contents = pytest_jenkins.TestJenkinsActions._JOBS_DONE_FILE_CONTENTS
+    milky_way = Repository(url='http://server/space.git', branch='milky_way')
+    andromeda = Repository(url='http://server/space.git', branch='andromeda')
+
+    assert session.UploadJobsFromFile(milky_way, jobs_done_file_contents) == (
+        ['space-milky_way-jupiter', 'space-milky_way-venus'],
+        ['space-milky_way-mercury'],
+        ['space-milky_way-saturn'],
+    )
+    assert sorted(mock_jenkins.CONFIG_REQUESTS) == [
+        'space-milky_way-mercury', 'space-milky_way-saturn']
+
+    # Jenkins state is kept by the session: no more requests are needed to find jobs
+    assert session.UploadJobsFromFile(milky_way, jobs_done_file_contents) == (
+        [],
+        ['space-milky_way-jupiter', 'space-milky_way-mercury', 'space-milky_way-venus'],
+        [],
+    )
+    assert session.UploadJobsFromFile(andromeda, jobs_done_file_contents)[0] == [
+        'space-andromeda-jupiter', 'space-andromeda-mercury', 'space-andromeda-venus']
+    assert len(mock_jenkins.LIST_THREADS) == 1
+    assert len(mock_jenkins.CONFIG_REQUESTS) == 2
+
+    statistics = session.GetStatistics()
+    assert statistics.uploads == 3
+    assert statistics.listings == 1
+    assert (statistics.parses, statistics.parse_hits) == (1, 2)
+    assert (statistics.render_hits, statistics.render_misses) == (3, 0)
+    assert statistics.cached_job_names == 6
+
+    # After invalidation, jobs are listed again
+    session.Invalidate()
+    assert session.GetStatistics().cached_job_names == 0
+    session.UploadJobsFromFile(milky_way, jobs_done_file_contents)
+    assert len(mock_jenkins.LIST_THREADS) == 2
+    assert session.GetStatistics().invalidations == 1
+
+
+
+def testJenkinsSessionWorkerPool(monkeypatch):
+    from jobs_done10 import metrics
+    from jobs_done10.jobs_done_job import JobsDoneFileResourceError
+    from jobs_done10.worker_pool import ResourceLimits, WorkerPool
+
+    pytest_jenkins.TestJenkinsPublisher()._MockJenkinsAPI(monkeypatch)
+    worker_pool = WorkerPool(processes=1, limits=ResourceLimits(memory=256, timeout=30))
+    session = JenkinsSession(
+        'jenkins_url', 'jenkins_user', 'jenkins_pass', worker_pool=worker_pool)
+    jobs_done_file_contents = pytest_jenkins.TestJenkinsActions._JOBS_DONE_FILE_CONTENTS
+    milky_way = Repository(url='http://server/space.git', branch='milky_way')
+    andromeda = Repository(url='http://server/space.git', branch='andromeda')
+
+    # A huge matrix (10^12 rows)
+    huge_jobs_done_file_contents = 'matrix:\n' + ''.join(
+        '  variable_%d: [%s]\n' % (index, ', '.join(unicode(value) for value in range(10)))
+        for index in range(12)
+    )
+
+    metrics.REGISTRY.Reset()
+    try:
+        # Jobs generated by workers are the same as jobs generated in this process
+        jobs = session.GetJobs(milky_way, jobs_done_file_contents)
+        assert metrics.PARSE_DURATION.GetCount() == 1  # Reported by the worker
+        assert jobs == GetJobsFromFile(milky_way, jobs_done_file_contents)
+        assert session.GetJobs(milky_way, jobs_done_file_contents) == jobs
+        statistics = session.GetStatistics()
+        assert (statistics.parses, statistics.parse_hits) == (1, 1)
+
+        # Going over limits does not affect other repositories/branches
+        with pytest.raises(JobsDoneFileResourceError):
+            session.UploadJobsFromFile(andromeda, huge_jobs_done_file_contents)
+        assert session.UploadJobsFromFile(milky_way, jobs_done_file_contents) == (
+            ['space-milky_way-jupiter', 'space-milky_way-venus'],
+            ['space-milky_way-mercury'],
+            ['space-milky_way-saturn'],
+        )
+    finally:
+        worker_pool.Close()
+
+
+
+def testUploadJobsFromMirror(embed_data, monkeypatch):
+    mock_jenkins = pytest_jenkins.TestJenkinsPublisher()._MockJenkinsAPI(monkeypatch)
+    origin_path = pytest_jenkins.TestJenkinsActions()._CreateRepositoryWithBranches(
+        embed_data, ['milky_way'], 'http://server/space.git')
+    mirror_path = embed_data['mirror']
+    git = Git()
+    git.Execute(['clone', '--quiet', '--mirror', origin_path, mirror_path], '.')
+
+    # Jobs use the url of "origin", but branches are fetched from `origin_path`
+    git.Execute(['config', 'remote.origin.url', 'http://server/space.git'], mirror_path)
+    git.Execute(
+        ['config', 'url.%s.insteadOf' % origin_path, 'http://server/space.git'], mirror_path)
+
+    session = JenkinsSession('jenkins_url', 'jenkins_user', 'jenkins_pass')
+    repository, result = UploadJobsFromMirror(session, mirror_path, 'milky_way')
+    assert repository == Repository(url='http://server/space.git', branch='milky_way')
+    assert result == (
+        ['space-milky_way-jupiter', 'space-milky_way-venus'],
+        ['space-milky_way-mercury'],
+        ['space-milky_way-saturn'],
+    )
+
+    # Jobs of branches deleted in origin are deleted
+    git.Execute(['branch', '-D', 'milky_way'], origin_path)
+    repository, result = UploadJobsFromMirror(session, mirror_path, 'milky_way')
+    assert result == (
+        [],
+        [],
+        ['space-milky_way-jupiter', 'space-milky_way-mercury', 'space-milky_way-venus'],
+    )
+    assert mock_jenkins.DELETED_JOBS == set([
+        'space-milky_way-jupiter',
+        'space-milky_way-mercury',
+        'space-milky_way-saturn',
+        'space-milky_way-venus',
+    ])
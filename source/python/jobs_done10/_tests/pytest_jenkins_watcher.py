@@ -0,0 +1,50 @@
+from __future__ import unicode_literals
+from ben10.filesystem import CreateFile
+from jobs_done10.generators._tests import pytest_jenkins
+from jobs_done10.jenkins_watcher import JenkinsJobsWatcher
+from jobs_done10.jobs_done_job import JOBS_DONE_FILENAME
+import os
+
+
+
+def testJenkinsJobsWatcher(embed_data):
+    repo_path = pytest_jenkins.TestJenkinsActions()._CreateRepositoryWithBranches(
+        embed_data, ['milky_way'], 'http://space.git')
+    output_directory = embed_data['output']
+    jobs_done_filename = os.path.join(repo_path, JOBS_DONE_FILENAME)
+    jobs_done_file_contents = pytest_jenkins.TestJenkinsActions._JOBS_DONE_FILE_CONTENTS
+    CreateFile(jobs_done_filename, jobs_done_file_contents)
+
+    watcher = JenkinsJobsWatcher(repo_path, output_directory)
+
+    cycle = watcher.Update()
+    assert cycle.new == ['space-master-jupiter', 'space-master-mercury', 'space-master-venus']
+    assert cycle.generated == 3
+    assert watcher.Update() is None
+
+    # Only the new matrix row is generated, and only files of changed jobs are touched
+    mercury_filename = os.path.join(output_directory, 'space-master-mercury')
+    os.utime(mercury_filename, (0, 0))
+
+    # Changes are found even keeping the size and modification time of the file
+    jobs_done_stat = os.stat(jobs_done_filename)
+    CreateFile(jobs_done_filename, jobs_done_file_contents.replace('- jupiter', '- saturn '))
+    os.utime(jobs_done_filename, (jobs_done_stat.st_atime, jobs_done_stat.st_mtime))
+    assert os.path.getsize(jobs_done_filename) == jobs_done_stat.st_size
+
+    cycle = watcher.Update()
+    assert cycle.generated == 1
+    assert cycle.new == ['space-master-saturn']
+    assert cycle.updated == []
+    assert cycle.unchanged == ['space-master-mercury', 'space-master-venus']
+    assert cycle.deleted == ['space-master-jupiter']
+    assert os.path.getmtime(mercury_filename) == 0
+    assert set(os.listdir(output_directory)) == set([
+        'space-master-mercury', 'space-master-saturn', 'space-master-venus'])
+
+    # Removing the jobs_done file removes all jobs
+    os.remove(jobs_done_filename)
+    cycle = watcher.Update()
+    assert cycle.deleted == [
+        'space-master-mercury', 'space-master-saturn', 'space-master-venus']
+    assert os.listdir(output_directory) == []
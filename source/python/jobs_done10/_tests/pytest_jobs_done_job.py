@@ -538,3 +538,36 @@ def testStripFile():
     )
     contents += '\t'
     JobsDoneJob.CreateFromYAML(contents, repository=_REPOSITORY)
+
+
+
+def testCreateFromParsedYAML():
+    contents = Dedent(
+        '''
+        junit_patterns:
+        - "{planet}-{branch}.xml"
+
+        branch-master:display_name: "Master"
+
+        branch_patterns:
+        - master
+        - milky_way
+
+        matrix:
+            planet:
+            - mars
+            - earth
+        '''
+    )
+    # A file is parsed once, and used to create jobs for many branches
+    parsed_file = JobsDoneJob.ParseYAML(contents)
+    for branch in ('master', 'milky_way', 'feature'):
+        repository = Repository(url='https://space.git', branch=branch)
+        jobs = JobsDoneJob.CreateFromParsedYAML(parsed_file, repository)
+        expected_jobs = JobsDoneJob.CreateFromYAML(contents, repository)
+
+        assert [job.__dict__ for job in jobs] == [job.__dict__ for job in expected_jobs]
+        assert len(jobs) == (0 if branch == 'feature' else 2)
+
+    assert JobsDoneJob.ParseYAML(None) is None
+    assert JobsDoneJob.CreateFromParsedYAML(None, _REPOSITORY) == []
@@ -0,0 +1,174 @@
+from __future__ import unicode_literals
+from jobs_done10 import metrics
+from jobs_done10.metrics import MetricsRegistry
+from jobs_done10.repository import Repository
+import os
+import pytest
+
+
+
+def testCounter():
+    registry = MetricsRegistry()
+    requests = registry.Counter('requests_total', 'Requests made.', ['kind'])
+    errors = registry.Counter('errors_total', 'Errors.')
+
+    requests.Inc(kind='list')
+    requests.Inc(2, kind='config')
+    requests.Inc(kind='config')
+    assert requests.GetValue(kind='config') == 3
+    assert requests.GetValue(kind='create') == 0
+
+    with pytest.raises(ValueError):
+        requests.Inc(-1, kind='list')
+    with pytest.raises(ValueError):
+        requests.Inc()
+    with pytest.raises(ValueError):
+        requests.Inc(kind='list', job='space')
+    with pytest.raises(ValueError):
+        registry.Counter('errors_total', 'Errors, again.')
+
+    assert registry.FormatText() == '\n'.join([
+        '# HELP requests_total Requests made.',
+        '# TYPE requests_total counter',
+        'requests_total{kind="config"} 3',
+        'requests_total{kind="list"} 1',
+        '# HELP errors_total Errors.',
+        '# TYPE errors_total counter',
+        'errors_total 0',
+    ]) + '\n'
+
+    registry.Reset()
+    assert requests.GetValue(kind='config') == 0
+
+
+
+def testHistogram(monkeypatch):
+    registry = MetricsRegistry()
+    durations = registry.Histogram(
+        'duration_seconds', 'Durations.', ['target'], buckets=(0.5, 0.1, 1))
+
+    for value in (0.0625, 0.125, 0.75, 3.0):
+        durations.Observe(value, target='jenkins')
+    assert durations.GetCount(target='jenkins') == 4
+    assert durations.GetSum(target='jenkins') == 3.9375
+    assert durations.GetCount(target='directory') == 0
+
+    times = iter([10.0, 10.25])
+    monkeypatch.setattr('time.time', lambda: next(times))
+    with durations.Time(target='directory'):
+        pass
+
+    assert registry.FormatText() == '\n'.join([
+        '# HELP duration_seconds Durations.',
+        '# TYPE duration_seconds histogram',
+        'duration_seconds_bucket{target="directory",le="0.1"} 0',
+        'duration_seconds_bucket{target="directory",le="0.5"} 1',
+        'duration_seconds_bucket{target="directory",le="1"} 1',
+        'duration_seconds_bucket{target="directory",le="+Inf"} 1',
+        'duration_seconds_sum{target="directory"} 0.25',
+        'duration_seconds_count{target="directory"} 1',
+        'duration_seconds_bucket{target="jenkins",le="0.1"} 1',
+        'duration_seconds_bucket{target="jenkins",le="0.5"} 2',
+        'duration_seconds_bucket{target="jenkins",le="1"} 3',
+        'duration_seconds_bucket{target="jenkins",le="+Inf"} 4',
+        'duration_seconds_sum{target="jenkins"} 3.9375',
+        'duration_seconds_count{target="jenkins"} 4',
+    ]) + '\n'
+
+
+
+def testTakeValues():
+    registry = MetricsRegistry()
+    requests = registry.Counter('requests_total', 'Requests made.', ['kind'])
+    durations = registry.Histogram('duration_seconds', 'Durations.', buckets=(0.5, 1))
+    registry.Counter('errors_total', 'Errors.')
+
+    requests.Inc(2, kind='list')
+    durations.Observe(0.25)
+    durations.Observe(0.75)
+
+    # Values taken (e.g. in a worker process) are reset, and can be added to another registry
+    values = registry.TakeValues()
+    assert set(values) == set(['requests_total', 'duration_seconds'])
+    assert requests.GetValue(kind='list') == 0
+    assert durations.GetCount() == 0
+
+    other_registry = MetricsRegistry()
+    other_requests = other_registry.Counter('requests_total', 'Requests made.', ['kind'])
+    other_durations = other_registry.Histogram('duration_seconds', 'Durations.', buckets=(0.5, 1))
+    other_requests.Inc(kind='list')
+    other_durations.Observe(2.0)
+
+    other_registry.AddValues(values)
+    other_registry.AddValues({'unknown_total' : {() : 1}})
+    assert other_requests.GetValue(kind='list') == 3
+    assert other_durations.GetCount() == 3
+    assert other_durations.GetSum() == 3.0
+    assert [
+        (name, value) for name, _labels, value in other_durations.IterSamples()
+    ] == [
+        ('duration_seconds_bucket', 1),
+        ('duration_seconds_bucket', 2),
+        ('duration_seconds_bucket', 3),
+        ('duration_seconds_sum', 3.0),
+        ('duration_seconds_count', 3),
+    ]
+
+
+
+def testFormatTextEscaping():
+    registry = MetricsRegistry()
+    counter = registry.Counter('jobs_total', 'Jobs\\published\nby name.', ['job'])
+    counter.Inc(job='space "milky\\way"\n')
+
+    assert registry.FormatText().splitlines() == [
+        '# HELP jobs_total Jobs\\\\published\\nby name.',
+        '# TYPE jobs_total counter',
+        'jobs_total{job="space \\"milky\\\\way\\"\\n"} 1',
+    ]
+
+
+
+def testWriteTextFile(embed_data):
+    registry = MetricsRegistry()
+    registry.Counter('errors_total', 'Errors.').Inc()
+
+    filename = embed_data['jobs_done.prom']
+    registry.WriteTextFile(filename)
+    registry.WriteTextFile(filename)
+    with open(filename, 'rb') as metrics_file:
+        assert metrics_file.read() == registry.FormatText().encode('utf-8')
+
+    # No temporary files left behind
+    assert os.listdir(os.path.dirname(filename)) == ['jobs_done.prom']
+
+
+
+def testJobsDoneMetrics():
+    from jobs_done10.generators.jenkins import GetJobsFromFile
+
+    metrics.REGISTRY.Reset()
+
+    jobs_done_file_contents = '\n'.join([
+        'matrix:',
+        '  planet:',
+        '  - earth',
+        '  - mars',
+        '  - venus',
+        'planet-venus:exclude: yes',
+        'planet-mars:branch_patterns:',
+        '- "feature-.*"',
+    ])
+    jobs = GetJobsFromFile(
+        Repository(url='http://space.git', branch='master'), jobs_done_file_contents)
+    assert len(jobs) == 1
+
+    assert metrics.MATRIX_ROWS.GetValue(result='expanded') == 1
+    assert metrics.MATRIX_ROWS.GetValue(result='excluded') == 1
+    assert metrics.MATRIX_ROWS.GetValue(result='branch_mismatch') == 1
+    assert metrics.PARSE_DURATION.GetCount() == 1
+    assert metrics.GENERATE_DURATION.GetCount() == 1
+
+    with pytest.raises(ValueError):
+        GetJobsFromFile(Repository(url='http://space.git', branch='master'), '')
+    assert metrics.PARSE_ERRORS.GetValue() == 1
@@ -0,0 +1,122 @@
+from __future__ import unicode_literals
+from jobs_done10.registry import BUILTIN_COMMANDS, GetCommandConfigurator, ListCommands
+import jobs_done10.registry
+import os
+import pytest
+import subprocess
+import sys
+
+
+
+# Maximum time (seconds) that listing commands may take, over the time to start Python itself.
+# Generous, so it does not depend on the load of the machine running tests, but still fails if
+# heavy packages (.. seealso:: _HEAVY_PACKAGES) are imported again.
+COLD_START_BUDGET = 1.0
+
+# Packages that must not be imported to list commands
+_HEAVY_PACKAGES = [
+    'ben10',
+    'clikit',
+    'gitit',
+    'jenkins',
+    'jobs_done10.generators',
+    'pkg_resources',
+    'xml_factory',
+    'yaml',
+]
+
+
+
+def testListCommands(monkeypatch):
+    monkeypatch.setattr(jobs_done10.registry, '_GetEntryPointCommands', lambda: {'plugin' : None})
+
+    # Commands of other packages are only listed when asked for
+    assert set(ListCommands()) == set(BUILTIN_COMMANDS)
+
+    commands = ListCommands(include_plugins=True)
+    assert set(commands) == set(BUILTIN_COMMANDS) | set(['plugin'])
+    assert commands['jenkins'] == 'Creates jobs for Jenkins and push them to a Jenkins instance.'
+    assert commands['plugin'] is None
+
+
+
+def testGetCommandConfigurator(monkeypatch):
+    from jobs_done10.generators.jenkins import ConfigureCommandLineInterface
+
+    monkeypatch.setattr(jobs_done10.registry, '_GetEntryPointCommands', lambda: {})
+
+    for command in BUILTIN_COMMANDS:
+        assert GetCommandConfigurator(command) is ConfigureCommandLineInterface
+    assert GetCommandConfigurator('unknown') is None
+
+
+
+def testBuiltinCommands():
+    '''
+    Builtin commands are exactly the commands configured by their configure functions.
+    '''
+    from jobs_done10.generators.jenkins import ConfigureCommandLineInterface
+
+    configured = []
+    def _FakeApplication(command_function):
+        configured.append(command_function.__name__)
+        return command_function
+
+    ConfigureCommandLineInterface(_FakeApplication)
+    assert sorted(configured) == sorted(BUILTIN_COMMANDS)
+
+
+
+def _GetScriptAndEnviron():
+    script = os.path.join(
+        os.path.dirname(__file__), '..', '..', '..', '..', 'scripts', 'jobs_done.py')
+    return script, dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+
+
+
+def testColdStart():
+    '''
+    Listing commands must not import generators, nor their dependencies.
+    '''
+    script, environ = _GetScriptAndEnviron()
+    imported = subprocess.check_output(
+        [
+            sys.executable,
+            '-c',
+            'import sys\n'
+            'sys.argv = ["jobs_done", "--help"]\n'
+            'execfile(%r, {"__name__" : "jobs_done"})\n'
+            'from jobs_done10.registry import ListCommands\n'
+            'ListCommands()\n'
+            'print " ".join(sorted(m for m in sys.modules if sys.modules[m]))' % script,
+        ],
+        env=environ,
+    ).split()
+    assert [
+        module
+        for module in imported
+        for package in _HEAVY_PACKAGES
+        if module == package or module.startswith(package + '.')
+    ] == []
+
+
+
+def testColdStartTime():
+    '''
+    Listing commands must take at most COLD_START_BUDGET over the time to start Python itself.
+    '''
+    script, environ = _GetScriptAndEnviron()
+
+    def _GetBestTime(args):
+        import time
+
+        times = []
+        for _i in xrange(3):
+            start_time = time.time()
+            subprocess.check_output([sys.executable] + args, env=environ)
+            times.append(time.time() - start_time)
+        return min(times)
+
+    python_time = _GetBestTime(['-c', 'pass'])
+    help_time = _GetBestTime([script, '--help'])
+    assert help_time - python_time < COLD_START_BUDGET
@@ -1,5 +1,5 @@
 from __future__ import unicode_literals
-from jobs_done10.repository import Repository
+from jobs_done10.repository import NormalizeUrl, Repository
 
 
 
@@ -35,3 +35,17 @@ def testNameFromURL():
 
     for url, expected_name in tests:
         assert Repository(url=url).name == expected_name, 'Failed for url "%s"' % url
+
+
+
+def testNormalizeUrl():
+    for url in [
+        'http://server/space.git',
+        'https://server/scm/space.git/',
+        'ssh://git@server:7999/space.git',
+        'git@server:space.git',
+        'HTTP://Server/Space',
+    ]:
+        assert NormalizeUrl(url) == 'server/space', 'Failed for url "%s"' % url
+
+    assert NormalizeUrl('http://server/other/space.git') == 'server/other/space'
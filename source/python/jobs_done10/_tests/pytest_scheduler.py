@@ -0,0 +1,202 @@
+from __future__ import unicode_literals
+from jobs_done10.scheduler import RegenerationScheduler, SchedulerFullError
+import pytest
+import threading
+import time
+
+
+
+def testRegenerationScheduler():
+    started = threading.Event()
+    release = threading.Event()
+    regenerated = []
+
+    def _Regenerate(key):
+        started.set()
+        release.wait()
+        if key == 'fail':
+            raise RuntimeError('Failed')
+        regenerated.append(key)
+
+    errors = []
+    scheduler = RegenerationScheduler(
+        _Regenerate, workers=1, on_error=lambda key, error: errors.append((key, unicode(error))))
+    scheduler.Start()
+    try:
+        assert scheduler.Request('milky_way')
+        started.wait()
+
+        # Requested again while running, and merged while waiting
+        assert scheduler.Request('milky_way')
+        assert not scheduler.Request('milky_way')
+        assert scheduler.Request('fail')
+        assert scheduler.GetStatus() == {
+            'pending' : 2, 'running' : 1, 'processed' : 0, 'failed' : 0, 'merged' : 1}
+
+        release.set()
+        assert scheduler.Join(timeout=5)
+    finally:
+        scheduler.Stop()
+
+    assert regenerated == ['milky_way', 'milky_way']
+    assert errors == [('fail', 'Failed')]
+    assert scheduler.GetStatus()['failed'] == 1
+    assert scheduler.GetStatus()['processed'] == 3
+
+
+
+def testRegenerationSchedulerOnErrorFails():
+    release = threading.Event()
+
+    def _OnError(key, error):
+        raise RuntimeError('Failed handling error')
+
+    def _Regenerate(key):
+        release.wait()
+        if key == 'fail':
+            raise RuntimeError('Failed')
+
+    scheduler = RegenerationScheduler(_Regenerate, workers=2, on_error=_OnError)
+    scheduler.Start()
+    try:
+        scheduler.Request('fail', group='space')
+        scheduler.Request('milky_way', group='space')
+        release.set()
+
+        # The group of the failed regeneration is released, so the next one runs
+        assert scheduler.Join(timeout=5)
+    finally:
+        scheduler.Stop()
+
+    assert scheduler.GetStatus() == {
+        'pending' : 0, 'running' : 0, 'processed' : 2, 'failed' : 1, 'merged' : 0}
+
+
+
+def testRegenerationSchedulerDebounce():
+    regenerated = []
+    done = threading.Event()
+
+    def _Regenerate(key):
+        regenerated.append(key)
+        done.set()
+
+    # Requests in a burst are merged, and wait at most `max_delay` even if `debounce` is longer
+    scheduler = RegenerationScheduler(_Regenerate, debounce=60, max_delay=0.2)
+    assert scheduler.Request('milky_way')
+    for _ in range(4):
+        assert not scheduler.Request('milky_way')
+    assert scheduler.GetStatus()['merged'] == 4
+
+    scheduler.Start()
+    try:
+        assert done.wait(5)
+        assert scheduler.Join(timeout=5)
+    finally:
+        scheduler.Stop()
+
+    assert regenerated == ['milky_way']
+
+
+
+class _StartedRegenerations(object):
+    '''
+    Keys of regenerations started, so tests can wait for them instead of sleeping.
+    '''
+
+    def __init__(self):
+        self.keys = []
+        self._condition = threading.Condition()
+
+
+    def Add(self, key):
+        with self._condition:
+            self.keys.append(key)
+            self._condition.notify_all()
+
+
+    def WaitCount(self, count, timeout=5):
+        end_time = time.time() + timeout
+        with self._condition:
+            while len(self.keys) < count:
+                remaining_time = end_time - time.time()
+                assert remaining_time > 0, 'Only %d regenerations started' % len(self.keys)
+                self._condition.wait(remaining_time)
+
+
+
+def testRegenerationSchedulerConcurrency():
+    started = _StartedRegenerations()
+    release = threading.Event()
+
+    def _Regenerate(key):
+        started.Add(key)
+        release.wait()
+
+    scheduler = RegenerationScheduler(_Regenerate, workers=4, max_per_master=2)
+    scheduler.Start()
+    try:
+        for master in ('jenkins_1', 'jenkins_2'):
+            for branch in ('milky_way', 'andromeda', 'triangulum'):
+                scheduler.Request((master, branch), master=master)
+
+        # Only `max_per_master` run for each master, others wait for them
+        started.WaitCount(4)
+        assert scheduler.GetStatus()['running'] == 4
+        assert scheduler.GetStatus()['pending'] == 2
+        assert sorted(master for master, _branch in started.keys) == [
+            'jenkins_1', 'jenkins_1', 'jenkins_2', 'jenkins_2']
+
+        release.set()
+        assert scheduler.Join(timeout=5)
+    finally:
+        scheduler.Stop()
+
+    assert len(started.keys) == 6
+    assert scheduler.GetStatus()['processed'] == 6
+
+
+
+def testRegenerationSchedulerGroups():
+    started = _StartedRegenerations()
+    release = threading.Event()
+
+    def _Regenerate(key):
+        started.Add(key)
+        release.wait()
+
+    scheduler = RegenerationScheduler(_Regenerate, workers=4, max_per_master=4)
+    scheduler.Start()
+    try:
+        # Different keys in the same group never run at the same time
+        for index in range(4):
+            scheduler.Request(('space-milky_way', index), group='space-milky_way')
+            scheduler.Request(('space-andromeda', index), group='space-andromeda')
+
+        started.WaitCount(2)
+        assert scheduler.GetStatus()['running'] == 2
+        assert scheduler.GetStatus()['pending'] == 6
+        assert sorted(started.keys) == [('space-andromeda', 0), ('space-milky_way', 0)]
+
+        release.set()
+        assert scheduler.Join(timeout=5)
+    finally:
+        scheduler.Stop()
+
+    assert len(started.keys) == 8
+    assert scheduler.GetStatus()['processed'] == 8
+
+
+
+def testRegenerationSchedulerFull():
+    scheduler = RegenerationScheduler(lambda key: None)
+    scheduler.MAX_PENDING = 2
+    assert scheduler.Request('milky_way')
+    assert scheduler.Request('andromeda')
+    assert not scheduler.Request('milky_way')
+    with pytest.raises(SchedulerFullError):
+        scheduler.Request('triangulum')
+
+    # Not started: nothing runs
+    assert not scheduler.IsRunning()
+    assert not scheduler.Join(timeout=0.1)
@@ -0,0 +1,204 @@
+from __future__ import unicode_literals
+from ben10.filesystem import CreateDirectory
+from gitit.git import Git
+from jobs_done10.metrics import REGISTRY
+from jobs_done10.webhook import (IsValidSignature, MirrorIndex, ParsePushPayload, PushEvent,
+    WebhookServer)
+import hashlib
+import hmac
+import json
+import os
+import pytest
+import threading
+
+
+
+def testParsePushPayload():
+    # GitHub
+    payload = {
+        'ref' : 'refs/heads/milky_way',
+        'repository' : {
+            'name' : 'space',
+            'clone_url' : 'https://github.com/universe/space.git',
+            'ssh_url' : 'git@github.com:universe/space.git',
+        },
+    }
+    assert ParsePushPayload({'X-GitHub-Event' : 'push'}, json.dumps(payload)) == [
+        PushEvent(
+            repository_name='space',
+            urls=['https://github.com/universe/space.git', 'git@github.com:universe/space.git'],
+            branch='milky_way',
+        ),
+    ]
+    assert ParsePushPayload({'X-GitHub-Event' : 'ping'}, json.dumps(payload)) == []
+
+    payload['ref'] = 'refs/tags/v1.0'
+    assert ParsePushPayload({'X-GitHub-Event' : 'push'}, json.dumps(payload)) == []
+
+    # Bitbucket Server, both native events and post-receive hook plugin
+    repository = {
+        'slug' : 'space',
+        'links' : {'clone' : [{'href' : 'ssh://git@server:7999/universe/space.git'}]},
+    }
+    expected_events = [
+        PushEvent(
+            repository_name='space',
+            urls=['ssh://git@server:7999/universe/space.git'],
+            branch=branch,
+        )
+        for branch in ('milky_way', 'andromeda')
+    ]
+    payload = {
+        'repository' : repository,
+        'changes' : [
+            {'ref' : {'id' : 'refs/heads/milky_way'}, 'type' : 'UPDATE'},
+            {'ref' : {'id' : 'refs/heads/andromeda'}, 'type' : 'DELETE'},
+            {'ref' : {'id' : 'refs/tags/v1.0'}, 'type' : 'ADD'},
+        ],
+    }
+    assert ParsePushPayload({'X-Event-Key' : 'repo:refs_changed'}, json.dumps(payload)) == \
+        expected_events
+
+    payload = {
+        'repository' : repository,
+        'refChanges' : [
+            {'refId' : 'refs/heads/milky_way', 'type' : 'UPDATE'},
+            {'refId' : 'refs/heads/andromeda', 'type' : 'UPDATE'},
+            {'refId' : 'refs/heads/milky_way', 'type' : 'UPDATE'},
+        ],
+    }
+    assert ParsePushPayload({}, json.dumps(payload)) == expected_events
+
+    # Bitbucket Cloud
+    payload = {
+        'repository' : {
+            'full_name' : 'universe/space',
+            'links' : {'html' : {'href' : 'https://bitbucket.org/universe/space'}},
+        },
+        'push' : {
+            'changes' : [
+                {'new' : {'type' : 'branch', 'name' : 'milky_way'}, 'old' : None},
+                {'new' : None, 'old' : {'type' : 'branch', 'name' : 'andromeda'}},
+                {'new' : {'type' : 'tag', 'name' : 'v1.0'}, 'old' : None},
+            ],
+        },
+    }
+    assert [event.branch for event in ParsePushPayload({}, json.dumps(payload))] == [
+        'milky_way', 'andromeda']
+
+    for body in ['', '[]', '{}', '{"repository": {}}', '{"repository": {}, "changes": 1}']:
+        with pytest.raises(ValueError):
+            ParsePushPayload({}, body)
+
+
+
+def testIsValidSignature():
+    body = b'{"ref": "refs/heads/master"}'
+    signature_256 = 'sha256=' + hmac.new(b'secret', body, hashlib.sha256).hexdigest()
+    signature_1 = 'sha1=' + hmac.new(b'secret', body, hashlib.sha1).hexdigest()
+
+    assert IsValidSignature('secret', {'X-Hub-Signature-256' : signature_256}, body)
+    assert IsValidSignature('secret', {'X-Hub-Signature' : signature_1}, body)
+    assert not IsValidSignature('other', {'X-Hub-Signature-256' : signature_256}, body)
+    assert not IsValidSignature('secret', {'X-Hub-Signature-256' : signature_256}, body + b' ')
+    assert not IsValidSignature('secret', {}, body)
+
+
+
+def testMirrorIndex(embed_data):
+    mirrors_directory = embed_data['mirrors']
+    git = Git()
+    for name, url in [
+        ('space', 'ssh://git@server:7999/universe/space.git'),
+        ('other_space', 'https://github.com/other/space.git'),
+        ('stars', 'https://server/scm/universe/stars.git'),
+        ]:
+        repo_path = os.path.join(mirrors_directory, name)
+        CreateDirectory(repo_path)
+        git.Execute(['init', '--bare'], repo_path)
+        git.AddRemote(repo_path, 'origin', url)
+    CreateDirectory(os.path.join(mirrors_directory, 'not_a_repository'))
+
+    mirror_index = MirrorIndex(mirrors_directory)
+    assert mirror_index.Refresh() == 3
+
+    def _Find(name, urls):
+        mirror_path = mirror_index.Find(PushEvent(repository_name=name, urls=urls, branch='master'))
+        return mirror_path and os.path.basename(mirror_path)
+
+    # Urls using other protocols are recognized
+    assert _Find('stars', []) == 'stars'
+    assert _Find('space', ['https://server/scm/universe/space.git']) == 'space'
+    assert _Find('space', ['git@github.com:other/space.git']) == 'other_space'
+    assert _Find('space', []) is None
+    assert _Find('planets', []) is None
+
+
+
+def testWebhookServer():
+    import urllib2
+
+    class MockMirrorIndex(object):
+        def Find(self, event):
+            if event.repository_name == 'space':
+                return '/mirrors/space'
+
+    queued = []
+    class MockScheduler(object):
+        def IsRunning(self):
+            return True
+        def Request(self, key):
+            if key in queued:
+                return False
+            queued.append(key)
+            return True
+        def GetStatus(self):
+            return {'pending' : len(queued)}
+
+    ready = threading.Event()
+    server = WebhookServer(
+        ('127.0.0.1', 0), MockMirrorIndex(), MockScheduler(), is_ready=ready.is_set)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+
+    def _Request(path, payload=None, headers={}):
+        url = 'http://127.0.0.1:%d%s' % (server.server_address[1], path)
+        body = json.dumps(payload) if payload is not None else None
+        try:
+            response = urllib2.urlopen(urllib2.Request(url, body, headers))
+        except urllib2.HTTPError as response:
+            pass
+        return response.getcode(), json.loads(response.read())
+
+    try:
+        assert _Request('/health') == (200, {'status' : 'ok'})
+        assert _Request('/ready')[0] == 503
+        ready.set()
+        assert _Request('/ready') == (200, {'ready' : True, 'scheduler' : {'pending' : 0}})
+
+        response = urllib2.urlopen('http://127.0.0.1:%d/metrics' % server.server_address[1])
+        assert response.info()['Content-Type'] == REGISTRY.CONTENT_TYPE
+        assert '# TYPE jobs_done_parse_duration_seconds histogram' in response.read()
+
+        def _Push(repository_name):
+            return _Request('/', {
+                'ref' : 'refs/heads/milky_way',
+                'repository' : {'name' : repository_name},
+            }, {'X-GitHub-Event' : 'push'})
+
+        def _Expected(queued=[], merged=[], ignored=[]):
+            return 202, {'queued' : queued, 'merged' : merged, 'ignored' : ignored}
+
+        assert _Push('space') == _Expected(queued=['space:milky_way'])
+        assert _Push('space') == _Expected(merged=['space:milky_way'])
+        assert _Push('stars') == _Expected(ignored=['stars:milky_way'])
+        assert queued == [('/mirrors/space', 'milky_way')]
+
+        assert _Request('/', {'invalid' : 'payload'})[0] == 400
+
+        server.secret = 'secret'
+        assert _Push('space')[0] == 403
+    finally:
+        server.shutdown()
+        server.server_close()
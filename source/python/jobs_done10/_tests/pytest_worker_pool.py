@@ -0,0 +1,149 @@
+from __future__ import unicode_literals
+from jobs_done10 import metrics
+from jobs_done10.jobs_done_job import JobsDoneFileResourceError, UnmatchableConditionError
+from jobs_done10.worker_pool import ResourceLimits, WorkerPool
+import os
+import pytest
+import sys
+import threading
+import time
+
+
+
+# Tasks must be defined at module level, to be pickled by name
+def _Add(a, b):
+    return a + b
+
+def _GetProcessId():
+    return os.getpid()
+
+def _RaiseUnmatchable(option):
+    raise UnmatchableConditionError(option)
+
+def _Sleep(seconds):
+    time.sleep(seconds)
+
+def _Spin():
+    while True:
+        pass
+
+def _Allocate(megabytes):
+    return len(b'x' * (megabytes * 1024 * 1024))
+
+def _Exit():
+    os._exit(3)
+
+def _ObserveParse(duration, fail):
+    metrics.PARSE_DURATION.Observe(duration)
+    if fail:
+        metrics.PARSE_ERRORS.Inc()
+        raise RuntimeError('Failed')
+    return os.getpid()
+
+
+
+def testWorkerPool():
+    worker_pool = WorkerPool(processes=2)
+    try:
+        assert worker_pool.Run(_Add, 1, 2) == 3
+
+        # Errors raised by tasks are raised again, and their worker is reused
+        process_id = worker_pool.Run(_GetProcessId)
+        assert process_id != os.getpid()
+        with pytest.raises(UnmatchableConditionError) as e:
+            worker_pool.Run(_RaiseUnmatchable, 'planet-pluto:junit_patterns')
+        assert e.value.option == 'planet-pluto:junit_patterns'
+        assert worker_pool.Run(_GetProcessId) == process_id
+
+        # Workers are replaced after MAX_TASKS_PER_WORKER tasks
+        worker_pool.MAX_TASKS_PER_WORKER = 1
+        assert worker_pool.Run(_GetProcessId) != worker_pool.Run(_GetProcessId)
+    finally:
+        worker_pool.Close()
+
+
+
+def testWorkerPoolTimeout():
+    worker_pool = WorkerPool(processes=1, limits=ResourceLimits(timeout=0.5))
+    try:
+        with pytest.raises(JobsDoneFileResourceError) as e:
+            worker_pool.Run(_Sleep, 10)
+        assert e.value.limit == 'timeout'
+        assert 'took longer than 0.5s' in unicode(e.value)
+
+        # A new worker replaces the one terminated
+        assert worker_pool.Run(_Add, 1, 2) == 3
+    finally:
+        worker_pool.Close()
+
+
+
+def testWorkerPoolExit():
+    worker_pool = WorkerPool(processes=1)
+    try:
+        with pytest.raises(JobsDoneFileResourceError) as e:
+            worker_pool.Run(_Exit)
+        assert e.value.limit is None
+        assert 'exit code 3' in unicode(e.value)
+        assert worker_pool.Run(_Add, 1, 2) == 3
+    finally:
+        worker_pool.Close()
+
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='rlimits are not available on Windows')
+def testWorkerPoolResourceLimits():
+    worker_pool = WorkerPool(
+        processes=2, limits=ResourceLimits(cpu_time=1, memory=64, timeout=30))
+    try:
+        assert worker_pool.Run(_Allocate, 16) == 16 * 1024 * 1024
+        with pytest.raises(JobsDoneFileResourceError) as e:
+            worker_pool.Run(_Allocate, 256)
+        assert e.value.limit == 'memory'
+
+        # Other tasks keep running while a task spins out of its CPU time
+        errors = []
+        def _RunSpin():
+            try:
+                worker_pool.Run(_Spin)
+            except JobsDoneFileResourceError as e:
+                errors.append(e.limit)
+        spin_thread = threading.Thread(target=_RunSpin)
+        spin_thread.start()
+        assert worker_pool.Run(_Add, 1, 2) == 3
+        spin_thread.join()
+        assert errors == ['cpu_time']
+    finally:
+        worker_pool.Close()
+
+
+
+def testWorkerPoolStart():
+    worker_pool = WorkerPool(processes=2)
+    try:
+        # All workers are started before running tasks
+        worker_pool.Start()
+        process_ids = set(worker.process.pid for worker in worker_pool._idle_workers)
+        assert len(process_ids) == 2
+        assert worker_pool.Run(_GetProcessId) in process_ids
+    finally:
+        worker_pool.Close()
+
+
+
+def testWorkerPoolMetrics():
+    metrics.REGISTRY.Reset()
+
+    worker_pool = WorkerPool(processes=1)
+    try:
+        # Metrics updated by tasks (even tasks that fail) are added to metrics of this process
+        assert worker_pool.Run(_ObserveParse, 0.25, False) != os.getpid()
+        with pytest.raises(RuntimeError):
+            worker_pool.Run(_ObserveParse, 0.5, True)
+        assert worker_pool.Run(_ObserveParse, 0.125, False) != os.getpid()
+    finally:
+        worker_pool.Close()
+
+    assert metrics.PARSE_DURATION.GetCount() == 3
+    assert metrics.PARSE_DURATION.GetSum() == 0.875
+    assert metrics.PARSE_ERRORS.GetValue() == 1
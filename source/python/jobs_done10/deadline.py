@@ -0,0 +1,148 @@
+from __future__ import unicode_literals
+
+
+
+# Exit code used by command line commands when their deadline is exceeded, so callers can tell
+# partial runs apart from failures and retry them.
+DEADLINE_EXCEEDED_EXIT_CODE = 3
+
+
+
+#===================================================================================================
+# Deadline
+#===================================================================================================
+class Deadline(object):
+    '''
+    Time budget shared by all operations in a run.
+
+    Operations are executed through `Run`, which refuses to start them once the budget is over.
+    This keeps track of which operations finished, and which are still pending (and were skipped
+    if the deadline is exceeded). Operations may be run from many threads.
+
+    :ivar float|None expiration_time:
+        Time (as in `time.time`) when this deadline expires. None means it never expires.
+
+    :ivar list(unicode) finished_operations:
+        Operations finished, in the order they were executed.
+
+    :ivar list(unicode) pending_operations:
+        Operations known to be executed later, in the order they were added.
+    '''
+
+    def __init__(self, seconds=None):
+        '''
+        :param float|None seconds:
+            Time budget, in seconds. If None, this deadline never expires.
+        '''
+        import threading
+        import time
+
+        if seconds is None:
+            self.expiration_time = None
+        else:
+            self.expiration_time = time.time() + seconds
+
+        self.finished_operations = []
+        self.pending_operations = []
+
+        # Protects lists of operations
+        self._lock = threading.Lock()
+
+
+    def GetRemainingTime(self):
+        '''
+        :return float|None:
+            Seconds left before this deadline expires (never negative), or None if it never
+            expires.
+        '''
+        import time
+
+        if self.expiration_time is None:
+            return None
+        return max(0.0, self.expiration_time - time.time())
+
+
+    def IsExpired(self):
+        '''
+        :return bool:
+            True if this deadline is over.
+        '''
+        return self.GetRemainingTime() == 0.0
+
+
+    def AddOperations(self, operations):
+        '''
+        Registers operations that will be executed later, so they can be reported as skipped if the
+        deadline is exceeded before they run.
+
+        :param list(unicode) operations:
+            Operations descriptions.
+        '''
+        with self._lock:
+            for operation in operations:
+                if operation not in self.pending_operations:
+                    self.pending_operations.append(operation)
+
+
+    def CreateExceededError(self):
+        '''
+        :return DeadlineExceededError:
+            Error reporting operations finished so far, and all pending operations as skipped.
+        '''
+        with self._lock:
+            return DeadlineExceededError(self.finished_operations, self.pending_operations)
+
+
+    def Run(self, operation, func, *args, **kwargs):
+        '''
+        Executes an operation if this deadline is not over yet.
+
+        :param unicode operation:
+            Operation description.
+
+        :param callable func:
+            Function executed, receiving `args` and `kwargs`.
+
+        :return object:
+            Whatever `func` returns.
+
+        :raises DeadlineExceededError:
+            If the deadline is over. `operation` and all other pending operations are reported as
+            skipped.
+        '''
+        self.AddOperations([operation])
+
+        if self.IsExpired():
+            raise self.CreateExceededError()
+
+        result = func(*args, **kwargs)
+
+        with self._lock:
+            self.pending_operations.remove(operation)
+            self.finished_operations.append(operation)
+        return result
+
+
+
+#===================================================================================================
+# DeadlineExceededError
+#===================================================================================================
+class DeadlineExceededError(RuntimeError):
+    '''
+    Raised when trying to execute an operation after a `Deadline` is over.
+
+    :ivar list(unicode) finished_operations:
+        Operations finished before the deadline.
+
+    :ivar list(unicode) skipped_operations:
+        Operations that were not executed.
+    '''
+    def __init__(self, finished_operations, skipped_operations):
+        self.finished_operations = list(finished_operations)
+        self.skipped_operations = list(skipped_operations)
+
+        RuntimeError.__init__(
+            self,
+            'Deadline exceeded: %d operations finished, %d skipped.' % \
+            (len(self.finished_operations), len(self.skipped_operations))
+        )
@@ -2,8 +2,12 @@ from __future__ import unicode_literals
 from ben10.filesystem import CreateDirectory, CreateFile, GetFileContents, ListFiles
 from ben10.foundation.string import Dedent
 from gitit.git import Git
-from jobs_done10.generators.jenkins import (GetJobsFromDirectory, GetJobsFromFile, JenkinsJob,
-    JenkinsJobPublisher, JenkinsXmlJobGenerator, UploadJobsFromFile)
+from jobs_done10.generators.jenkins import (GENERATOR_VERSION, DeleteOrphanJobs,
+    DisableInactiveJobs, GetJobsFromDirectory, GetJobsFromFile, IsPublishUpToDate,
+    IterJobsFromAllBranches, JenkinsBranchJobsCache, JenkinsJob, JenkinsJobPublisher, JenkinsShard,
+    JenkinsXmlJobGenerator, OrphanJobsSafetyError, UploadJobsFromAllBranches, UploadJobsFromFile,
+    WriteJobsToArchive, WriteJobsToJsonLines, WritePublishRecord)
+from jobs_done10.git_repository import GetBlobSha
 from jobs_done10.job_generator import JobGeneratorConfigurator
 from jobs_done10.jobs_done_job import JOBS_DONE_FILENAME, JobsDoneJob
 from jobs_done10.repository import Repository
@@ -42,6 +46,7 @@ class TestJenkinsXmlJobGenerator(object):
           <blockBuildWhenUpstreamBuilding>false</blockBuildWhenUpstreamBuilding>
           <concurrentBuild>false</concurrentBuild>
           <canRoam>false</canRoam>
+          <disabled>false</disabled>
           <scm class="hudson.plugins.git.GitSCM">
             <configVersion>2</configVersion>
             <relativeTargetDir>fake</relativeTargetDir>
@@ -1508,6 +1513,133 @@ class TestJenkinsActions(object):
         jobs = GetJobsFromFile(self._REPOSITORY, self._JOBS_DONE_FILE_CONTENTS)
         assert len(jobs) == 3
 
+        # Jobs store the jobs_done file they were created from (not in their xml, which only
+        # changes when jobs change)
+        for job in jobs:
+            assert job.jobs_done_file_sha == GetBlobSha(self._JOBS_DONE_FILE_CONTENTS)
+            assert "<description>&lt;!-- Managed by Job's Done --&gt;</description>" in job.xml
+
+
+    def testIsPublishUpToDate(self, monkeypatch):
+        from jobs_done10.git_repository import GetBlobSha
+
+        repository = Repository(url='http://server/space.git', branch='milky_way')
+        jobs_done_file_sha = GetBlobSha(self._JOBS_DONE_FILE_CONTENTS)
+
+        # Maps job names to (metadata, disabled)
+        published_jobs = {}
+        def MockJobConfig(self, job_name):
+            metadata, disabled = published_jobs[job_name]
+            description = ''
+            if metadata is not None:
+                description = \
+                    '<description>&lt;!-- Managed by Job&apos;s Done (jobs_done_file: %s, generator: %s) --&gt;</description>' % \
+                    metadata
+            return Dedent(
+                '''
+                <project>
+                  %s
+                  <disabled>%s</disabled>
+                  <scm>
+                    <userRemoteConfigs>
+                      <hudson.plugins.git.UserRemoteConfig>
+                        <url>http://server/space.git</url>
+                      </hudson.plugins.git.UserRemoteConfig>
+                    </userRemoteConfigs>
+                    <branches>
+                      <hudson.plugins.git.BranchSpec>
+                        <name>milky_way</name>
+                      </hudson.plugins.git.BranchSpec>
+                    </branches>
+                  </scm>
+                </project>
+                ''' % (description, 'true' if disabled else 'false')
+            )
+
+        class MockJenkins(object):
+            def __init__(self, url, username, password):
+                pass
+            @property
+            def jobnames(self):
+                return sorted(published_jobs)
+            job_config = MockJobConfig
+
+        monkeypatch.setattr(jenkins, 'Jenkins', MockJenkins)
+
+        def _IsPublishUpToDate(contents):
+            return IsPublishUpToDate(repository, contents, 'jenkins_url')
+
+        def _Publish(job_names, metadata, disabled=False):
+            for job_name in job_names:
+                published_jobs['space-milky_way-' + job_name] = (metadata, disabled)
+
+        # No jobs yet
+        assert not _IsPublishUpToDate(self._JOBS_DONE_FILE_CONTENTS)
+        assert _IsPublishUpToDate(None)
+
+        # Jobs created before metadata was stored
+        _Publish(['mercury', 'venus', 'jupiter'], None)
+        assert not _IsPublishUpToDate(self._JOBS_DONE_FILE_CONTENTS)
+
+        _Publish(['mercury', 'venus', 'jupiter'], (jobs_done_file_sha, GENERATOR_VERSION))
+        assert _IsPublishUpToDate(self._JOBS_DONE_FILE_CONTENTS)
+        assert not _IsPublishUpToDate(self._JOBS_DONE_FILE_CONTENTS + '\ntimeout: 10')
+        assert not _IsPublishUpToDate(None)
+
+        # Publish cut by a deadline: all jobs must have been published from the file
+        _Publish(['jupiter'], (GetBlobSha('old'), GENERATOR_VERSION))
+        assert not _IsPublishUpToDate(self._JOBS_DONE_FILE_CONTENTS)
+        _Publish(['jupiter'], (jobs_done_file_sha, GENERATOR_VERSION))
+
+        # ... and exactly the jobs expected must exist
+        del published_jobs['space-milky_way-jupiter']
+        assert not _IsPublishUpToDate(self._JOBS_DONE_FILE_CONTENTS)
+        _Publish(['jupiter', 'mars'], (jobs_done_file_sha, GENERATOR_VERSION))
+        assert not _IsPublishUpToDate(self._JOBS_DONE_FILE_CONTENTS)
+        del published_jobs['space-milky_way-mars']
+        assert _IsPublishUpToDate(self._JOBS_DONE_FILE_CONTENTS)
+
+        # Disabled by DisableInactiveJobs
+        _Publish(['venus'], (jobs_done_file_sha, GENERATOR_VERSION), disabled=True)
+        assert not _IsPublishUpToDate(self._JOBS_DONE_FILE_CONTENTS)
+        _Publish(['venus'], (jobs_done_file_sha, GENERATOR_VERSION))
+
+        # Generator changed
+        _Publish(['mercury', 'venus', 'jupiter'], (jobs_done_file_sha, GENERATOR_VERSION + '0'))
+        assert not _IsPublishUpToDate(self._JOBS_DONE_FILE_CONTENTS)
+
+        # Requests are recorded in the request log
+        from jobs_done10.generators.jenkins import JenkinsRequestLog
+        request_log = JenkinsRequestLog()
+        IsPublishUpToDate(
+            repository, self._JOBS_DONE_FILE_CONTENTS, 'jenkins_url', request_log=request_log)
+        assert sorted((e['kind'], e['job']) for e in request_log.entries) == [
+            ('config', 'space-milky_way-jupiter'),
+            ('config', 'space-milky_way-mercury'),
+            ('config', 'space-milky_way-venus'),
+            ('list', None),
+        ]
+
+
+    def testIsPublishUpToDateRecord(self, embed_data):
+        record_filename = embed_data['record.json']
+        repository = Repository(url='http://server/space.git', branch='milky_way')
+        other_repository = Repository(url='http://server/space.git', branch='andromeda')
+
+        assert not IsPublishUpToDate(
+            repository, self._JOBS_DONE_FILE_CONTENTS, record_filename=record_filename)
+
+        WritePublishRecord(repository, self._JOBS_DONE_FILE_CONTENTS, record_filename)
+        WritePublishRecord(other_repository, None, record_filename)
+
+        assert IsPublishUpToDate(
+            repository, self._JOBS_DONE_FILE_CONTENTS, record_filename=record_filename)
+        assert not IsPublishUpToDate(
+            repository, self._JOBS_DONE_FILE_CONTENTS + '\ntimeout: 10', record_filename=record_filename)
+        assert IsPublishUpToDate(other_repository, None, record_filename=record_filename)
+        assert not IsPublishUpToDate(
+            other_repository, self._JOBS_DONE_FILE_CONTENTS, record_filename=record_filename)
+
 
     def testGetJobsFromDirectory(self, embed_data):
         repo_path = embed_data['git_repository']
@@ -1535,6 +1667,142 @@ class TestJenkinsActions(object):
         assert len(jobs) == 3
 
 
+    def testGetJobsFromDirectoryRef(self, embed_data):
+        from jobs_done10.git_repository import GitObjectReader
+
+        repo_path = embed_data['git_repository']
+        CreateDirectory(repo_path)
+
+        git = Git()
+        git.Execute(['init'], repo_path)
+        git.AddRemote(repo_path, 'origin', self._REPOSITORY.url)
+        CreateFile(os.path.join(repo_path, '.gitignore'), '')
+        git.Add(repo_path, '.')
+        git.Commit(repo_path, 'First commit')
+        git.Execute(['branch', '-M', 'master'], repo_path)
+
+        # Jobs_done file only exists in a branch that is not checked out
+        git.Execute(['checkout', '-b', 'milky_way'], repo_path)
+        CreateFile(os.path.join(repo_path, JOBS_DONE_FILENAME), self._JOBS_DONE_FILE_CONTENTS)
+        git.Add(repo_path, '.')
+        git.Commit(repo_path, 'Added jobs_done file')
+        git.Execute(['checkout', 'master'], repo_path)
+
+        with GitObjectReader(repo_path) as object_reader:
+            repository, jobs = GetJobsFromDirectory(repo_path, 'milky_way', object_reader)
+            assert repository == Repository(url=self._REPOSITORY.url, branch='milky_way')
+            assert len(jobs) == 3
+
+            repository, jobs = GetJobsFromDirectory(repo_path, 'refs/heads/master', object_reader)
+            assert repository == Repository(url=self._REPOSITORY.url, branch='master')
+            assert len(jobs) == 0
+
+            with pytest.raises(ValueError):
+                GetJobsFromDirectory(repo_path, 'unknown', object_reader)
+
+        # Working tree was not touched
+        assert not os.path.exists(os.path.join(repo_path, JOBS_DONE_FILENAME))
+
+
+    def testIterJobsFromAllBranches(self, embed_data, monkeypatch):
+        repo_path = self._CreateRepositoryWithBranches(
+            embed_data, ['milky_way', 'andromeda'], 'http://space.git')
+
+        parsed_contents = []
+        original_parse_yaml = JobsDoneJob.ParseYAML.im_func
+        def ParseYAML(cls, yaml_contents):
+            parsed_contents.append(yaml_contents)
+            return original_parse_yaml(cls, yaml_contents)
+        monkeypatch.setattr(JobsDoneJob, 'ParseYAML', classmethod(ParseYAML))
+
+        branch_jobs = [
+            (repository.branch, sorted(job.name for job in jobs))
+            for repository, jobs in IterJobsFromAllBranches(repo_path)
+        ]
+        assert branch_jobs == [
+            ('andromeda', ['space-andromeda-jupiter', 'space-andromeda-mercury', 'space-andromeda-venus']),
+            ('master', []),
+            ('milky_way', ['space-milky_way-jupiter', 'space-milky_way-mercury', 'space-milky_way-venus']),
+        ]
+
+        # Branches sharing the same jobs_done file parse it only once
+        assert parsed_contents == [self._JOBS_DONE_FILE_CONTENTS, None]
+
+
+    @pytest.mark.parametrize(('contents', 'cached'), [
+        (_JOBS_DONE_FILE_CONTENTS, True),
+        (
+            Dedent(
+                '''
+                display_name: "{branch} - {planet}"
+                build_shell_commands:
+                - "echo {branch} > branch.txt"
+                branch_patterns:
+                - "milky.*"
+                - "feature/.*"
+                matrix:
+                    planet:
+                    - mercury
+                    - venus
+                '''
+            ),
+            True,
+        ),
+        (
+            Dedent(
+                '''
+                branch-milky_way:build_shell_commands:
+                - "echo milky_way"
+                '''
+            ),
+            False,
+        ),
+        (
+            Dedent(
+                '''
+                branch-milky_way:display_name: "milky_way"
+                planet-mercury:build_shell_commands:
+                - "echo mercury"
+                planet-venus:build_shell_commands:
+                - "echo venus"
+                matrix:
+                  planet:
+                  - mercury
+                  - venus
+                '''
+            ),
+            False,
+        ),
+        (
+            Dedent(
+                '''
+                branch_patterns:
+                - "{branch}"
+                '''
+            ),
+            False,
+        ),
+    ])
+    def testJenkinsBranchJobsCache(self, contents, cached):
+        jobs_cache = JenkinsBranchJobsCache()
+        parsed_file = JobsDoneJob.ParseYAML(contents)
+        sha = GetBlobSha(contents)
+
+        for branch in ('milky_way', 'feature/andromeda', 'master', 'a&b'):
+            repository = Repository(url='http://space.git', branch=branch)
+            jobs = jobs_cache.GetJobs(repository, parsed_file, sha)
+            expected_jobs = GetJobsFromFile(repository, contents)
+
+            assert [(job.name, job.repository, job.xml) for job in jobs] == \
+                [(job.name, job.repository, job.xml) for job in expected_jobs]
+
+        # Branches with characters that could change parsing are never cached
+        if cached:
+            assert (jobs_cache.hits, jobs_cache.misses) == (3, 1)
+        else:
+            assert (jobs_cache.hits, jobs_cache.misses) == (0, 4)
+
+
     def testUploadJobsFromFile(self, monkeypatch):
         '''
         Tests that UploadJobsFromFile correctly calls JenkinsJobPublisher (already tested elsewhere)
@@ -1549,7 +1817,13 @@ class TestJenkinsActions(object):
 
             return 'mock publish result'
 
+        prefetched_urls = []
+        def MockPrefetchUrl(self, url, username, password):
+            assert self.jobs == {}
+            prefetched_urls.append(url)
+
         monkeypatch.setattr(JenkinsJobPublisher, 'PublishToUrl', MockPublishToUrl)
+        monkeypatch.setattr(JenkinsJobPublisher, 'PrefetchUrl', MockPrefetchUrl)
 
         result = UploadJobsFromFile(
             repository=self._REPOSITORY,
@@ -1559,6 +1833,120 @@ class TestJenkinsActions(object):
             password='jenkins_pass',
         )
         assert result == 'mock publish result'
+        assert prefetched_urls == ['jenkins_url']
+
+
+    def testJenkinsShard(self):
+        assert JenkinsShard.CreateFromString(' 2/4 ') == JenkinsShard(index=2, count=4)
+        for shard_string in ['0/2', '3/2', '1', 'a/b']:
+            with pytest.raises(ValueError):
+                JenkinsShard.CreateFromString(shard_string)
+
+        # Each job group belongs to exactly one shard
+        shards = [JenkinsShard(index=index, count=4) for index in range(1, 5)]
+        job_groups = ['space-%d' % i for i in range(100)]
+        for job_group in job_groups:
+            assert sum(shard.ContainsJobGroup(job_group) for shard in shards) == 1
+
+        # Shards are stable (don't change between processes or hosts)
+        assert filter(shards[0].ContainsJobGroup, job_groups[:10]) == ['space-1']
+
+        assert JenkinsShard().ContainsRepository(self._REPOSITORY)
+
+
+    def _CreateRepositoryWithBranches(self, embed_data, branches, url):
+        '''
+        :return unicode:
+            Path to a repository where `branches` have the same jobs_done file, and "master" has no
+            jobs_done file. "master" is checked out. All branches are in "origin" too (as if they
+            were fetched).
+        '''
+        repo_path = embed_data['git_repository']
+        CreateDirectory(repo_path)
+
+        git = Git()
+        git.Execute(['init'], repo_path)
+        git.AddRemote(repo_path, 'origin', url)
+        CreateFile(os.path.join(repo_path, '.gitignore'), '')
+        git.Add(repo_path, '.')
+        git.Commit(repo_path, 'First commit')
+        git.Execute(['branch', '-M', 'master'], repo_path)
+
+        git.Execute(['checkout', '-b', branches[0]], repo_path)
+        CreateFile(os.path.join(repo_path, JOBS_DONE_FILENAME), self._JOBS_DONE_FILE_CONTENTS)
+        git.Add(repo_path, '.')
+        git.Commit(repo_path, 'Added jobs_done file')
+        for branch in branches[1:]:
+            git.Execute(['branch', branch], repo_path)
+        git.Execute(['checkout', 'master'], repo_path)
+
+        for branch in ['master'] + branches:
+            git.Execute(['update-ref', 'refs/remotes/origin/' + branch, branch], repo_path)
+
+        return repo_path
+
+
+
+#===================================================================================================
+# TestJobStreams
+#===================================================================================================
+class TestJobStreams(object):
+
+    @pytest.mark.parametrize('archive_format', ['tar', 'tar.gz', 'zip'])
+    def testWriteJobsToArchive(self, embed_data, archive_format):
+        import tarfile
+        import zipfile
+
+        archive_filename = embed_data['jobs.' + archive_format]
+        count = WriteJobsToArchive(self._IterJobs(), archive_filename, archive_format)
+        assert count == 3
+
+        if archive_format == 'zip':
+            archive = zipfile.ZipFile(archive_filename)
+            contents = [(name, archive.read(name)) for name in archive.namelist()]
+        else:
+            archive = tarfile.open(archive_filename)
+            contents = [(info.name, archive.extractfile(info).read()) for info in archive]
+        archive.close()
+
+        # Entries are written in the same order jobs were generated
+        assert contents == [
+            ('space-milky_way-jupiter', 'jupiter'),
+            ('space-milky_way-mercury', 'mercury'),
+            ('space-milky_way-venus', 'venus'),
+        ]
+
+
+    def testWriteJobsToArchiveUnknownFormat(self, embed_data):
+        with pytest.raises(ValueError):
+            WriteJobsToArchive(self._IterJobs(), embed_data['jobs.rar'], 'rar')
+
+
+    def testWriteJobsToJsonLines(self):
+        from StringIO import StringIO
+        import json
+
+        stream = StringIO()
+
+        def _IterJobsCheckingStream():
+            # Each job must be written before the next one is generated
+            for i, job in enumerate(self._IterJobs()):
+                assert len(stream.getvalue().splitlines()) == i
+                yield job
+
+        count = WriteJobsToJsonLines(_IterJobsCheckingStream(), stream)
+        assert count == 3
+        assert [json.loads(line) for line in stream.getvalue().splitlines()] == [
+            {'name' : 'space-milky_way-jupiter', 'xml' : 'jupiter'},
+            {'name' : 'space-milky_way-mercury', 'xml' : 'mercury'},
+            {'name' : 'space-milky_way-venus', 'xml' : 'venus'},
+        ]
+
+
+    def _IterJobs(self):
+        repository = Repository(url='http://server/space.git', branch='milky_way')
+        for name in ['jupiter', 'mercury', 'venus']:
+            yield JenkinsJob(name='space-milky_way-' + name, xml=name, repository=repository)
 
 
 
@@ -1567,6 +1955,72 @@ class TestJenkinsActions(object):
 #===================================================================================================
 class TestJenkinsPublisher(object):
 
+    # config.xml of jobs already existing in Jenkins (test with single, and multiple scms)
+    _JOB_CONFIGS = {
+        'space-milky_way-mercury' : Dedent(
+            '''
+            <project>
+              <scm>
+                <userRemoteConfigs>
+                  <hudson.plugins.git.UserRemoteConfig>
+                    <url>
+                      http://server/space.git
+                    </url>
+                  </hudson.plugins.git.UserRemoteConfig>
+                </userRemoteConfigs>
+                <branches>
+                  <hudson.plugins.git.BranchSpec>
+                    <name>milky_way</name>
+                  </hudson.plugins.git.BranchSpec>
+                </branches>
+              </scm>
+            </project>
+            '''
+        ),
+        'space-milky_way-saturn' : Dedent(
+            '''
+            <project>
+              <scm>
+                <scms>
+                  <!-- One of the SCMs is the one for space -->
+                  <hudson.plugins.git.GitSCM>
+                    <userRemoteConfigs>
+                      <hudson.plugins.git.UserRemoteConfig>
+                        <url>
+                          http://server/space.git
+                        </url>
+                      </hudson.plugins.git.UserRemoteConfig>
+                    </userRemoteConfigs>
+                    <branches>
+                      <hudson.plugins.git.BranchSpec>
+                        <name>milky_way</name>
+                      </hudson.plugins.git.BranchSpec>
+                    </branches>
+                  </hudson.plugins.git.GitSCM>
+
+                  <!-- But a job might have multiple SCMs, we don't care about those -->
+                  <hudson.plugins.git.GitSCM>
+                    <userRemoteConfigs>
+                      <hudson.plugins.git.UserRemoteConfig>
+                        <url>
+                          http://server/space_dependencie.git
+                        </url>
+                      </hudson.plugins.git.UserRemoteConfig>
+                    </userRemoteConfigs>
+                    <branches>
+                      <hudson.plugins.git.BranchSpec>
+                        <name>other_branch</name>
+                      </hudson.plugins.git.BranchSpec>
+                    </branches>
+                  </hudson.plugins.git.GitSCM>
+                </scms>
+              </scm>
+            </project>
+            '''
+        ),
+    }
+
+
     def testPublishToDirectory(self, embed_data):
         self._GetPublisher().PublishToDirectory(embed_data['.'])
 
@@ -1578,6 +2032,165 @@ class TestJenkinsPublisher(object):
         assert GetFileContents(embed_data['space-milky_way-venus']) == 'venus'
 
 
+    def testPublishToDirectoryIncremental(self, embed_data):
+        output_directory = embed_data['output']
+        CreateFile(os.path.join(output_directory, 'space-milky_way-mercury'), 'mercury')
+        CreateFile(os.path.join(output_directory, 'space-milky_way-jupiter'), 'old jupiter')
+        CreateFile(
+            os.path.join(output_directory, 'space-milky_way-saturn'),
+            self._JOB_CONFIGS['space-milky_way-saturn'],
+        )
+
+        # Job from another repository/branch, should not be touched
+        CreateFile(
+            os.path.join(output_directory, 'space-milky_way_2-saturn'),
+            self._JOB_CONFIGS['space-milky_way-saturn'].replace('milky_way', 'milky_way_2'),
+        )
+
+        # Job named after this repository/branch, but without a SCM for this repository: it can't
+        # be attributed to it, and is not touched either
+        CreateFile(
+            os.path.join(output_directory, 'space-milky_way-pluto'),
+            self._JOB_CONFIGS['space-milky_way-saturn'].replace(
+                'http://server/space.git', 'http://server/pluto.git'),
+        )
+
+        # Mark unchanged file with an old modification time, it must not be rewritten
+        mercury_filename = os.path.join(output_directory, 'space-milky_way-mercury')
+        os.utime(mercury_filename, (0, 0))
+
+        new_jobs, updated_jobs, unchanged_jobs, deleted_jobs = \
+            self._GetPublisher().PublishToDirectory(output_directory)
+        assert new_jobs == ['space-milky_way-venus']
+        assert updated_jobs == ['space-milky_way-jupiter']
+        assert unchanged_jobs == ['space-milky_way-mercury']
+        assert deleted_jobs == ['space-milky_way-saturn']
+
+        assert os.path.getmtime(mercury_filename) == 0
+        assert set(os.listdir(output_directory)) == set([
+            'space-milky_way-jupiter',
+            'space-milky_way-mercury',
+            'space-milky_way-pluto',
+            'space-milky_way-venus',
+            'space-milky_way_2-saturn',
+        ])
+        assert GetFileContents(os.path.join(output_directory, 'space-milky_way-jupiter')) == 'jupiter'
+
+        # Publishing again changes nothing
+        new_jobs, updated_jobs, unchanged_jobs, deleted_jobs = \
+            self._GetPublisher().PublishToDirectory(output_directory)
+        assert (new_jobs, updated_jobs, deleted_jobs) == ([], [], [])
+        assert len(unchanged_jobs) == 3
+
+
+    def testPublishToJenkinsHome(self, embed_data, monkeypatch):
+        jenkins_home = embed_data['jenkins_home']
+        for job_name, config in self._JOB_CONFIGS.iteritems():
+            CreateFile(os.path.join(jenkins_home, 'jobs', job_name, 'config.xml'), config)
+            CreateFile(os.path.join(jenkins_home, 'jobs', job_name, 'builds', 'log'), 'log')
+
+        # Job from another repository/branch, should not be touched
+        CreateFile(
+            os.path.join(jenkins_home, 'jobs', 'space-milky_way_2-mercury', 'config.xml'),
+            self._JOB_CONFIGS['space-milky_way-mercury'].replace('milky_way', 'milky_way_2'),
+        )
+
+        reload_calls = []
+        monkeypatch.setattr(
+            JenkinsJobPublisher,
+            '_ReloadJenkins',
+            lambda self, url, username, password: reload_calls.append((url, username, password)),
+        )
+
+        new_jobs, updated_jobs, deleted_jobs = self._GetPublisher().PublishToJenkinsHome(
+            jenkins_home,
+            url='jenkins_url',
+            username='jenkins_user',
+            password='jenkins_pass',
+        )
+        assert new_jobs == ['space-milky_way-jupiter', 'space-milky_way-venus']
+        assert updated_jobs == ['space-milky_way-mercury']
+        assert deleted_jobs == ['space-milky_way-saturn']
+
+        jobs_directory = os.path.join(jenkins_home, 'jobs')
+        assert set(os.listdir(jobs_directory)) == set([
+            'space-milky_way-jupiter',
+            'space-milky_way-mercury',
+            'space-milky_way-venus',
+            'space-milky_way_2-mercury',
+        ])
+        for job_name in ['jupiter', 'mercury', 'venus']:
+            job_directory = os.path.join(jobs_directory, 'space-milky_way-' + job_name)
+            assert GetFileContents(os.path.join(job_directory, 'config.xml')) == job_name
+
+        # Only config.xml is replaced, build history is kept, and no temporary files are left behind
+        assert set(os.listdir(os.path.join(jobs_directory, 'space-milky_way-mercury'))) == \
+            set(['config.xml', 'builds'])
+
+        # A single reload at the end
+        assert reload_calls == [('jenkins_url', 'jenkins_user', 'jenkins_pass')]
+
+        # Publishing unchanged jobs does not rewrite their config.xml, nor reload Jenkins
+        mercury_filename = os.path.join(jobs_directory, 'space-milky_way-mercury', 'config.xml')
+        mercury_config = self._JOB_CONFIGS['space-milky_way-mercury']
+        CreateFile(mercury_filename, mercury_config)
+        os.utime(mercury_filename, (0, 0))
+
+        repository = Repository(url='http://server/space.git', branch='milky_way')
+        publisher = JenkinsJobPublisher(
+            repository,
+            [JenkinsJob(name='space-milky_way-mercury', xml=mercury_config, repository=repository)],
+        )
+        assert publisher.PublishToJenkinsHome(
+            jenkins_home,
+            url='jenkins_url',
+            username='jenkins_user',
+            password='jenkins_pass',
+        ) == [[], [], []]
+        assert os.path.getmtime(mercury_filename) == 0
+        assert len(reload_calls) == 1
+
+
+    def testReloadJenkins(self):
+        import BaseHTTPServer
+        import base64
+        import threading
+
+        requests_received = []
+        class FakeJenkinsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+            def do_POST(self):
+                requests_received.append((self.path, self.headers.getheader('Authorization')))
+                self.send_response(500 if self.path.startswith('/broken/') else 200)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), FakeJenkinsHandler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        try:
+            url = 'http://127.0.0.1:%d/' % server.server_address[1]
+            publisher = self._GetPublisher()
+            publisher._ReloadJenkins(url, 'jenkins_user', 'jenkins_pass')
+            publisher._ReloadJenkins(url, None, None)
+
+            from requests.exceptions import HTTPError
+            with pytest.raises(HTTPError):
+                publisher._ReloadJenkins(url + 'broken/', None, None)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        assert requests_received == [
+            ('/reload', 'Basic ' + base64.b64encode(b'jenkins_user:jenkins_pass')),
+            ('/reload', None),
+            ('/broken/reload', None),
+        ]
+
+
     def testPublishToUrl(self, monkeypatch):
         mock_jenkins = self._MockJenkinsAPI(monkeypatch)
 
@@ -1640,6 +2253,662 @@ class TestJenkinsPublisher(object):
         assert set(deleted_jobs) == mock_jenkins.DELETED_JOBS == set(['space-milky_way-mercury', 'space-milky_way-saturn'])
 
 
+    def testPublishToUrlPrefetched(self, monkeypatch):
+        import threading
+
+        mock_jenkins = self._MockJenkinsAPI(monkeypatch)
+
+        # Listing starts before jobs are known
+        publisher = self._GetPublisher()
+        jobs = publisher.jobs.values()
+        publisher.SetJobs([])
+        publisher.PrefetchUrl(url='jenkins_url', username='jenkins_user', password='jenkins_pass')
+        publisher.SetJobs(jobs)
+
+        new_jobs, updated_jobs, deleted_jobs = publisher.PublishToUrl(
+            url='jenkins_url',
+            username='jenkins_user',
+            password='jenkins_pass',
+        )
+        assert set(new_jobs) == mock_jenkins.NEW_JOBS == set(['space-milky_way-venus', 'space-milky_way-jupiter'])
+        assert set(updated_jobs) == mock_jenkins.UPDATED_JOBS == set(['space-milky_way-mercury'])
+        assert set(deleted_jobs) == mock_jenkins.DELETED_JOBS == set(['space-milky_way-saturn'])
+
+        # Jobs were listed (and configs fetched) only once, outside of main thread
+        assert len(mock_jenkins.LIST_THREADS) == 1
+        assert mock_jenkins.LIST_THREADS[0] is not threading.current_thread()
+        assert sorted(mock_jenkins.CONFIG_REQUESTS) == [
+            'space-milky_way-mercury', 'space-milky_way-saturn']
+
+
+    def testUploadJobsFromAllBranches(self, embed_data, monkeypatch):
+        mock_jenkins = self._MockJenkinsAPI(monkeypatch)
+        repo_path = TestJenkinsActions()._CreateRepositoryWithBranches(
+            embed_data, ['milky_way', 'andromeda'], 'http://server/space.git')
+
+        results = UploadJobsFromAllBranches(
+            repo_path,
+            url='jenkins_url',
+            username='jenkins_user',
+            password='jenkins_pass',
+        )
+        assert results == {
+            'andromeda' : [
+                ['space-andromeda-jupiter', 'space-andromeda-mercury', 'space-andromeda-venus'],
+                [],
+                [],
+            ],
+            'master' : [[], [], []],
+            'milky_way' : [
+                ['space-milky_way-jupiter', 'space-milky_way-venus'],
+                ['space-milky_way-mercury'],
+                ['space-milky_way-saturn'],
+            ],
+        }
+        assert mock_jenkins.DELETED_JOBS == set(['space-milky_way-saturn'])
+
+        # Jobs were listed only once for all branches
+        assert len(mock_jenkins.LIST_THREADS) == 1
+
+        # Only branches in the shard are published (or have jobs deleted)
+        mock_jenkins.DELETED_JOBS.clear()
+        results = UploadJobsFromAllBranches(
+            repo_path,
+            url='jenkins_url',
+            username='jenkins_user',
+            password='jenkins_pass',
+            shard=JenkinsShard(index=1, count=2),
+        )
+        assert sorted(results) == ['andromeda', 'master']
+        assert mock_jenkins.DELETED_JOBS == set()
+
+
+    def testPublishToUrlScriptConsole(self, monkeypatch):
+        job_scms = [
+            {
+                'name' : 'space-milky_way-mercury',
+                'multiple' : False,
+                'scms' : [{'urls' : ['http://server/space.git'], 'branches' : ['milky_way']}],
+            },
+            {
+                'name' : 'space-milky_way-saturn',
+                'multiple' : True,
+                'scms' : [
+                    {'urls' : ['http://server/space.git'], 'branches' : ['milky_way']},
+                    {'urls' : ['http://server/space_dependencie.git'], 'branches' : ['other_branch']},
+                ],
+            },
+        ]
+        with self._FakeScriptConsole(200, job_scms) as (url, requests_received):
+            mock_jenkins = self._MockJenkinsAPI(monkeypatch, url=url)
+
+            new_jobs, updated_jobs, deleted_jobs = self._GetPublisher().PublishToUrl(
+                url=url,
+                username='jenkins_user',
+                password='jenkins_pass',
+                use_script_console=True,
+            )
+
+        # A single request to the script console, filtering jobs by prefix
+        assert len(requests_received) == 1
+        assert requests_received[0]['path'] == '/scriptText'
+        assert "def prefix = 'space-milky_way'" in requests_received[0]['script']
+
+        # No config.xml was read
+        assert mock_jenkins.CONFIG_REQUESTS == []
+
+        assert set(new_jobs) == mock_jenkins.NEW_JOBS == set(['space-milky_way-venus', 'space-milky_way-jupiter'])
+        assert set(updated_jobs) == mock_jenkins.UPDATED_JOBS == set(['space-milky_way-mercury'])
+        assert set(deleted_jobs) == mock_jenkins.DELETED_JOBS == set(['space-milky_way-saturn'])
+
+
+    def testPublishToUrlScriptConsoleDenied(self, monkeypatch):
+        with self._FakeScriptConsole(403, None) as (url, requests_received):
+            mock_jenkins = self._MockJenkinsAPI(monkeypatch, url=url)
+
+            new_jobs, updated_jobs, deleted_jobs = self._GetPublisher().PublishToUrl(
+                url=url,
+                username='jenkins_user',
+                password='jenkins_pass',
+                use_script_console=True,
+            )
+
+        assert len(requests_received) == 1
+
+        # Falls back to reading each config.xml
+        assert set(mock_jenkins.CONFIG_REQUESTS) == set(['space-milky_way-mercury', 'space-milky_way-saturn'])
+
+        assert set(new_jobs) == mock_jenkins.NEW_JOBS == set(['space-milky_way-venus', 'space-milky_way-jupiter'])
+        assert set(updated_jobs) == mock_jenkins.UPDATED_JOBS == set(['space-milky_way-mercury'])
+        assert set(deleted_jobs) == mock_jenkins.DELETED_JOBS == set(['space-milky_way-saturn'])
+
+
+    def testPlanUrl(self, monkeypatch):
+        mock_jenkins = self._MockJenkinsAPI(monkeypatch)
+
+        repository = Repository(url='http://server/space.git', branch='milky_way')
+        unchanged_xml = self._JOB_CONFIGS['space-milky_way-mercury']
+        updated_xml = self._JOB_CONFIGS['space-milky_way-saturn'].replace(
+            'other_branch', 'another_branch')
+        jobs = [
+            JenkinsJob(name='space-milky_way-jupiter', xml='jupiter', repository=repository),
+            # Only whitespace and the XML declaration changed
+            JenkinsJob(
+                name='space-milky_way-mercury',
+                xml='<?xml version="1.0" ?>\n' + unchanged_xml.replace('  ', '    '),
+                repository=repository,
+            ),
+            JenkinsJob(name='space-milky_way-saturn', xml=updated_xml, repository=repository),
+        ]
+        publisher = JenkinsJobPublisher(repository, jobs)
+        publisher.jobs.pop('space-milky_way-saturn')
+
+        plan = publisher.PlanUrl(
+            url='jenkins_url',
+            username='jenkins_user',
+            password='jenkins_pass',
+        )
+        assert plan.new == ['space-milky_way-jupiter']
+        assert plan.updated == []
+        assert plan.unchanged == ['space-milky_way-mercury']
+        assert plan.deleted == ['space-milky_way-saturn']
+        assert plan.diffs == {}
+
+        # Configs read while listing jobs are not read again
+        assert sorted(mock_jenkins.CONFIG_REQUESTS) == [
+            'space-milky_way-mercury', 'space-milky_way-saturn']
+
+        publisher = JenkinsJobPublisher(repository, jobs)
+        plan = publisher.PlanUrl(
+            url='jenkins_url',
+            username='jenkins_user',
+            password='jenkins_pass',
+        )
+        assert plan.new == ['space-milky_way-jupiter']
+        assert plan.updated == ['space-milky_way-saturn']
+        assert plan.unchanged == ['space-milky_way-mercury']
+        assert plan.deleted == []
+        assert plan.diffs == {
+            'space-milky_way-saturn' : Dedent(
+                '''
+                @@ -30 +30 @@
+                -<name>other_branch</name>
+                +<name>another_branch</name>
+                ''',
+                ignore_last_linebreak=True
+            )
+        }
+
+        # Nothing is written
+        assert mock_jenkins.NEW_JOBS == mock_jenkins.UPDATED_JOBS == mock_jenkins.DELETED_JOBS == set()
+
+
+    def testJobsDoneMetadata(self, monkeypatch):
+        '''
+        Jobs_done file metadata is only stored in jobs published to Jenkins, and ignored when
+        comparing jobs: changes in the jobs_done file that don't change a job don't change it.
+        '''
+        mock_jenkins = self._MockJenkinsAPI(monkeypatch)
+        published_configs = {}
+        def PublishJob(self, job_name, xml):
+            published_configs[job_name] = xml
+        def ReadJobConfig(self, job_name):
+            return published_configs.get(job_name, TestJenkinsPublisher._JOB_CONFIGS[job_name])
+        monkeypatch.setattr(mock_jenkins, 'job_create', PublishJob)
+        monkeypatch.setattr(mock_jenkins, 'job_reconfigure', PublishJob)
+        monkeypatch.setattr(mock_jenkins, 'job_config', ReadJobConfig)
+
+        repository = Repository(url='http://server/space.git', branch='milky_way')
+        jobs_done_file_contents = TestJenkinsActions._JOBS_DONE_FILE_CONTENTS
+        jobs = GetJobsFromFile(repository, jobs_done_file_contents)
+        JenkinsJobPublisher(repository, jobs).PublishToUrl(
+            url='jenkins_url', username='jenkins_user', password='jenkins_pass')
+
+        expected_description = \
+            "<description>&lt;!-- Managed by Job's Done (jobs_done_file: %s, generator: %s) " \
+            "--&gt;</description>" % (GetBlobSha(jobs_done_file_contents), GENERATOR_VERSION)
+        assert sorted(published_configs) == [
+            'space-milky_way-jupiter', 'space-milky_way-mercury', 'space-milky_way-venus']
+        for config in published_configs.itervalues():
+            assert expected_description in config
+
+        # Changing the jobs_done file without changing jobs
+        changed_jobs = GetJobsFromFile(repository, jobs_done_file_contents + '# Comment\n')
+        assert [job.xml for job in changed_jobs] == [job.xml for job in jobs]
+
+        plan = JenkinsJobPublisher(repository, changed_jobs).PlanUrl(
+            url='jenkins_url', username='jenkins_user', password='jenkins_pass')
+        assert plan.updated == []
+        assert plan.unchanged == ['space-milky_way-mercury']
+
+
+    def testPublishToUrlEvents(self, monkeypatch):
+        from jobs_done10.generators.jenkins import JenkinsPublishEvent
+
+        mock_jenkins = self._MockJenkinsAPI(monkeypatch)
+
+        events = []
+        def OnOperation(event):
+            # Events are emitted as soon as each operation finishes
+            assert len(mock_jenkins.NEW_JOBS) + len(mock_jenkins.UPDATED_JOBS) + \
+                len(mock_jenkins.DELETED_JOBS) == event.index
+            events.append(event)
+
+        self._GetPublisher().PublishToUrl(
+            url='jenkins_url',
+            username='jenkins_user',
+            password='jenkins_pass',
+            on_operation=OnOperation,
+        )
+
+        assert [(e.action, e.job_name, e.index, e.total) for e in events] == [
+            (JenkinsPublishEvent.NEW, 'space-milky_way-jupiter', 1, 4),
+            (JenkinsPublishEvent.NEW, 'space-milky_way-venus', 2, 4),
+            (JenkinsPublishEvent.UPDATED, 'space-milky_way-mercury', 3, 4),
+            (JenkinsPublishEvent.DELETED, 'space-milky_way-saturn', 4, 4),
+        ]
+        assert all(e.latency >= 0 for e in events)
+
+
+    def testPublishToUrlRequestLog(self, monkeypatch):
+        from StringIO import StringIO
+        from jobs_done10.generators.jenkins import JenkinsRequestLog
+        import json
+
+        monkeypatch.setattr(JenkinsJobPublisher, 'RETRY_SLEEP', 0)
+        self._MockJenkinsAPI(monkeypatch, proxy_errors=1)
+
+        stream = StringIO()
+        request_log = JenkinsRequestLog(stream)
+        publisher = self._GetPublisher()
+        publisher.request_log = request_log
+        publisher.PublishToUrl(
+            url='jenkins_url',
+            username='jenkins_user',
+            password='jenkins_pass',
+        )
+
+        obtained = [
+            (e['method'], e['kind'], e['job'], e['status'], e['retries'])
+            for e in request_log.entries
+        ]
+        assert sorted(obtained) == sorted([
+            ('GET', 'list', None, 200, 0),
+            ('GET', 'config', 'space-milky_way-mercury', 200, 0),
+            ('GET', 'config', 'space-milky_way-saturn', 200, 0),
+            ('POST', 'create', 'space-milky_way-jupiter', 200, 0),
+            ('POST', 'create', 'space-milky_way-venus', 200, 0),
+            ('POST', 'reconfigure', 'space-milky_way-mercury', 200, 0),
+            ('POST', 'delete', 'space-milky_way-saturn', 200, 1),
+        ])
+
+        # Sizes: job XML sent, config.xml received
+        entries = dict(((e['kind'], e['job']), e) for e in request_log.entries)
+        assert entries[('create', 'space-milky_way-jupiter')]['bytes'] == len('jupiter')
+        assert entries[('config', 'space-milky_way-mercury')]['bytes'] == \
+            len(self._JOB_CONFIGS['space-milky_way-mercury'])
+
+        summary = request_log.GetSummary()
+        assert summary['kinds']['create']['count'] == 2
+        assert summary['kinds']['delete']['count'] == 1
+        assert set(summary['kinds']['config']) == set(['count', 'p50', 'p90', 'p99', 'max'])
+        assert len(summary['slowest']) == 7
+        assert summary['retry_sleep'] >= 0
+
+        # Written as JSON lines, summary at the end
+        request_log.WriteSummary()
+        lines = [json.loads(line) for line in stream.getvalue().splitlines()]
+        assert lines[:-1] == request_log.entries
+        assert lines[-1].keys() == ['summary']
+        assert len(request_log.FormatSummary()) == len(summary['kinds']) + 1 + 7 + 2
+
+
+    def testPublishToUrlDeadline(self, monkeypatch):
+        from jobs_done10.deadline import Deadline, DeadlineExceededError
+
+        mock_jenkins = self._MockJenkinsAPI(monkeypatch)
+
+        # Deadline expires right after the first job is created
+        deadline = Deadline(60)
+        def ExpiringJobCreate(self, name, xml):
+            self.NEW_JOBS.add(name)
+            deadline.expiration_time = 0
+        monkeypatch.setattr(mock_jenkins, 'job_create', ExpiringJobCreate)
+
+        with pytest.raises(DeadlineExceededError) as e:
+            self._GetPublisher().PublishToUrl(
+                url='jenkins_url',
+                username='jenkins_user',
+                password='jenkins_pass',
+                deadline=deadline,
+            )
+
+        assert e.value.finished_operations == [
+            'list jenkins jobs',
+            'create space-milky_way-jupiter',
+        ]
+        assert e.value.skipped_operations == [
+            'create space-milky_way-venus',
+            'update space-milky_way-mercury',
+            'delete space-milky_way-saturn',
+        ]
+        assert mock_jenkins.NEW_JOBS == set(['space-milky_way-jupiter'])
+        assert mock_jenkins.UPDATED_JOBS == set()
+        assert mock_jenkins.DELETED_JOBS == set()
+
+
+    def testPublishToUrlDeadlineSlowChange(self, monkeypatch):
+        '''
+        Changes in Jenkins are waited for even after the deadline is over, so they are reported
+        as finished (and not skipped while they could still happen in background).
+        '''
+        from jobs_done10.deadline import Deadline, DeadlineExceededError
+        import time
+
+        mock_jenkins = self._MockJenkinsAPI(monkeypatch)
+
+        deadline = Deadline(60)
+        def SlowJobCreate(self, name, xml):
+            deadline.expiration_time = time.time() + 0.1
+            time.sleep(0.3)
+            self.NEW_JOBS.add(name)
+        monkeypatch.setattr(mock_jenkins, 'job_create', SlowJobCreate)
+
+        with pytest.raises(DeadlineExceededError) as e:
+            self._GetPublisher().PublishToUrl(
+                url='jenkins_url',
+                username='jenkins_user',
+                password='jenkins_pass',
+                deadline=deadline,
+            )
+
+        assert e.value.finished_operations == [
+            'list jenkins jobs',
+            'create space-milky_way-jupiter',
+        ]
+        assert mock_jenkins.NEW_JOBS == set(['space-milky_way-jupiter'])
+        assert 'create space-milky_way-venus' in e.value.skipped_operations
+
+
+    def testPublishToUrlDeadlineAlreadyExpired(self, monkeypatch):
+        from jobs_done10.deadline import Deadline, DeadlineExceededError
+
+        mock_jenkins = self._MockJenkinsAPI(monkeypatch)
+
+        with pytest.raises(DeadlineExceededError) as e:
+            self._GetPublisher().PublishToUrl(
+                url='jenkins_url',
+                username='jenkins_user',
+                password='jenkins_pass',
+                deadline=Deadline(0),
+            )
+
+        assert e.value.finished_operations == []
+        assert e.value.skipped_operations == ['list jenkins jobs']
+        assert mock_jenkins.CONFIG_REQUESTS == []
+
+
+    @pytest.mark.parametrize('blocked_request', ['list', 'config'])
+    @pytest.mark.parametrize('prefetch', [False, True])
+    def testPublishToUrlDeadlineBlockedRequest(self, monkeypatch, blocked_request, prefetch):
+        '''
+        Requests to Jenkins have no timeout: the publisher stops waiting for them when the deadline
+        is over.
+        '''
+        from jobs_done10.deadline import Deadline, DeadlineExceededError
+        import threading
+        import time
+
+        mock_jenkins = self._MockJenkinsAPI(monkeypatch)
+        release = threading.Event()
+
+        if blocked_request == 'list':
+            def BlockedJobNames(self):
+                release.wait()
+                return ['space-milky_way-mercury', 'space-milky_way-saturn']
+            monkeypatch.setattr(mock_jenkins, 'jobnames', property(BlockedJobNames))
+        else:
+            def BlockedJobConfig(self, job_name):
+                release.wait()
+                return TestJenkinsPublisher._JOB_CONFIGS[job_name]
+            monkeypatch.setattr(mock_jenkins, 'job_config', BlockedJobConfig)
+
+        publisher = self._GetPublisher()
+        deadline = Deadline(0.2)
+        start_time = time.time()
+        try:
+            if prefetch:
+                publisher.PrefetchUrl(
+                    url='jenkins_url',
+                    username='jenkins_user',
+                    password='jenkins_pass',
+                    deadline=deadline,
+                )
+            with pytest.raises(DeadlineExceededError) as e:
+                publisher.PublishToUrl(
+                    url='jenkins_url',
+                    username='jenkins_user',
+                    password='jenkins_pass',
+                    deadline=deadline,
+                )
+            assert time.time() - start_time < 5
+        finally:
+            release.set()
+
+        assert e.value.finished_operations == []
+        assert e.value.skipped_operations == ['list jenkins jobs']
+        assert mock_jenkins.NEW_JOBS == set()
+
+
+    def testListRepositoryJobs(self, monkeypatch):
+        mock_jenkins = self._MockJenkinsAPI(monkeypatch)
+
+        publisher = self._GetPublisher()
+        assert publisher.ListRepositoryJobs(
+            'jenkins_url', username='jenkins_user', password='jenkins_pass') == {
+            'space-milky_way-mercury' : 'milky_way',
+            'space-milky_way-saturn' : 'milky_way',
+        }
+
+        # Jobs are attributed to a repository by their SCM for it, the same way when listing jobs
+        # of all branches and when publishing: a repository with the same name is not affected
+        other_repository = Repository(url='http://server/other/space.git', branch='milky_way')
+        other_publisher = JenkinsJobPublisher(other_repository, jobs=[])
+        assert other_publisher.ListRepositoryJobs(
+            'jenkins_url', username='jenkins_user', password='jenkins_pass') == {}
+        assert other_publisher.PublishToUrl(
+            'jenkins_url', username='jenkins_user', password='jenkins_pass') == [[], [], []]
+        assert mock_jenkins.DELETED_JOBS == set()
+
+        # Jobs using another url for the same repository (e.g. ssh instead of http) are found, and
+        # updated instead of created again
+        ssh_repository = Repository(url='ssh://git@server:7999/space.git', branch='milky_way')
+        ssh_publisher = JenkinsJobPublisher(ssh_repository, jobs=[
+            JenkinsJob(name='space-milky_way-mercury', xml='mercury', repository=ssh_repository),
+        ])
+        assert ssh_publisher.ListRepositoryJobs(
+            'jenkins_url', username='jenkins_user', password='jenkins_pass') == {
+            'space-milky_way-mercury' : 'milky_way',
+            'space-milky_way-saturn' : 'milky_way',
+        }
+        assert ssh_publisher.PublishToUrl(
+            'jenkins_url', username='jenkins_user', password='jenkins_pass') == \
+            [[], ['space-milky_way-mercury'], ['space-milky_way-saturn']]
+        assert mock_jenkins.NEW_JOBS == set()
+
+
+    def testDeleteOrphanJobs(self, monkeypatch):
+        mock_jenkins = self._MockJenkinsAPI(monkeypatch)
+
+        # All branches still exist
+        orphan_jobs = DeleteOrphanJobs(
+            'http://server/space.git',
+            set(['milky_way', 'andromeda']),
+            url='jenkins_url',
+            username='jenkins_user',
+            password='jenkins_pass',
+        )
+        assert orphan_jobs == {}
+        assert mock_jenkins.DELETED_JOBS == set()
+
+        # Jobs of other repositories are never touched
+        orphan_jobs = DeleteOrphanJobs(
+            'http://server/other/space.git',
+            set(),
+            url='jenkins_url',
+            username='jenkins_user',
+            password='jenkins_pass',
+        )
+        assert orphan_jobs == {}
+        assert mock_jenkins.DELETED_JOBS == set()
+
+        # Branch was deleted (dry run)
+        orphan_jobs = DeleteOrphanJobs(
+            'http://server/space.git',
+            set(['andromeda']),
+            url='jenkins_url',
+            username='jenkins_user',
+            password='jenkins_pass',
+            dry_run=True,
+        )
+        assert orphan_jobs == {'milky_way' : ['space-milky_way-mercury', 'space-milky_way-saturn']}
+        assert mock_jenkins.DELETED_JOBS == set()
+
+        # Deleting all jobs of a repository (or with no branches at all) must be forced
+        for branches in [set(['andromeda']), set()]:
+            with pytest.raises(OrphanJobsSafetyError):
+                DeleteOrphanJobs(
+                    'http://server/space.git',
+                    branches,
+                    url='jenkins_url',
+                    username='jenkins_user',
+                    password='jenkins_pass',
+                )
+            assert mock_jenkins.DELETED_JOBS == set()
+
+        # Branch was deleted
+        orphan_jobs = DeleteOrphanJobs(
+            'http://server/space.git',
+            set(['andromeda']),
+            url='jenkins_url',
+            username='jenkins_user',
+            password='jenkins_pass',
+            force=True,
+        )
+        assert orphan_jobs == {'milky_way' : ['space-milky_way-mercury', 'space-milky_way-saturn']}
+        assert mock_jenkins.DELETED_JOBS == set(['space-milky_way-mercury', 'space-milky_way-saturn'])
+
+
+    def testDisableInactiveJobs(self, monkeypatch, embed_data):
+        import time
+
+        mock_jenkins = self._MockJenkinsAPI(monkeypatch)
+
+        now = time.time()
+        one_day = 24 * 60 * 60
+
+        # Active branch
+        inactive_jobs = DisableInactiveJobs(
+            'http://server/space.git',
+            {'milky_way' : now - 10 * one_day, 'andromeda' : now - 100 * one_day},
+            url='jenkins_url',
+            username='jenkins_user',
+            password='jenkins_pass',
+            days=30,
+        )
+        assert inactive_jobs == {}
+        assert mock_jenkins.DISABLED_JOBS == set()
+
+        # Inactive branch (dry run)
+        inactive_jobs = DisableInactiveJobs(
+            'http://server/space.git',
+            {'milky_way' : now - 100 * one_day},
+            url='jenkins_url',
+            username='jenkins_user',
+            password='jenkins_pass',
+            days=30,
+            dry_run=True,
+        )
+        assert inactive_jobs == {'milky_way' : ['space-milky_way-mercury', 'space-milky_way-saturn']}
+        assert mock_jenkins.DISABLED_JOBS == set()
+
+        # Inactive branch, removed from the publish record so its jobs are enabled again
+        record_filename = embed_data['record.json']
+        milky_way = Repository(url='http://server/space.git', branch='milky_way')
+        andromeda = Repository(url='http://server/space.git', branch='andromeda')
+        WritePublishRecord(milky_way, None, record_filename)
+        WritePublishRecord(andromeda, None, record_filename)
+
+        inactive_jobs = DisableInactiveJobs(
+            'http://server/space.git',
+            {'milky_way' : now - 100 * one_day},
+            url='jenkins_url',
+            username='jenkins_user',
+            password='jenkins_pass',
+            days=30,
+            record_filename=record_filename,
+        )
+        assert inactive_jobs == {'milky_way' : ['space-milky_way-mercury', 'space-milky_way-saturn']}
+        assert mock_jenkins.DISABLED_JOBS == set(['space-milky_way-mercury', 'space-milky_way-saturn'])
+        assert not IsPublishUpToDate(milky_way, None, record_filename=record_filename)
+        assert IsPublishUpToDate(andromeda, None, record_filename=record_filename)
+
+
+    def _FakeScriptConsole(self, status_code, job_scms):
+        '''
+        Starts a local HTTP server faking Jenkins script console.
+
+        :param int status_code:
+            Status code returned for all requests.
+
+        :param list(dict)|None job_scms:
+            Data returned (as JSON) by the script console.
+
+        :return context manager:
+            Yields a tuple with the server url, and a list of received requests (dicts with 'path'
+            and 'script').
+        '''
+        from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+        import contextlib
+        import json
+        import threading
+        import urlparse
+
+        requests_received = []
+
+        class ScriptConsoleHandler(BaseHTTPRequestHandler):
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                requests_received.append({
+                    'path' : self.path,
+                    'script' : urlparse.parse_qs(body)['script'][0].decode('utf-8'),
+                })
+
+                contents = json.dumps(job_scms) if job_scms is not None else ''
+                self.send_response(status_code)
+                self.send_header('Content-Length', len(contents))
+                self.end_headers()
+                self.wfile.write(contents)
+
+            def log_message(self, *args):
+                pass
+
+        @contextlib.contextmanager
+        def _Serve():
+            server = HTTPServer(('127.0.0.1', 0), ScriptConsoleHandler)
+            thread = threading.Thread(target=server.serve_forever)
+            thread.daemon = True
+            thread.start()
+            try:
+                yield 'http://127.0.0.1:%d' % server.server_address[1], requests_received
+            finally:
+                server.shutdown()
+                server.server_close()
+
+        return _Serve()
+
+
     def _GetPublisher(self):
         repository = Repository(url='http://server/space.git', branch='milky_way')
         jobs = [
@@ -1651,87 +2920,32 @@ class TestJenkinsPublisher(object):
         return JenkinsJobPublisher(repository, jobs)
 
 
-    def _MockJenkinsAPI(self, monkeypatch, proxy_errors=0):
+    def _MockJenkinsAPI(self, monkeypatch, proxy_errors=0, url='jenkins_url'):
+        expected_url = url
+
         class MockJenkins(object):
             NEW_JOBS = set()
             UPDATED_JOBS = set()
             DELETED_JOBS = set()
+            DISABLED_JOBS = set()
+            CONFIG_REQUESTS = []
+            LIST_THREADS = []
 
             def __init__(self, url, username, password):
-                assert url == 'jenkins_url'
+                assert url == expected_url
                 assert username == 'jenkins_user'
                 assert password == 'jenkins_pass'
                 self.proxy_errors_raised = 0
 
             @property
             def jobnames(self):
+                import threading
+                self.LIST_THREADS.append(threading.current_thread())
                 return ['space-milky_way-mercury', 'space-milky_way-saturn']
 
             def job_config(self, job_name):
-                # Test with single, and multiple scms
-                if job_name == 'space-milky_way-mercury':
-                    return Dedent(
-                        '''
-                        <project>
-                          <scm>
-                            <userRemoteConfigs>
-                              <hudson.plugins.git.UserRemoteConfig>
-                                <url>
-                                  http://server/space.git
-                                </url>
-                              </hudson.plugins.git.UserRemoteConfig>
-                            </userRemoteConfigs>
-                            <branches>
-                              <hudson.plugins.git.BranchSpec>
-                                <name>milky_way</name>
-                              </hudson.plugins.git.BranchSpec>
-                            </branches>
-                          </scm>
-                        </project>
-                        '''
-                    )
-                elif job_name == 'space-milky_way-saturn':
-                    return Dedent(
-                        '''
-                        <project>
-                          <scm>
-                            <scms>
-                              <!-- One of the SCMs is the one for space -->
-                              <hudson.plugins.git.GitSCM>
-                                <userRemoteConfigs>
-                                  <hudson.plugins.git.UserRemoteConfig>
-                                    <url>
-                                      http://server/space.git
-                                    </url>
-                                  </hudson.plugins.git.UserRemoteConfig>
-                                </userRemoteConfigs>
-                                <branches>
-                                  <hudson.plugins.git.BranchSpec>
-                                    <name>milky_way</name>
-                                  </hudson.plugins.git.BranchSpec>
-                                </branches>
-                              </hudson.plugins.git.GitSCM>
-
-                              <!-- But a job might have multiple SCMs, we don't care about those -->
-                              <hudson.plugins.git.GitSCM>
-                                <userRemoteConfigs>
-                                  <hudson.plugins.git.UserRemoteConfig>
-                                    <url>
-                                      http://server/space_dependencie.git
-                                    </url>
-                                  </hudson.plugins.git.UserRemoteConfig>
-                                </userRemoteConfigs>
-                                <branches>
-                                  <hudson.plugins.git.BranchSpec>
-                                    <name>other_branch</name>
-                                  </hudson.plugins.git.BranchSpec>
-                                </branches>
-                              </hudson.plugins.git.GitSCM>
-                            </scms>
-                          </scm>
-                        </project>
-                        '''
-                    )
+                self.CONFIG_REQUESTS.append(job_name)
+                return TestJenkinsPublisher._JOB_CONFIGS[job_name]
 
             def job_create(self, name, xml):
                 self.NEW_JOBS.add(name)
@@ -1739,6 +2953,9 @@ class TestJenkinsPublisher(object):
             def job_reconfigure(self, name, xml):
                 self.UPDATED_JOBS.add(name)
 
+            def job_disable(self, name):
+                self.DISABLED_JOBS.add(name)
+
             def job_delete(self, name):
                 if self.proxy_errors_raised < proxy_errors:
                     self.proxy_errors_raised += 1
@@ -2,6 +2,8 @@
 Module containing everything related to Jenkins in jobs_done10.
 
 This includes a generator, job publishers, constants and command line interface commands.
+Publishing sessions (used by long running processes), batch publishing and watching jobs_done files
+are in `jobs_done10.jenkins_session`, `jobs_done10.jenkins_batch` and `jobs_done10.jenkins_watcher`.
 '''
 from __future__ import absolute_import, unicode_literals
 from ben10.foundation.bunch import Bunch
@@ -12,6 +14,13 @@ from jobs_done10.job_generator import IJobGenerator
 
 
 
+# Version of jobs generated by `JenkinsXmlJobGenerator`, stored in jobs metadata. Increase it
+# whenever generated jobs change for the same jobs_done file, so unchanged jobs_done files are
+# published again (.. seealso:: IsPublishUpToDate).
+GENERATOR_VERSION = '1'
+
+
+
 #===================================================================================================
 # JenkinsJob
 #===================================================================================================
@@ -27,10 +36,16 @@ class JenkinsJob(Bunch):
 
     :cvar unicode xml:
         Job XML contents
+
+    :cvar unicode|None jobs_done_file_sha:
+        Git blob SHA of the jobs_done file this job was created from. It is not part of `xml`
+        (so jobs only change when their contents change), and is only stored in the description
+        of jobs published to Jenkins (.. seealso:: IsPublishUpToDate).
     '''
     name = None
     repository = None
     xml = None
+    jobs_done_file_sha = None
 
 
 
@@ -49,6 +64,7 @@ class JenkinsXmlJobGenerator(object):
         self.__scm_plugin = None
 
         self.repository = None
+        self.jobs_done_file_sha = None
 
 
     @Implements(IJobGenerator.Reset)
@@ -67,6 +83,10 @@ class JenkinsXmlJobGenerator(object):
         self.xml['concurrentBuild'] = xmls(False)
         self.xml['canRoam'] = xmls(False)
 
+        # Jobs might be disabled while their branch is inactive (.. seealso:: DisableInactiveJobs),
+        # publishing them again enables them.
+        self.xml['disabled'] = xmls(False)
+
         # Configure git SCM
         self.git = self.xml['scm']
         self.git['@class'] = 'hudson.plugins.git.GitSCM'
@@ -113,11 +133,22 @@ class JenkinsXmlJobGenerator(object):
         return JenkinsJob(
             name=self.job_name,
             repository=self.repository,
-            xml=self.xml.GetContents(xml_header=True)
+            xml=self.xml.GetContents(xml_header=True),
+            jobs_done_file_sha=self.jobs_done_file_sha,
         )
 
 
 
+    def SetJobsDoneFileSha(self, jobs_done_file_sha):
+        '''
+        :param unicode|None jobs_done_file_sha:
+            Git blob SHA of the jobs_done file used to create jobs (.. seealso::
+            JenkinsJob.jobs_done_file_sha).
+        '''
+        self.jobs_done_file_sha = jobs_done_file_sha
+
+
+
     #===============================================================================================
     # Configurator functions (.. seealso:: JobsDoneJob ivars for docs)
     #===============================================================================================
@@ -129,22 +160,48 @@ class JenkinsXmlJobGenerator(object):
     @Implements(IJobGenerator.SetMatrix)
     def SetMatrix(self, matrix, matrix_row):
         label_expression = self.repository.name
-        self.job_name = self.GetJobGroup(self.repository)
+        self.job_name = self.GetJobName(self.repository, matrix, matrix_row)
 
-        if matrix_row:
-            row_representation = '-'.join([
-                value for key, value \
-                in sorted(matrix_row.items()) \
+        row_representation = self._GetRowRepresentation(matrix, matrix_row)
+        if row_representation:  # Might be empty
+            label_expression += '-' + row_representation
 
-                # Matrix rows with only one possible value do not affect the representation
-                if len(matrix[key]) > 1
-            ])
+        self.SetLabelExpression(label_expression)
 
-            if row_representation:  # Might be empty
-                label_expression += '-' + row_representation
-                self.job_name += '-' + row_representation
 
-        self.SetLabelExpression(label_expression)
+    @classmethod
+    def GetJobName(cls, repository, matrix, matrix_row):
+        '''
+        :param Repository repository:
+            Repository/branch of the job.
+
+        :param dict(unicode,list(unicode)) matrix:
+        :param dict(unicode,unicode) matrix_row:
+            .. seealso:: JobsDoneJob
+
+        :return unicode:
+            Name of the job created for `matrix_row`, without generating it.
+        '''
+        job_name = cls.GetJobGroup(repository)
+
+        row_representation = cls._GetRowRepresentation(matrix, matrix_row)
+        if row_representation:  # Might be empty
+            job_name += '-' + row_representation
+        return job_name
+
+
+    @classmethod
+    def _GetRowRepresentation(cls, matrix, matrix_row):
+        if not matrix_row:
+            return ''
+
+        return '-'.join([
+            value for key, value \
+            in sorted(matrix_row.items()) \
+
+            # Matrix rows with only one possible value do not affect the representation
+            if len(matrix[key]) > 1
+        ])
 
 
     def SetAdditionalRepositories(self, repositories):
@@ -427,324 +484,3227 @@ xmls = _AsXmlString
 
 
 
-#===================================================================================================
-# JenkinsJobPublisher
-#===================================================================================================
-class JenkinsJobPublisher(object):
+def _FormatJobsDoneMetadata(jobs_done_file_sha):
     '''
-    Publishes `JenkinsJob`s
+    :param unicode jobs_done_file_sha:
+        Git blob SHA of a jobs_done file.
+
+    :return unicode:
+        Job description containing `jobs_done_file_sha` and `GENERATOR_VERSION`.
+        .. seealso:: _ParseJobsDoneMetadata
     '''
-    # Times to retry on ProxyErrors
-    RETRIES = 3
+    return "<!-- Managed by Job's Done (jobs_done_file: %s, generator: %s) -->" % (
+        jobs_done_file_sha, GENERATOR_VERSION)
 
-    # Times to sleep (seconds) between each retry
-    RETRY_SLEEP = 1
 
-    def __init__(self, repository, jobs):
-        '''
-        :param Repository repository:
-            Repository used for these jobs. Used to find other jobs in the same url/branch to be
-            updated or deleted.
 
-        :param list(JenkinsJob) jobs:
-            List of jobs to be published.
-        '''
-        for job in jobs:
-            assert job.repository == repository, +\
-                'All published jobs must belong to the given `repository`'
+def _GetPublishedXml(job):
+    '''
+    :param JenkinsJob job:
 
-        self.repository = repository
-        self.jobs = dict((job.name, job) for job in jobs)
+    :return unicode:
+        Contents of `job` published to Jenkins: its xml, with jobs_done file metadata in its
+        description (if it has a `jobs_done_file_sha`).
+    '''
+    from xml.sax.saxutils import escape
 
+    if job.jobs_done_file_sha is None:
+        return job.xml
 
-    def PublishToUrl(self, url, username=None, password=None):
-        '''
-        Publishes new jobs, updated existing jobs, and delete jobs that belong to the same
-        repository/branch but were not updated.
+    return job.xml.replace(
+        '<description>%s</description>' % escape("<!-- Managed by Job's Done -->"),
+        '<description>%s</description>' % escape(_FormatJobsDoneMetadata(job.jobs_done_file_sha)),
+        1,
+    )
 
-        :param unicode url:
-            Jenkins instance URL where jobs will be uploaded to.
 
-        :param unicode username:
-            Jenkins username.
 
-        :param unicode password:
-            Jenkins password.
+def _RemoveJobsDoneMetadata(config):
+    '''
+    :param unicode config:
+        Contents of a Jenkins job config.xml
 
-        :return tuple(list(unicode),list(unicode),list(unicode)):
-            Tuple with lists of {new, updated, deleted} job names (sorted alphabetically)
-        '''
-        import jenkins
-        jenkins_api = jenkins.Jenkins(url, username, password)
+    :return unicode:
+        `config` without jobs_done file metadata in its description, as generated
+        (.. seealso:: _GetPublishedXml).
+    '''
+    import re
 
-        # Get all jobs
-        job_names = set(self.jobs.keys())
-        matching_jobs = self._GetMatchingJobs(jenkins_api)
+    return re.sub(
+        r"(Managed by Job(?:'|&apos;)s Done) \(jobs_done_file: \w+, generator: [\w.]+\)",
+        r'\1',
+        config,
+    )
 
-        # Find all new/updated/deleted jobs
-        new_jobs = job_names.difference(matching_jobs)
-        updated_jobs = job_names.intersection(matching_jobs)
-        deleted_jobs = matching_jobs.difference(job_names)
 
-        def retry(func, *args, **kwargs):
-            from requests.exceptions import HTTPError
-            for _ in range(self.RETRIES):
-                try:
-                    func(*args, **kwargs)
-                    break
-                except HTTPError as http_error:
-                    if http_error.response.status_code == 403:  # Proxy error
-                        # This happens sometimes for no apparent reason, and we want to retry.
-                        from time import sleep
-                        sleep(self.RETRY_SLEEP)
-                    else:
-                        raise http_error
-            else:
-                # If we got here, this mean we ran out of retries. Raise the last error we received.
-                raise http_error
 
-        # Process everything
-        for job_name in new_jobs:
-            retry(jenkins_api.job_create, job_name, self.jobs[job_name].xml)
+def _ParseJobsDoneMetadata(config):
+    '''
+    :param unicode config:
+        Contents of a Jenkins job config.xml
 
-        for job_name in updated_jobs:
-            retry(jenkins_api.job_reconfigure, job_name, self.jobs[job_name].xml)
+    :return tuple(unicode,unicode)|None:
+        The jobs_done file SHA and generator version stored in the job description, or None if the
+        job does not have them.
+        .. seealso:: _FormatJobsDoneMetadata
+    '''
+    from xml.etree import ElementTree
+    import re
 
-        for job_name in deleted_jobs:
-            retry(jenkins_api.job_delete, job_name)
+    if isinstance(config, unicode):
+        config = config.encode('utf-8')
+    description = ElementTree.fromstring(config).findtext('description') or ''
 
-        return map(sorted, (new_jobs, updated_jobs, deleted_jobs))
+    match = re.search(
+        r"Managed by Job's Done \(jobs_done_file: (\w+), generator: ([\w.]+)\)", description)
+    if match is None:
+        return None
+    return match.group(1), match.group(2)
 
 
-    def PublishToDirectory(self, output_directory):
-        '''
-        Publishes jobs to a directory. Each job creates a file with its name and xml contents.
 
-        :param unicode output_directory:
-             Target directory for outputting job .xmls
-        '''
-        from ben10.filesystem import CreateFile
-        import os
-        for job in self.jobs.values():
-            CreateFile(
-                filename=os.path.join(output_directory, job.name),
-                contents=job.xml
-            )
+def _GetXmlDiff(old_xml, new_xml):
+    '''
+    Compares two job XMLs ignoring XML declarations, indentation and blank lines.
 
+    :param unicode old_xml:
+    :param unicode new_xml:
 
-    def _GetMatchingJobs(self, jenkins_api):
-        '''
-        Filter jobs that belong to the same repository/branch as a `job` being published
+    :return unicode:
+        A compact unified diff (no context lines) between `old_xml` and `new_xml`, or an empty
+        string if they are equivalent.
+    '''
+    import difflib
+
+    def _Normalize(xml):
+        if not isinstance(xml, unicode):
+            xml = xml.decode('utf-8')
+        return [
+            line.strip()
+            for line in xml.splitlines()
+            if line.strip() and not line.strip().startswith('<?xml')
+        ]
 
-        :param jenkins_api:
-            Configured Jenkins API that gives access to Jenkins data at a host.
+    diff = difflib.unified_diff(_Normalize(old_xml), _Normalize(new_xml), n=0, lineterm='')
 
-        :return set(unicode):
-            Names of all Jenkins jobs that match `job` repository name and branch
-        '''
-        matching_jobs = set()
+    # Skip file headers ('---', '+++')
+    return '\n'.join(list(diff)[2:])
 
-        for jenkins_job in jenkins_api.jobnames:
-            # Filter jobs that belong to this repository (this would be safer to do reading SCM
-            # information, but a lot more expensive
-            common_prefix = self.repository.name + '-' + self.repository.branch
-            if not jenkins_job.startswith(common_prefix):
-                continue
 
-            jenkins_job_branch = self._GetJenkinsJobBranch(jenkins_api, jenkins_job)
-            if jenkins_job_branch == self.repository.branch:
-                matching_jobs.add(jenkins_job)
 
-        return matching_jobs
+def _GetRequestSize(args, kwargs, result):
+    '''
+    :param tuple args:
+    :param dict kwargs:
+        Arguments of a request to Jenkins.
 
+    :param object result:
+        Result of that request.
 
-    @Memoize
-    def _GetJenkinsJobBranch(self, jenkins_api, jenkins_job):
-        '''
-        :param jenkins.Jenkins jenkins_api:
-            Configured Jenkins API that gives access to Jenkins data at a host.
+    :return int:
+        Approximate number of bytes transferred: request bodies (job XMLs, scripts) and response
+        contents (job configs, job listings).
+    '''
+    size = 0
+    if hasattr(result, 'content'):  # requests.Response
+        size += len(result.content)
+    elif isinstance(result, basestring):
+        size += len(result)
+    elif isinstance(result, (list, tuple)):
+        size += sum(len(i) for i in result if isinstance(i, basestring))
 
-        :param unicode jenkins_job:
-            Name of a job in jenkins
+    # First argument is the job name or url, not sent as contents
+    for arg in list(args[1:]) + kwargs.get('data', {}).values():
+        if isinstance(arg, basestring):
+            size += len(arg)
+    return size
 
-        :return unicode:
-            Name of `jenkins_job`s branch
 
-        .. note::
-            This function was separated to make use of Memoize cacheing, avoiding multiple queries
-            to the same jenkins job config.xml
-        '''
-        from xml.etree import ElementTree
 
-        # Read config to see if this job is in the same branch
-        config = jenkins_api.job_config(jenkins_job)
+def _HasFileContents(filename, contents):
+    '''
+    :param unicode filename:
+        An existing file.
 
-        # We should be able to get this information from jenkins API, but it seems that git
-        # plugin for Jenkins has a bug that prevents its data from being shown in the API
-        # https://issues.jenkins-ci.org/browse/JENKINS-14588
-        root = ElementTree.fromstring(config)
+    :param unicode contents:
+        File contents (encoded as utf-8).
 
-        # Try for single SCM
-        name_element = root.find('scm/branches/hudson.plugins.git.BranchSpec/name')
-        if name_element is not None:
-            return name_element.text.strip()
+    :return bool:
+        True if `filename` already has `contents` (compared by hash, so large files are not kept
+        in memory twice).
+    '''
+    import hashlib
 
-        # If the above was not found, we might be dealing with multiple repositories
-        scms = root.findall('scm/scms/hudson.plugins.git.GitSCM')
+    def _GetHash(file_contents):
+        if isinstance(file_contents, unicode):
+            file_contents = file_contents.encode('utf-8')
+        return hashlib.sha1(file_contents).hexdigest()
 
-        # Process them all until we find the SCM for the correct repository
-        for scm in scms:
-            url = scm.find('userRemoteConfigs/hudson.plugins.git.UserRemoteConfig/url').text.strip()
+    with open(filename, 'rb') as existing_file:
+        return _GetHash(existing_file.read()) == _GetHash(contents)
 
-            if url == self.repository.url:
-                return scm.find('branches/hudson.plugins.git.BranchSpec/name').text.strip()
 
-        raise RuntimeError(
-            'Could not find SCM for repository "%s" in job "%s"' % (self.repository.url, jenkins_job)
-        )
 
+def _CreateFileAtomically(filename, contents):
+    '''
+    Creates a file writing its contents to a temporary file first, and then renaming it over
+    `filename`, so readers never see a partially written file.
 
+    :param unicode filename:
+        Target filename. Parent directories are created if necessary.
 
-#===================================================================================================
-# Actions for common uses of Jenkins classes
-#===================================================================================================
-def UploadJobsFromFile(repository, jobs_done_file_contents, url, username=None, password=None):
+    :param unicode contents:
+        File contents (encoded as utf-8)
     '''
-    :param repository:
-        .. seealso:: GetJobsFromFile
+    import os
+    import sys
+    import tempfile
 
-    :param jobs_done_file_contents:
-        .. seealso:: GetJobsFromFile
+    directory = os.path.dirname(os.path.abspath(filename))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
 
-    :param unicode url:
-        URL of a Jenkins sevrer instance where jobs will be uploaded
+    if isinstance(contents, unicode):
+        contents = contents.encode('utf-8')
 
-    :param unicode|None username:
-        Username for Jenkins server.
+    fd, temp_filename = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(filename))
+    try:
+        with os.fdopen(fd, 'wb') as temp_file:
+            temp_file.write(contents)
 
-    :param unicode|None password:
-        Password for Jenkins server.
+        # os.rename does not overwrite files in Windows
+        if sys.platform == 'win32' and os.path.exists(filename):
+            os.remove(filename)
+        os.rename(temp_filename, filename)
+    except:
+        if os.path.exists(temp_filename):
+            os.remove(temp_filename)
+        raise
 
-    :returns:
-        .. seealso:: JenkinsJobPublisher.PublishToUrl
 
+
+class _BackgroundCall(object):
     '''
-    jobs = GetJobsFromFile(repository, jobs_done_file_contents)
-    publisher = JenkinsJobPublisher(repository, jobs)
+    Executes a function in a background thread, so it overlaps with work done in the caller's
+    thread.
 
-    return publisher.PublishToUrl(url, username, password)
+    Results (or exceptions) are obtained with `Get`.
+    '''
+
+    def __init__(self, func, *args, **kwargs):
+        import threading
 
+        self._func = func
+        self._args = args
+        self._kwargs = kwargs
+        self._result = None
+        self._exc_info = None
 
+        self._thread = threading.Thread(target=self._Run)
+        self._thread.daemon = True
+        self._thread.start()
 
-def GetJobsFromDirectory(directory='.'):
+
+    def _Run(self):
+        import sys
+
+        try:
+            self._result = self._func(*self._args, **self._kwargs)
+        except:
+            self._exc_info = sys.exc_info()
+
+
+    def Get(self, deadline=None):
+        '''
+        Waits for the function to finish.
+
+        :param Deadline|None deadline:
+            If given, only waits while this deadline is not over.
+
+        :return object:
+            Whatever the function returned.
+
+        :raises DeadlineExceededError:
+            If `deadline` is over before the function finishes (it keeps running in background, and
+            its result is discarded).
+
+        :raises:
+            Whatever the function raised.
+        '''
+        timeout = deadline.GetRemainingTime() if deadline is not None else None
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            raise deadline.CreateExceededError()
+
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._result
+
+
+
+def _Bounded(deadline, func):
     '''
-    Looks in a directory for a jobs_done file and git repository information to create jobs.
+    Wraps a function that may block for an unbounded time (e.g. a request made by the Jenkins API,
+    which has no timeout), so callers only wait for it while a deadline is not over.
 
-    :param directory:
-        Directory where we'll extract information to generate `JenkinsJob`s
+    Only use it for requests that don't change anything (e.g. reading jobs): a function given up on
+    keeps running in background, so a request that changes a job could still finish after being
+    reported as skipped.
 
-    :return tuple(Repository,set(JenkinsJob))
-        Repository information for the given directory, and jobs obtained from this directory.
+    :param Deadline|None deadline:
+        Deadline. If None (or if it never expires), `func` is returned unchanged.
 
-        .. seealso:: GetJobsFromFile
+    :param callable func:
+        Function wrapped.
+
+    :return callable:
+        Same as `func`, but raising `DeadlineExceededError` if `deadline` is over before `func`
+        returns (.. seealso:: _BackgroundCall.Get).
     '''
-    from ben10.filesystem import FileNotFoundError, GetFileContents
-    from gitit.git import Git
-    from jobs_done10.jobs_done_job import JOBS_DONE_FILENAME
-    from jobs_done10.repository import Repository
-    import os
+    if deadline is None or deadline.expiration_time is None:
+        return func
+
+    def _BoundedFunc(*args, **kwargs):
+        if deadline.IsExpired():
+            raise deadline.CreateExceededError()
+        return _BackgroundCall(func, *args, **kwargs).Get(deadline)
+
+    return _BoundedFunc
 
-    git = Git()
-    repository = Repository(
-        url=git.GetRemoteUrl(repo_path=directory),
-        branch=git.GetCurrentBranch(repo_path=directory)
-    )
 
-    try:
-        jobs_done_file_contents = GetFileContents(os.path.join(directory, JOBS_DONE_FILENAME))
-    except FileNotFoundError:
-        jobs_done_file_contents = None
 
-    return repository, GetJobsFromFile(repository, jobs_done_file_contents)
+#===================================================================================================
+# JenkinsPublishEvent
+#===================================================================================================
+class JenkinsPublishEvent(Bunch):
+    '''
+    Emitted by `JenkinsJobPublisher` each time an operation on a job finishes.
 
+    :cvar unicode action:
+        One of `ACTIONS`.
 
+    :cvar unicode job_name:
+        Name of the job.
 
-def GetJobsFromFile(repository, jobs_done_file_contents):
+    :cvar float latency:
+        Time (in seconds) taken by the operation, including retries.
+
+    :cvar int index:
+        Number of operations finished so far, including this one.
+
+    :cvar int total:
+        Number of operations in this publish.
     '''
-    Creates jobs from repository information and a jobs_done file.
+    ACTIONS = NEW, UPDATED, DELETED = ('new', 'updated', 'deleted')
+
+    action = None
+    job_name = None
+    latency = None
+    index = None
+    total = None
 
-    :param Repository repository:
-        .. seealso:: Repository
 
-    :param unicode|None jobs_done_file_contents:
-        .. seealso:: JobsDoneJob.CreateFromYAML
 
-    :return set(JenkinsJob)
+#===================================================================================================
+# JenkinsPublishPlan
+#===================================================================================================
+class JenkinsPublishPlan(Bunch):
     '''
-    from jobs_done10.job_generator import JobGeneratorConfigurator
-    from jobs_done10.jobs_done_job import JobsDoneJob
+    Changes that would be made to a Jenkins instance when publishing jobs.
 
-    jenkins_generator = JenkinsXmlJobGenerator()
+    :cvar list(unicode) new:
+        Names of jobs that would be created.
 
-    jobs = []
-    jobs_done_jobs = JobsDoneJob.CreateFromYAML(jobs_done_file_contents, repository)
-    for jobs_done_job in jobs_done_jobs:
-        JobGeneratorConfigurator.Configure(jenkins_generator, jobs_done_job)
-        jobs.append(jenkins_generator.GetJob())
+    :cvar list(unicode) updated:
+        Names of existing jobs whose configuration would change.
+
+    :cvar list(unicode) unchanged:
+        Names of existing jobs whose configuration is already up to date.
 
-    return jobs
+    :cvar list(unicode) deleted:
+        Names of jobs that would be deleted.
+
+    :cvar dict(unicode,unicode) diffs:
+        Maps names of updated jobs to a compact diff between current and new configurations.
+    '''
+    new = None
+    updated = None
+    unchanged = None
+    deleted = None
+    diffs = None
 
 
 
 #===================================================================================================
-# ConfigureCommandLineInterface
+# JenkinsRequestLog
 #===================================================================================================
-def ConfigureCommandLineInterface(jobs_done_application):
+class JenkinsRequestLog(object):
     '''
-    Configures additional command line commands to the jobs_done application.
+    Records requests made to Jenkins by `JenkinsJobPublisher`, to find out why a publish was slow.
 
-    :param App jobs_done_application:
-        Command line application we are registering commands to.
+    Each request is written as a JSON line as soon as it finishes, and a summary (latency
+    percentiles per kind of request, slowest requests and time spent sleeping between retries) can
+    be written at the end.
+
+    :ivar list(dict) entries:
+        Recorded requests, with keys "method", "kind", "job", "status", "bytes", "latency" (seconds),
+        "retries" and "retry_sleep" (seconds).
     '''
-    @jobs_done_application
-    def jenkins(console_, url, username=None, password=None):
+
+    # HTTP method used by each kind of request
+    METHODS = {
+        'list' : 'GET',
+        'config' : 'GET',
+        'create' : 'POST',
+        'reconfigure' : 'POST',
+        'delete' : 'POST',
+        'disable' : 'POST',
+        'script' : 'POST',
+        'reload' : 'POST',
+    }
+
+    # Number of requests listed in summary as the slowest ones
+    SLOWEST_COUNT = 10
+
+    def __init__(self, stream=None):
         '''
-        Creates jobs for Jenkins and push them to a Jenkins instance.
+        :param file|None stream:
+            If given, entries (and the summary) are written to this stream as JSON lines.
+        '''
+        import threading
 
-        If no parameters are given, this command will look for a configuration file that defines a
-        target url/username/password.
+        self.entries = []
+        self.stream = stream
 
-        :param url: Jenkins instance URL where jobs will be uploaded to.
+        # Requests may be recorded from many threads (.. seealso:: JenkinsJobPublisher.PrefetchUrl)
+        self._lock = threading.Lock()
 
-        :param username: Jenkins username.
 
-        :param password: Jenkins password.
+    def Record(self, kind, job_name, status, size, latency, retries, retry_sleep):
         '''
-        console_.Print('Publishing jobs in "<white>%s</>"' % url)
+        Records a request.
 
-        repository, jobs = GetJobsFromDirectory()
-        publisher = JenkinsJobPublisher(repository, jobs)
-        new_jobs, updated_jobs, deleted_jobs = publisher.PublishToUrl(url, username, password)
-
-        for job in new_jobs:
-            console_.Print('<green>NEW</> - ' + job)
-        for job in updated_jobs:
-            console_.Print('<yellow>UPD</> - ' + job)
-        for job in deleted_jobs:
-            console_.Print('<red>DEL</> - ' + job)
+        .. seealso:: entries for parameters
+        '''
+        entry = {
+            'method' : self.METHODS.get(kind),
+            'kind' : kind,
+            'job' : job_name,
+            'status' : status,
+            'bytes' : size,
+            'latency' : latency,
+            'retries' : retries,
+            'retry_sleep' : retry_sleep,
+        }
+        with self._lock:
+            self.entries.append(entry)
+            self._Write(entry)
+
+
+    def GetSummary(self):
+        '''
+        :return dict:
+            Summary of recorded requests, with keys:
+            - "kinds": maps each kind of request to its "count", and "p50", "p90", "p99" and "max"
+              latencies
+            - "slowest": the `SLOWEST_COUNT` slowest entries
+            - "retry_sleep": total time spent sleeping between retries
+            - "total_latency": total time spent in requests
+        '''
+        latencies_by_kind = {}
+        for entry in self.entries:
+            latencies_by_kind.setdefault(entry['kind'], []).append(entry['latency'])
+
+        kinds = {}
+        for kind, latencies in latencies_by_kind.iteritems():
+            latencies.sort()
+            kinds[kind] = {
+                'count' : len(latencies),
+                'p50' : _GetPercentile(latencies, 50),
+                'p90' : _GetPercentile(latencies, 90),
+                'p99' : _GetPercentile(latencies, 99),
+                'max' : latencies[-1],
+            }
+
+        return {
+            'kinds' : kinds,
+            'slowest' : sorted(self.entries, key=lambda e: e['latency'], reverse=True)[:self.SLOWEST_COUNT],
+            'retry_sleep' : sum(entry['retry_sleep'] for entry in self.entries),
+            'total_latency' : sum(entry['latency'] for entry in self.entries),
+        }
+
+
+    def WriteSummary(self):
+        '''
+        Writes the summary (.. seealso:: GetSummary) to `stream`, as a last JSON line with a single
+        "summary" key.
+        '''
+        self._Write({'summary' : self.GetSummary()})
 
 
-    @jobs_done_application
-    def jenkins_test(console_, output_directory):
+    def FormatSummary(self):
         '''
-        Creates jobs for Jenkins and save the resulting .xml's in a directory
-
-        :param output_directory: Directory to output job xmls instead of uploading to `url`.
+        :return list(unicode):
+            Human readable summary lines.
         '''
-        console_.Print('Saving jobs in "%s"' % output_directory)
+        summary = self.GetSummary()
+
+        lines = []
+        for kind, stats in sorted(summary['kinds'].iteritems()):
+            lines.append(
+                '%-12s count=%-5d p50=%.3fs p90=%.3fs p99=%.3fs max=%.3fs' % (
+                kind, stats['count'], stats['p50'], stats['p90'], stats['p99'], stats['max']))
+
+        lines.append('slowest:')
+        for entry in summary['slowest']:
+            lines.append('  %.3fs %s %s' % (entry['latency'], entry['kind'], entry['job'] or ''))
+
+        lines.append('total time in requests: %.3fs' % summary['total_latency'])
+        lines.append('total time in retry sleeps: %.3fs' % summary['retry_sleep'])
+        return lines
+
+
+    def _Write(self, data):
+        import json
+
+        if self.stream is not None:
+            self.stream.write(json.dumps(data, sort_keys=True) + '\n')
+            self.stream.flush()
+
+
+
+def _GetPercentile(sorted_values, percentile):
+    '''
+    :param list(float) sorted_values:
+        Values, sorted.
+
+    :param int percentile:
+        Percentile (0-100).
 
-        repository, jobs = GetJobsFromDirectory()
-        publisher = JenkinsJobPublisher(repository, jobs)
-        publisher.PublishToDirectory(output_directory)
+    :return float:
+        Percentile of `sorted_values` (nearest rank).
+    '''
+    import math
+
+    index = int(math.ceil(percentile / 100.0 * len(sorted_values))) - 1
+    return sorted_values[max(0, index)]
+
+
+
+#===================================================================================================
+# JenkinsJobPublisher
+#===================================================================================================
+class JenkinsJobPublisher(object):
+    '''
+    Publishes `JenkinsJob`s
+    '''
+    # Times to retry on ProxyErrors
+    RETRIES = 3
+
+    # Times to sleep (seconds) between each retry
+    RETRY_SLEEP = 1
+
+    # Maximum number of job configs fetched from Jenkins at the same time
+    FETCH_THREADS = 8
+
+    def __init__(self, repository, jobs, request_log=None):
+        '''
+        :param Repository repository:
+            Repository used for these jobs. Used to find other jobs in the same url/branch to be
+            updated or deleted.
+
+        :param list(JenkinsJob) jobs:
+            List of jobs to be published.
+
+            Jobs may also be given later (.. seealso:: SetJobs), after `PrefetchUrl` started.
+
+        :param JenkinsRequestLog|None request_log:
+            If given, every request made to Jenkins is recorded in this log.
+        '''
+        import threading
+
+        self.repository = repository
+        self.request_log = request_log
+        self.SetJobs(jobs)
+
+        self._jenkins_apis = {}
+        self._job_names = {}
+        self._job_configs = {}
+        self._prefetched_listings = {}
+        self._lock = threading.Lock()
+
+
+    def SetJobs(self, jobs):
+        '''
+        :param list(JenkinsJob) jobs:
+            List of jobs to be published, replacing any jobs given before.
+        '''
+        for job in jobs:
+            assert job.repository == self.repository, +\
+                'All published jobs must belong to the given `repository`'
+
+        self.jobs = dict((job.name, job) for job in jobs)
+
+
+    def PrefetchUrl(
+        self, url, username=None, password=None, use_script_console=False, deadline=None):
+        '''
+        Starts listing jobs in Jenkins that belong to the same repository/branch (fetching their
+        configs if necessary) in a background thread.
+
+        Listing only depends on the repository, so this can be called before jobs are generated,
+        overlapping network requests with parsing and generation. `PublishToUrl` and `PlanUrl`
+        wait for, and reuse, a listing prefetched with the same parameters.
+
+        :param unicode url:
+        :param unicode username:
+        :param unicode password:
+        :param bool use_script_console:
+        :param Deadline|None deadline:
+            .. seealso:: PublishToUrl
+        '''
+        from jobs_done10.deadline import Deadline
+
+        # Operations in background are tracked apart, only the expiration time is shared
+        background_deadline = Deadline(
+            deadline.GetRemainingTime() if deadline is not None else None)
+
+        key = (url, username, password, use_script_console)
+        jenkins_api = self._GetJenkinsApi(url, username, password)
+        with self._lock:
+            if key in self._prefetched_listings:
+                return
+            self._prefetched_listings[key] = _BackgroundCall(
+                self._FetchMatchingJobs,
+                jenkins_api,
+                url,
+                username,
+                password,
+                use_script_console,
+                background_deadline,
+            )
+
+
+    def UseJenkinsApi(
+        self, url, username, password, jenkins_api, job_names=None, job_configs=None):
+        '''
+        Uses an existing Jenkins API (and its connections) for requests made to `url`, instead of
+        creating a new one. Useful to share a single API by many publishers.
+
+        :param unicode url:
+        :param unicode username:
+        :param unicode password:
+            .. seealso:: PublishToUrl
+
+        :param jenkins.Jenkins jenkins_api:
+            Jenkins API for `url`.
+
+        :param list(unicode)|None job_names:
+            Names of all jobs in Jenkins, if already listed (e.g. once for many publishers). If
+            None, jobs are listed from Jenkins when needed.
+
+        :param dict(unicode,unicode)|None job_configs:
+            Cache of job configs (maps job names to their config.xml) shared with other
+            publishers. Configs fetched by this publisher are added to it.
+        '''
+        with self._lock:
+            self._jenkins_apis[(url, username, password)] = jenkins_api
+            if job_names is not None:
+                self._job_names[jenkins_api] = job_names
+            if job_configs is not None:
+                self._job_configs[jenkins_api] = job_configs
+
+
+    def PublishToUrl(
+        self,
+        url,
+        username=None,
+        password=None,
+        use_script_console=False,
+        deadline=None,
+        on_operation=None,
+        matching_jobs=None,
+        ):
+        '''
+        Publishes new jobs, updated existing jobs, and delete jobs that belong to the same
+        repository/branch but were not updated.
+
+        :param unicode url:
+            Jenkins instance URL where jobs will be uploaded to.
+
+        :param unicode username:
+            Jenkins username.
+
+        :param unicode password:
+            Jenkins password.
+
+        :param bool use_script_console:
+            If True, tries to obtain SCM information of all existing jobs with a single request to
+            Jenkins script console, instead of fetching the config.xml of each job.
+
+            Falls back to fetching each config.xml if script console access is denied.
+
+        :param Deadline|None deadline:
+            If given, operations (listing jobs, and creating/updating/deleting each job) are only
+            started while this deadline is not over. Jenkins is only waited for while the deadline
+            is not over when listing jobs: a job being created, updated or deleted is always waited
+            for, so operations reported as finished (or skipped) are exactly the ones done (or not)
+            in Jenkins.
+
+        :param callable on_operation:
+            If given, called with a `JenkinsPublishEvent` as soon as each job is created, updated
+            or deleted.
+
+        :param set(unicode)|None matching_jobs:
+            Names of jobs in Jenkins that belong to the same repository/branch, if already known
+            (e.g. listed once for many branches). If None, jobs are listed from Jenkins.
+
+        :return tuple(list(unicode),list(unicode),list(unicode)):
+            Tuple with lists of {new, updated, deleted} job names (sorted alphabetically)
+
+        :raises DeadlineExceededError:
+            If `deadline` is exceeded before all operations are finished.
+        '''
+        from jobs_done10 import metrics
+
+        with metrics.PUBLISH_DURATION.Time(target='jenkins'):
+            return self._PublishToUrl(
+                url, username, password, use_script_console, deadline, on_operation, matching_jobs)
+
+
+    def _PublishToUrl(
+        self,
+        url,
+        username,
+        password,
+        use_script_console,
+        deadline,
+        on_operation,
+        matching_jobs,
+        ):
+        '''
+        .. seealso:: PublishToUrl
+        '''
+        from jobs_done10 import metrics
+        from jobs_done10.deadline import Deadline
+        import time
+
+        if deadline is None:
+            deadline = Deadline()
+
+        jenkins_api = self._GetJenkinsApi(url, username, password)
+
+        # Get all jobs
+        job_names = set(self.jobs.keys())
+        if matching_jobs is None:
+            matching_jobs = self._ListMatchingJobs(
+                jenkins_api, url, username, password, use_script_console, deadline)
+        matching_jobs = set(matching_jobs)
+
+        # Find all new/updated/deleted jobs
+        new_jobs = job_names.difference(matching_jobs)
+        updated_jobs = job_names.intersection(matching_jobs)
+        deleted_jobs = matching_jobs.difference(job_names)
+
+        # Process everything
+        operations = []
+        for job_name in sorted(new_jobs):
+            operations.append((
+                'create ' + job_name,
+                JenkinsPublishEvent.NEW,
+                job_name,
+                'create',
+                jenkins_api.job_create,
+                (job_name, _GetPublishedXml(self.jobs[job_name])),
+            ))
+
+        for job_name in sorted(updated_jobs):
+            operations.append((
+                'update ' + job_name,
+                JenkinsPublishEvent.UPDATED,
+                job_name,
+                'reconfigure',
+                jenkins_api.job_reconfigure,
+                (job_name, _GetPublishedXml(self.jobs[job_name])),
+            ))
+
+        for job_name in sorted(deleted_jobs):
+            operations.append((
+                'delete ' + job_name,
+                JenkinsPublishEvent.DELETED,
+                job_name,
+                'delete',
+                jenkins_api.job_delete,
+                (job_name,),
+            ))
+
+        # Changes are not bounded by the deadline (.. seealso:: _Bounded): it is only checked
+        # before each of them
+        deadline.AddOperations([operation[0] for operation in operations])
+        for index, (operation, action, job_name, kind, func, args) in enumerate(operations, 1):
+            start_time = time.time()
+            deadline.Run(operation, self._Request, kind, job_name, func, *args)
+            metrics.PUBLISHED_JOBS.Inc(target='jenkins', action=action)
+
+            if on_operation is not None:
+                on_operation(JenkinsPublishEvent(
+                    action=action,
+                    job_name=job_name,
+                    latency=time.time() - start_time,
+                    index=index,
+                    total=len(operations),
+                ))
+
+        return map(sorted, (new_jobs, updated_jobs, deleted_jobs))
+
+
+    def PlanUrl(self, url, username=None, password=None, use_script_console=False, deadline=None):
+        '''
+        Computes what `PublishToUrl` would do, without making any changes in Jenkins.
+
+        :param unicode url:
+        :param unicode username:
+        :param unicode password:
+        :param bool use_script_console:
+        :param Deadline|None deadline:
+            .. seealso:: PublishToUrl
+
+        :return JenkinsPublishPlan:
+        '''
+        from jobs_done10.deadline import Deadline
+
+        if deadline is None:
+            deadline = Deadline()
+
+        jenkins_api = self._GetJenkinsApi(url, username, password)
+
+        job_names = set(self.jobs.keys())
+        matching_jobs = self._ListMatchingJobs(
+            jenkins_api, url, username, password, use_script_console, deadline)
+
+        plan = JenkinsPublishPlan(
+            new=sorted(job_names.difference(matching_jobs)),
+            updated=[],
+            unchanged=[],
+            deleted=sorted(matching_jobs.difference(job_names)),
+            diffs={},
+        )
+
+        existing_jobs = sorted(job_names.intersection(matching_jobs))
+        deadline.AddOperations(['read config ' + job_name for job_name in existing_jobs])
+        for job_name in existing_jobs:
+            # Configs are cached, so jobs already read while listing are not fetched again
+            config = deadline.Run(
+                'read config ' + job_name, self._GetJenkinsJobConfig, jenkins_api, job_name)
+
+            # Jobs_done file metadata changes whenever the file changes, even if the job does not
+            diff = _GetXmlDiff(_RemoveJobsDoneMetadata(config), self.jobs[job_name].xml)
+            if diff:
+                plan.updated.append(job_name)
+                plan.diffs[job_name] = diff
+            else:
+                plan.unchanged.append(job_name)
+
+        return plan
+
+
+    def PublishToDirectory(self, output_directory):
+        '''
+        Publishes jobs to a directory. Each job creates a file with its name and xml contents.
+
+        Files are only written (atomically) when their contents change, and files of jobs that
+        belong to the same repository/branch but are not being published anymore are deleted.
+
+        :param unicode output_directory:
+             Target directory for outputting job .xmls
+
+        :return tuple(list(unicode),list(unicode),list(unicode),list(unicode)):
+            Tuple with lists of {new, updated, unchanged, deleted} job names (sorted alphabetically)
+        '''
+        from jobs_done10 import metrics
+
+        with metrics.PUBLISH_DURATION.Time(target='directory'):
+            result = self._PublishToDirectory(output_directory)
+
+        for action, job_names in zip(('new', 'updated', 'unchanged', 'deleted'), result):
+            metrics.PUBLISHED_JOBS.Inc(len(job_names), target='directory', action=action)
+        return result
+
+
+    def _PublishToDirectory(self, output_directory):
+        '''
+        .. seealso:: PublishToDirectory
+        '''
+        import os
+
+        existing_files = {}
+        if os.path.isdir(output_directory):
+            for filename in os.listdir(output_directory):
+                if os.path.isfile(os.path.join(output_directory, filename)):
+                    existing_files[filename] = os.path.join(output_directory, filename)
+
+        # Files to delete are found before writing anything, so failing to read them leaves the
+        # directory untouched
+        deleted_jobs = self._GetMatchingJobsFromFiles(dict(
+            (job_name, filename)
+            for job_name, filename in existing_files.iteritems()
+            if job_name not in self.jobs
+        ))
+
+        new_jobs = set()
+        updated_jobs = set()
+        unchanged_jobs = set()
+        for job in self.jobs.values():
+            filename = os.path.join(output_directory, job.name)
+
+            if job.name not in existing_files:
+                new_jobs.add(job.name)
+            elif _HasFileContents(filename, job.xml):
+                unchanged_jobs.add(job.name)
+                continue
+            else:
+                updated_jobs.add(job.name)
+
+            _CreateFileAtomically(filename, job.xml)
+
+        for job_name in deleted_jobs:
+            os.remove(existing_files[job_name])
+
+        return map(sorted, (new_jobs, updated_jobs, unchanged_jobs, deleted_jobs))
+
+
+    def PublishToJenkinsHome(self, jenkins_home, url=None, username=None, password=None):
+        '''
+        Publishes jobs writing their config.xml directly into a JENKINS_HOME directory, which
+        avoids one HTTP request per job when running in the same host as the Jenkins master.
+
+        Works like `PublishToUrl`: new jobs are created, existing jobs updated, and jobs that belong
+        to the same repository/branch but were not updated are deleted. The config.xml of jobs
+        that did not change (including jobs_done file metadata, .. seealso:: _GetPublishedXml) is
+        not rewritten.
+
+        :param unicode jenkins_home:
+            Jenkins home directory (contains a "jobs" directory, with one directory per job).
+
+        :param unicode|None url:
+            Jenkins instance URL. If given, Jenkins is asked to reload its configuration from disk
+            (a single request) after all jobs are written, if any job changed.
+
+        :param unicode username:
+            Jenkins username.
+
+        :param unicode password:
+            Jenkins password.
+
+        :return tuple(list(unicode),list(unicode),list(unicode)):
+            Tuple with lists of {new, updated, deleted} job names (sorted alphabetically). Jobs
+            that did not change are not in any of them.
+        '''
+        import os
+        import shutil
+
+        jobs_directory = os.path.join(jenkins_home, 'jobs')
+
+        config_filenames = {}
+        if os.path.isdir(jobs_directory):
+            for jenkins_job in os.listdir(jobs_directory):
+                config_filename = os.path.join(jobs_directory, jenkins_job, 'config.xml')
+                if os.path.isfile(config_filename):
+                    config_filenames[jenkins_job] = config_filename
+
+        job_names = set(self.jobs.keys())
+        matching_jobs = self._GetMatchingJobsFromFiles(config_filenames)
+
+        new_jobs = job_names.difference(matching_jobs)
+        updated_jobs = set(
+            job_name
+            for job_name in job_names.intersection(matching_jobs)
+            if not _HasFileContents(
+                config_filenames[job_name], _GetPublishedXml(self.jobs[job_name]))
+        )
+        deleted_jobs = matching_jobs.difference(job_names)
+
+        for job_name in new_jobs.union(updated_jobs):
+            _CreateFileAtomically(
+                os.path.join(jobs_directory, job_name, 'config.xml'),
+                _GetPublishedXml(self.jobs[job_name]),
+            )
+
+        for job_name in deleted_jobs:
+            shutil.rmtree(os.path.join(jobs_directory, job_name))
+
+        if url is not None and (new_jobs or updated_jobs or deleted_jobs):
+            self._ReloadJenkins(url, username, password)
+
+        return map(sorted, (new_jobs, updated_jobs, deleted_jobs))
+
+
+    def ListRepositoryJobs(self, url, username=None, password=None, use_script_console=False):
+        '''
+        Lists jobs of all branches of this repository (not only of `repository.branch`).
+
+        Only jobs whose main SCM is this repository, and that are named after the job group of
+        their branch (as generated jobs are), are considered.
+
+        :param unicode url:
+        :param unicode username:
+        :param unicode password:
+        :param bool use_script_console:
+            .. seealso:: PublishToUrl
+
+        :return dict(unicode,unicode):
+            Maps job names to their branches.
+        '''
+        jenkins_api = self._GetJenkinsApi(url, username, password)
+
+        job_scms = None
+        if use_script_console:
+            job_scms = self._GetJobScmsFromScriptConsole(
+                url, username, password, prefix=self.repository.name + '-')
+
+        return self._GetRepositoryJobBranches(jenkins_api, job_scms)
+
+
+    def DeleteJobs(self, job_names, url, username=None, password=None, max_rate=None):
+        '''
+        Deletes jobs from Jenkins (.. seealso:: ListRepositoryJobs).
+
+        :param list(unicode) job_names:
+            Names of jobs to delete, deleted in alphabetical order.
+
+        :param unicode url:
+        :param unicode username:
+        :param unicode password:
+            .. seealso:: PublishToUrl
+
+        :param float|None max_rate:
+            Maximum number of jobs deleted per second.
+        '''
+        import time
+
+        jenkins_api = self._GetJenkinsApi(url, username, password)
+        for job_name in sorted(job_names):
+            self._Request('delete', job_name, jenkins_api.job_delete, job_name)
+            if max_rate:
+                time.sleep(1.0 / max_rate)
+
+
+    def DisableJobs(self, job_names, url, username=None, password=None):
+        '''
+        Disables jobs in Jenkins (.. seealso:: ListRepositoryJobs).
+
+        :param list(unicode) job_names:
+            Names of jobs to disable, disabled in alphabetical order.
+
+        :param unicode url:
+        :param unicode username:
+        :param unicode password:
+            .. seealso:: PublishToUrl
+        '''
+        jenkins_api = self._GetJenkinsApi(url, username, password)
+        for job_name in sorted(job_names):
+            self._Request('disable', job_name, jenkins_api.job_disable, job_name)
+
+
+    def _Request(self, kind, job_name, func, *args, **kwargs):
+        '''
+        Makes a request to Jenkins, retrying on proxy errors, and recording it in `request_log`.
+
+        :param unicode kind:
+            Kind of request (.. seealso:: JenkinsRequestLog.METHODS)
+
+        :param unicode|None job_name:
+            Name of the job this request refers to, if any.
+
+        :param callable func:
+            Function making the request, called with `args` and `kwargs`.
+
+        :return object:
+            Whatever `func` returns.
+        '''
+        from jobs_done10 import metrics
+        from requests.exceptions import HTTPError
+        import time
+
+        retries = 0
+        retry_sleep = 0.0
+        status = None
+        result = None
+        failed = True
+        start_time = time.time()
+        try:
+            for _ in range(self.RETRIES):
+                try:
+                    result = func(*args, **kwargs)
+                    status = getattr(result, 'status_code', 200)
+                    failed = False
+                    return result
+                except HTTPError as http_error:
+                    status = http_error.response.status_code
+                    if status == 403:  # Proxy error
+                        # This happens sometimes for no apparent reason, and we want to retry.
+                        retries += 1
+                        sleep_start_time = time.time()
+                        time.sleep(self.RETRY_SLEEP)
+                        retry_sleep += time.time() - sleep_start_time
+                    else:
+                        raise http_error
+
+            # If we got here, this mean we ran out of retries. Raise the last error we received.
+            raise http_error
+        finally:
+            latency = time.time() - start_time
+            metrics.REQUEST_DURATION.Observe(latency, kind=kind)
+            metrics.REQUEST_RETRIES.Inc(retries, kind=kind)
+            if failed:
+                metrics.REQUEST_ERRORS.Inc(kind=kind)
+
+            if self.request_log is not None:
+                self.request_log.Record(
+                    kind=kind,
+                    job_name=job_name,
+                    status=status,
+                    size=_GetRequestSize(args, kwargs, result),
+                    latency=latency,
+                    retries=retries,
+                    retry_sleep=retry_sleep,
+                )
+
+
+    def _ListJobNames(self, jenkins_api, deadline=None):
+        '''
+        :param jenkins.Jenkins jenkins_api:
+            Configured Jenkins API that gives access to Jenkins data at a host.
+
+        :param Deadline|None deadline:
+            If given, only waits for Jenkins while this deadline is not over.
+
+        :return list(unicode):
+            Names of all jobs in Jenkins (.. seealso:: UseJenkinsApi).
+        '''
+        job_names = self._job_names.get(jenkins_api)
+        if job_names is not None:
+            return job_names
+        return self._Request('list', None, _Bounded(deadline, lambda: jenkins_api.jobnames))
+
+
+    def _GetCommonPrefix(self):
+        '''
+        :return unicode:
+            Prefix shared by names of all jobs that might belong to this repository/branch.
+        '''
+        return self.repository.name + '-' + self.repository.branch
+
+
+    def _ListMatchingJobs(self, jenkins_api, url, username, password, use_script_console, deadline):
+        '''
+        Lists jobs that belong to the same repository/branch as jobs being published.
+
+        .. seealso:: PublishToUrl for parameters
+
+        :return set(unicode):
+            Names of all Jenkins jobs that match `job` repository name and branch
+        '''
+        from jobs_done10.deadline import DeadlineExceededError
+
+        prefetched_listing = self._prefetched_listings.get(
+            (url, username, password, use_script_console))
+        if prefetched_listing is not None:
+            def _GetPrefetchedListing():
+                try:
+                    return prefetched_listing.Get(deadline)
+                except DeadlineExceededError:
+                    # Also raised in background, reporting operations of another deadline
+                    raise deadline.CreateExceededError()
+
+            return deadline.Run('list jenkins jobs', _GetPrefetchedListing)
+
+        return self._FetchMatchingJobs(
+            jenkins_api, url, username, password, use_script_console, deadline)
+
+
+    def _FetchMatchingJobs(
+        self, jenkins_api, url, username, password, use_script_console, deadline):
+        '''
+        Same as `_ListMatchingJobs`, ignoring prefetched listings.
+        '''
+        job_scms = None
+        if use_script_console:
+            job_scms = deadline.Run(
+                'read jenkins script console',
+                lambda: self._GetJobScmsFromScriptConsole(
+                    url,
+                    username,
+                    password,
+                    prefix=self._GetCommonPrefix(),
+                    timeout=deadline.GetRemainingTime(),
+                )
+            )
+
+        return deadline.Run(
+            'list jenkins jobs', self._GetMatchingJobs, jenkins_api, job_scms, deadline)
+
+
+    def _GetJenkinsApi(self, url, username, password):
+        '''
+        :return jenkins.Jenkins:
+            Jenkins API for `url`, shared by all requests made by this publisher (so configs
+            cached for it are reused).
+        '''
+        import jenkins
+
+        key = (url, username, password)
+        with self._lock:
+            if key not in self._jenkins_apis:
+                self._jenkins_apis[key] = jenkins.Jenkins(url, username, password)
+            return self._jenkins_apis[key]
+
+
+    def _GetMatchingJobs(self, jenkins_api, job_scms=None, deadline=None):
+        '''
+        Filter jobs that belong to the same repository/branch as a `job` being published
+
+        :param jenkins_api:
+            Configured Jenkins API that gives access to Jenkins data at a host.
+
+        :param dict(unicode,tuple(bool,list(tuple(unicode,unicode))))|None job_scms:
+            SCM information for jobs, as returned by `_GetJobScmsFromScriptConsole`.
+            If None, SCM information is obtained from each job config.xml.
+
+        :param Deadline|None deadline:
+            If given, only waits for Jenkins while this deadline is not over.
+
+        :return set(unicode):
+            Names of all Jenkins jobs that match `job` repository name and branch
+        '''
+        matching_jobs = set()
+
+        if job_scms is not None:
+            jenkins_job_names = job_scms.keys()
+        else:
+            jenkins_job_names = self._ListJobNames(jenkins_api, deadline)
+
+        # Filter jobs that belong to this repository (this would be safer to do reading SCM
+        # information, but a lot more expensive
+        jenkins_job_names = [
+            jenkins_job
+            for jenkins_job in jenkins_job_names
+            if jenkins_job.startswith(self._GetCommonPrefix())
+        ]
+        if job_scms is None:
+            self._FetchJenkinsJobConfigs(jenkins_api, jenkins_job_names, deadline)
+
+        for jenkins_job in jenkins_job_names:
+            if job_scms is not None:
+                multiple_scms, scms = job_scms[jenkins_job]
+                jenkins_job_branch = self._GetBranchFromScms(jenkins_job, multiple_scms, scms)
+            else:
+                jenkins_job_branch = self._GetJenkinsJobBranch(jenkins_api, jenkins_job)
+
+            if jenkins_job_branch == self.repository.branch:
+                matching_jobs.add(jenkins_job)
+
+        return matching_jobs
+
+
+    def _GetMatchingJobsFromFiles(self, config_filenames):
+        '''
+        Filter job config files that belong to the same repository/branch as jobs being published.
+
+        :param dict(unicode,unicode) config_filenames:
+            Maps job names to the filename of their config.xml.
+            Files that are not valid XML are ignored.
+
+        :return set(unicode):
+            Names of all jobs that match `job` repository name and branch
+        '''
+        from ben10.filesystem import GetFileContents
+        from xml.etree.ElementTree import ParseError
+
+        matching_jobs = set()
+
+        for jenkins_job, config_filename in config_filenames.iteritems():
+            if not jenkins_job.startswith(self._GetCommonPrefix()):
+                continue
+
+            try:
+                multiple_scms, scms = self._GetScmsFromConfig(GetFileContents(config_filename))
+            except ParseError:
+                continue
+
+            if self._GetBranchFromScms(jenkins_job, multiple_scms, scms) == self.repository.branch:
+                matching_jobs.add(jenkins_job)
+
+        return matching_jobs
+
+
+    def _GetRepositoryJobBranches(self, jenkins_api, job_scms=None):
+        '''
+        Finds jobs of all branches of this repository (.. seealso:: _GetBranchFromScms).
+
+        :param jenkins_api:
+            Configured Jenkins API that gives access to Jenkins data at a host.
+
+        :param dict(unicode,tuple(bool,list(tuple(unicode,unicode))))|None job_scms:
+            .. seealso:: _GetMatchingJobs
+
+        :return dict(unicode,unicode):
+            Maps job names to their branches.
+        '''
+        prefix = self.repository.name + '-'
+
+        if job_scms is not None:
+            jenkins_job_names = job_scms.keys()
+        else:
+            jenkins_job_names = self._ListJobNames(jenkins_api)
+
+        jenkins_job_names = [
+            jenkins_job for jenkins_job in jenkins_job_names if jenkins_job.startswith(prefix)]
+        if job_scms is None:
+            self._FetchJenkinsJobConfigs(jenkins_api, jenkins_job_names)
+
+        job_branches = {}
+        for jenkins_job in jenkins_job_names:
+            if job_scms is not None:
+                multiple_scms, scms = job_scms[jenkins_job]
+                branch = self._GetBranchFromScms(jenkins_job, multiple_scms, scms)
+            else:
+                branch = self._GetJenkinsJobBranch(jenkins_api, jenkins_job)
+
+            if branch is not None:
+                job_branches[jenkins_job] = branch
+
+        return job_branches
+
+
+    @Memoize
+    def _GetJenkinsJobBranch(self, jenkins_api, jenkins_job):
+        '''
+        :param jenkins.Jenkins jenkins_api:
+            Configured Jenkins API that gives access to Jenkins data at a host.
+
+        :param unicode jenkins_job:
+            Name of a job in jenkins
+
+        :return unicode|None:
+            .. seealso:: _GetBranchFromScms
+
+        .. note::
+            This function was separated to make use of Memoize cacheing, avoiding multiple queries
+            to the same jenkins job config.xml
+        '''
+        # Read config to see if this job is in the same branch
+        config = self._GetJenkinsJobConfig(jenkins_api, jenkins_job)
+
+        multiple_scms, scms = self._GetScmsFromConfig(config)
+        return self._GetBranchFromScms(jenkins_job, multiple_scms, scms)
+
+
+    def _GetJenkinsJobConfig(self, jenkins_api, jenkins_job, deadline=None):
+        '''
+        :param jenkins.Jenkins jenkins_api:
+            Configured Jenkins API that gives access to Jenkins data at a host.
+
+        :param unicode jenkins_job:
+            Name of a job in jenkins
+
+        :param Deadline|None deadline:
+            If given, only waits for Jenkins while this deadline is not over.
+
+        :return unicode:
+            Contents of `jenkins_job`s config.xml (cached, so each config is only fetched once)
+        '''
+        with self._lock:
+            job_configs = self._job_configs.setdefault(jenkins_api, {})
+
+        config = job_configs.get(jenkins_job)
+        if config is None:
+            config = self._Request(
+                'config', jenkins_job, _Bounded(deadline, jenkins_api.job_config), jenkins_job)
+            with self._lock:
+                job_configs[jenkins_job] = config
+        return config
+
+
+    def _FetchJenkinsJobConfigs(self, jenkins_api, jenkins_jobs, deadline=None):
+        '''
+        Fetches configs of many jobs concurrently (up to `FETCH_THREADS` at the same time), caching
+        them for `_GetJenkinsJobConfig`.
+
+        :param jenkins.Jenkins jenkins_api:
+            Configured Jenkins API that gives access to Jenkins data at a host.
+
+        :param list(unicode) jenkins_jobs:
+            Names of jobs in jenkins.
+
+        :param Deadline|None deadline:
+            If given, configs are only fetched (and waited for) while this deadline is not over.
+
+        :raises DeadlineExceededError:
+            If `deadline` is over before all configs are fetched.
+        '''
+        from multiprocessing.pool import ThreadPool
+
+        if len(jenkins_jobs) < 2:
+            for jenkins_job in jenkins_jobs:
+                self._GetJenkinsJobConfig(jenkins_api, jenkins_job, deadline)
+            return
+
+        pool = ThreadPool(min(self.FETCH_THREADS, len(jenkins_jobs)))
+        try:
+            pool.map(
+                lambda jenkins_job: self._GetJenkinsJobConfig(jenkins_api, jenkins_job, deadline),
+                jenkins_jobs,
+            )
+        finally:
+            pool.close()
+            pool.join()
+
+
+    @classmethod
+    def _GetScmsFromConfig(cls, config):
+        '''
+        :param unicode config:
+            Contents of a Jenkins job config.xml
+
+        :return tuple(bool,list(tuple(unicode,unicode))):
+            A flag indicating if the job uses multiple SCMs, and a list with the (url, branch) of
+            each git SCM configured in the job.
+        '''
+        from xml.etree import ElementTree
+
+        # We should be able to get this information from jenkins API, but it seems that git
+        # plugin for Jenkins has a bug that prevents its data from being shown in the API
+        # https://issues.jenkins-ci.org/browse/JENKINS-14588
+        if isinstance(config, unicode):
+            config = config.encode('utf-8')
+        root = ElementTree.fromstring(config)
+
+        def _GetText(element, path):
+            found = element.find(path)
+            if found is None or found.text is None:
+                return None
+            return found.text.strip()
+
+        url_path = 'userRemoteConfigs/hudson.plugins.git.UserRemoteConfig/url'
+        branch_path = 'branches/hudson.plugins.git.BranchSpec/name'
+
+        # Try for single SCM
+        scm = root.find('scm')
+        if scm is not None and scm.find(branch_path) is not None:
+            return False, [(_GetText(scm, url_path), _GetText(scm, branch_path))]
+
+        # If the above was not found, we might be dealing with multiple repositories
+        return True, [
+            (_GetText(scm, url_path), _GetText(scm, branch_path))
+            for scm in root.findall('scm/scms/hudson.plugins.git.GitSCM')
+        ]
+
+
+    def _GetBranchFromScms(self, jenkins_job, multiple_scms, scms):
+        '''
+        :param unicode jenkins_job:
+            Name of a job in jenkins
+
+        :param bool multiple_scms:
+        :param list(tuple(unicode,unicode)) scms:
+            .. seealso:: _GetScmsFromConfig
+
+        :return unicode|None:
+            Name of `jenkins_job`s branch, or None if it is not a job of this repository: it has no
+            SCM for this repository, or it is not named after the job group of its branch (as
+            generated jobs are). SCM urls are compared normalized (.. seealso:: NormalizeUrl), so
+            jobs using another url for the same repository (e.g. ssh instead of https) are found.
+
+        .. note::
+            This decides which jobs belong to this repository for all lookups of jobs
+            (.. seealso:: _GetMatchingJobs, _GetRepositoryJobBranches), so they always agree.
+        '''
+        from jobs_done10.repository import NormalizeUrl, Repository
+
+        repository_url = NormalizeUrl(self.repository.url)
+        branch = None
+        # Process them all until we find the SCM for the correct repository
+        for url, scm_branch in scms:
+            if url is not None and NormalizeUrl(url) == repository_url:
+                branch = scm_branch
+                break
+
+        if branch is None:
+            return None
+
+        job_group = JenkinsXmlJobGenerator.GetJobGroup(
+            Repository(url=self.repository.url, branch=branch))
+        if not jenkins_job.startswith(job_group):
+            return None
+        return branch
+
+
+    def _ReloadJenkins(self, url, username, password):
+        '''
+        Asks a Jenkins instance to reload its configuration from disk.
+
+        :param unicode url:
+            Jenkins instance URL.
+
+        :param unicode username:
+            Jenkins username.
+
+        :param unicode password:
+            Jenkins password.
+        '''
+        import requests
+
+        auth = (username, password) if username is not None else None
+        response = self._Request('reload', None, requests.post, url.rstrip('/') + '/reload', auth=auth)
+        response.raise_for_status()
+
+
+    # Groovy script executed in Jenkins script console, prints SCM information of all jobs whose
+    # names start with `prefix` as JSON.
+    _JOB_SCMS_SCRIPT = '''
+import groovy.json.JsonOutput
+
+def GetGitScmInfo(scm) {
+    return [
+        urls: scm.userRemoteConfigs.collect { it.url },
+        branches: scm.branches.collect { it.name },
+    ]
+}
+
+def prefix = %s
+def result = []
+for (job in jenkins.model.Jenkins.instance.getAllItems(hudson.model.AbstractProject)) {
+    if (!job.fullName.startsWith(prefix)) {
+        continue
+    }
+    def scm = job.scm
+    def info = [name: job.fullName, multiple: false, scms: []]
+    if (scm.class.name == 'org.jenkinsci.plugins.multiplescms.MultiSCM') {
+        info.multiple = true
+        info.scms = scm.configuredSCMs.findAll {
+            it.class.name == 'hudson.plugins.git.GitSCM'
+        }.collect { GetGitScmInfo(it) }
+    } else if (scm.class.name == 'hudson.plugins.git.GitSCM') {
+        info.scms = [GetGitScmInfo(scm)]
+    }
+    result << info
+}
+println JsonOutput.toJson(result)
+'''
+
+    def _GetJobScmsFromScriptConsole(self, url, username, password, prefix, timeout=None):
+        '''
+        Obtains SCM information of all jobs whose names start with `prefix` using a single request
+        to Jenkins script console.
+
+        :param unicode url:
+            Jenkins instance URL.
+
+        :param unicode username:
+            Jenkins username.
+
+        :param unicode password:
+            Jenkins password.
+
+        :param unicode prefix:
+            Only jobs whose names start with this prefix are returned.
+
+        :param float|None timeout:
+            Timeout (seconds) of the request.
+
+        :return dict(unicode,tuple(bool,list(tuple(unicode,unicode))))|None:
+            Maps job names to SCM information (.. seealso:: _GetScmsFromConfig).
+
+            Returns None if access to the script console is denied.
+        '''
+        from requests.exceptions import HTTPError
+        import json
+        import requests
+
+        groovy_prefix = "'%s'" % prefix.replace('\\', '\\\\').replace("'", "\\'")
+        auth = (username, password) if username is not None else None
+
+        response = self._Request(
+            'script',
+            None,
+            requests.post,
+            url.rstrip('/') + '/scriptText',
+            data={'script' : self._JOB_SCMS_SCRIPT % groovy_prefix},
+            auth=auth,
+            timeout=timeout,
+        )
+        try:
+            response.raise_for_status()
+        except HTTPError:
+            if response.status_code in (401, 403):  # Access denied to script console
+                return None
+            raise
+
+        result = {}
+        for job_info in json.loads(response.text):
+            scms = []
+            for scm_info in job_info['scms']:
+                scm_url = scm_info['urls'][0].strip() if scm_info['urls'] else None
+                scm_branch = scm_info['branches'][0].strip() if scm_info['branches'] else None
+                scms.append((scm_url, scm_branch))
+            result[job_info['name']] = (job_info['multiple'], scms)
+        return result
+
+
+
+#===================================================================================================
+# JenkinsBranchJobsCache
+#===================================================================================================
+class JenkinsBranchJobsCache(object):
+    '''
+    Creates jobs for many branches that share the same jobs_done file, rendering jobs only once.
+
+    Jobs of each jobs_done file (identified by its blob SHA) are rendered once for a placeholder
+    branch, and cached. Jobs for any branch are then created replacing the placeholder.
+
+    This is only done when the branch can't affect anything other than the placeholder: files with
+    conditions on branches, or whose `branch_patterns` or `exclude` options use "{branch}", and
+    branch names with characters that could change how a jobs_done file is parsed, have jobs
+    rendered for each branch.
+    '''
+
+    # Branch name used when rendering cached jobs
+    BRANCH_PLACEHOLDER = 'JobsDoneBranchPlaceholder'
+
+    # Branches that can replace the placeholder (others could change the YAML parsed)
+    SAFE_BRANCH_RE = r'^[\w./-]+$'
+
+    def __init__(self):
+        '''
+        :ivar int hits:
+            Number of times jobs were created from cached jobs.
+
+        :ivar int misses:
+            Number of times jobs were rendered for a branch.
+        '''
+        self._templates = {}
+        self.hits = 0
+        self.misses = 0
+
+
+    def GetJobs(self, repository, parsed_file, jobs_done_file_sha):
+        '''
+        :param Repository repository:
+            Repository/branch for which jobs are created.
+
+        :param ParsedJobsDoneFile|None parsed_file:
+            .. seealso:: JobsDoneJob.ParseYAML
+
+        :param unicode|None jobs_done_file_sha:
+            Blob SHA of the parsed jobs_done file.
+
+        :return list(JenkinsJob):
+            Same jobs that would be obtained with `GetJobsFromFile`.
+        '''
+        from jobs_done10.jobs_done_job import JobsDoneJob
+        import re
+
+        if parsed_file is None:
+            return []
+
+        if jobs_done_file_sha is not None and re.match(self.SAFE_BRANCH_RE, repository.branch):
+            key = (repository.url, jobs_done_file_sha)
+            if key not in self._templates:
+                self._templates[key] = self._CreateTemplates(
+                    repository, parsed_file, jobs_done_file_sha)
+
+            templates = self._templates[key]
+            if templates is not None:
+                self.hits += 1
+                return [
+                    self._FillTemplate(jenkins_job, repository)
+                    for jobs_done_job, jenkins_job in templates
+                    if jobs_done_job.MatchesBranch(repository.branch)
+                ]
+
+        self.misses += 1
+        jobs_done_jobs = JobsDoneJob.CreateFromParsedYAML(parsed_file, repository)
+        return list(_IterJobsFromJobsDoneJobs(jobs_done_jobs, jobs_done_file_sha))
+
+
+    def _CreateTemplates(self, repository, parsed_file, jobs_done_file_sha):
+        '''
+        :return list(tuple(JobsDoneJob,JenkinsJob))|None:
+            Jobs rendered for the placeholder branch (with the jobs_done jobs they were rendered
+            from, not filtered by `branch_patterns`), or None if the branch can affect anything
+            other than the placeholder.
+        '''
+        from jobs_done10.jobs_done_job import JobsDoneJob
+        from jobs_done10.repository import Repository
+
+        if any(condition.startswith('branch-') for condition in parsed_file.conditions):
+            return None
+
+        if self.BRANCH_PLACEHOLDER in parsed_file.jd_string:
+            return None
+
+        placeholder_repository = Repository(url=repository.url, branch=self.BRANCH_PLACEHOLDER)
+        jobs_done_jobs = JobsDoneJob.CreateFromParsedYAML(
+            parsed_file, placeholder_repository, match_branch_patterns=False)
+
+        for jobs_done_job in jobs_done_jobs:
+            for option in (jobs_done_job.branch_patterns, jobs_done_job.exclude):
+                if option is not None and self.BRANCH_PLACEHOLDER in unicode(option):
+                    return None
+
+        jenkins_jobs = _IterJobsFromJobsDoneJobs(jobs_done_jobs, jobs_done_file_sha)
+        return zip(jobs_done_jobs, jenkins_jobs)
+
+
+    def _FillTemplate(self, jenkins_job, repository):
+        '''
+        :param JenkinsJob jenkins_job:
+            Job rendered for the placeholder branch.
+
+        :param Repository repository:
+            Repository/branch for the new job.
+
+        :return JenkinsJob:
+            Copy of `jenkins_job` for `repository`.
+        '''
+        from xml.sax.saxutils import escape
+
+        xml_branch = escape(repository.branch, {'"' : '&quot;', "'" : '&apos;'})
+        return JenkinsJob(
+            name=jenkins_job.name.replace(self.BRANCH_PLACEHOLDER, repository.branch),
+            repository=repository,
+            xml=jenkins_job.xml.replace(self.BRANCH_PLACEHOLDER, xml_branch),
+            jobs_done_file_sha=jenkins_job.jobs_done_file_sha,
+        )
+
+
+
+#===================================================================================================
+# JenkinsShard
+#===================================================================================================
+class JenkinsShard(Bunch):
+    '''
+    One of many workers sharing the work of generating/publishing jobs.
+
+    Job groups (.. seealso:: JenkinsXmlJobGenerator.GetJobGroup) are assigned to shards by a stable
+    hash of their name, so workers running with the same `count` (in any process or host) cover
+    every job group exactly once.
+
+    :cvar int index:
+        Index of this shard (1-based).
+
+    :cvar int count:
+        Number of shards.
+    '''
+    index = 1
+    count = 1
+
+    @classmethod
+    def CreateFromString(cls, shard_string):
+        '''
+        :param unicode shard_string:
+            Shard in the format "index/count" (e.g. "2/4").
+
+        :return JenkinsShard:
+
+        :raises ValueError:
+            If `shard_string` is not a valid shard.
+        '''
+        import re
+
+        match = re.match(r'^(\d+)/(\d+)$', shard_string.strip())
+        if match is None:
+            raise ValueError('Invalid shard (expected "index/count"): "%s"' % shard_string)
+
+        index, count = int(match.group(1)), int(match.group(2))
+        if not 1 <= index <= count:
+            raise ValueError('Shard index must be between 1 and %d: "%s"' % (count, shard_string))
+
+        return cls(index=index, count=count)
+
+
+    def ContainsJobGroup(self, job_group):
+        '''
+        :param unicode job_group:
+            .. seealso:: JenkinsXmlJobGenerator.GetJobGroup
+
+        :return bool:
+            True if `job_group` belongs to this shard.
+        '''
+        import hashlib
+
+        job_group_hash = int(hashlib.sha1(job_group.encode('utf-8')).hexdigest(), 16)
+        return job_group_hash % self.count == self.index - 1
+
+
+    def ContainsRepository(self, repository):
+        '''
+        :param Repository repository:
+
+        :return bool:
+            True if the job group of `repository` belongs to this shard.
+        '''
+        return self.ContainsJobGroup(JenkinsXmlJobGenerator.GetJobGroup(repository))
+
+
+
+#===================================================================================================
+# Actions for common uses of Jenkins classes
+#===================================================================================================
+def UploadJobsFromFile(repository, jobs_done_file_contents, url, username=None, password=None):
+    '''
+    :param repository:
+        .. seealso:: GetJobsFromFile
+
+    :param jobs_done_file_contents:
+        .. seealso:: GetJobsFromFile
+
+    :param unicode url:
+        URL of a Jenkins sevrer instance where jobs will be uploaded
+
+    :param unicode|None username:
+        Username for Jenkins server.
+
+    :param unicode|None password:
+        Password for Jenkins server.
+
+    :returns:
+        .. seealso:: JenkinsJobPublisher.PublishToUrl
+
+    '''
+    # Jenkins jobs are listed while jobs are generated
+    publisher = JenkinsJobPublisher(repository, [])
+    publisher.PrefetchUrl(url, username, password)
+    publisher.SetJobs(GetJobsFromFile(repository, jobs_done_file_contents))
+
+    return publisher.PublishToUrl(url, username, password)
+
+
+
+def UploadJobsFromAllBranches(
+    directory,
+    url,
+    username=None,
+    password=None,
+    use_script_console=False,
+    deadline=None,
+    on_operation=None,
+    request_log=None,
+    shard=None,
+    ):
+    '''
+    Publishes jobs for every branch of a repository, reading jobs_done files straight from git (no
+    checkouts needed).
+
+    Jobs in Jenkins are listed only once for all branches (in background, while jobs are
+    generated), and a jobs_done file shared by many branches is only parsed once.
+
+    :param unicode directory:
+        Directory of a git repository (working copy, mirror or bare clone).
+
+    :param unicode url:
+        URL of a Jenkins server instance.
+
+    :param unicode|None username:
+        Username for Jenkins server.
+
+    :param unicode|None password:
+        Password for Jenkins server.
+
+    :param bool use_script_console:
+    :param Deadline|None deadline:
+    :param callable on_operation:
+        .. seealso:: JenkinsJobPublisher.PublishToUrl
+
+    :param JenkinsRequestLog|None request_log:
+        .. seealso:: JenkinsJobPublisher
+
+    :param JenkinsShard|None shard:
+        If given, only branches whose job group belongs to this shard are published (and only
+        their jobs may be deleted).
+
+    :return dict(unicode,tuple(list(unicode),list(unicode),list(unicode))):
+        Maps branch names to lists of {new, updated, deleted} job names.
+    '''
+    from jobs_done10.git_repository import GetRemoteUrl
+    from jobs_done10.repository import Repository
+
+    repository = Repository(url=GetRemoteUrl(directory))
+    lister = JenkinsJobPublisher(repository, [], request_log=request_log)
+    job_branches = _BackgroundCall(
+        lister.ListRepositoryJobs, url, username, password, use_script_console)
+
+    results = {}
+    for branch_repository, jobs in IterJobsFromAllBranches(directory, shard=shard):
+        matching_jobs = set(
+            job_name
+            for job_name, branch in job_branches.Get().iteritems()
+            if branch == branch_repository.branch
+        )
+
+        publisher = JenkinsJobPublisher(branch_repository, jobs, request_log=request_log)
+        results[branch_repository.branch] = publisher.PublishToUrl(
+            url,
+            username,
+            password,
+            deadline=deadline,
+            on_operation=on_operation,
+            matching_jobs=matching_jobs,
+        )
+
+    return results
+
+
+
+def IsPublishUpToDate(
+    repository,
+    jobs_done_file_contents,
+    url=None,
+    username=None,
+    password=None,
+    record_filename=None,
+    request_log=None,
+    ):
+    '''
+    Checks if jobs of a repository/branch were already published from the same jobs_done file,
+    by the same `GENERATOR_VERSION`, in which case publishing again would change nothing.
+
+    This is much cheaper than generating and comparing all jobs: it reads a local record, or only
+    the description of jobs in Jenkins.
+
+    Jobs in Jenkins are only up to date if all jobs expected for the jobs_done file exist (and no
+    others), and all of them were published from it and are enabled: jobs left behind by a publish
+    cut by a deadline, or disabled by `DisableInactiveJobs`, are published again.
+
+    :param Repository repository:
+        Repository/branch being published.
+
+    :param unicode|None jobs_done_file_contents:
+        Current contents of the jobs_done file.
+
+    :param unicode|None url:
+        URL of a Jenkins server instance. Used when `record_filename` is not given.
+
+    :param unicode|None username:
+        Username for Jenkins server.
+
+    :param unicode|None password:
+        Password for Jenkins server.
+
+    :param unicode|None record_filename:
+        Local record written by `WritePublishRecord`.
+
+    :param JenkinsRequestLog|None request_log:
+        If given, requests made to Jenkins are recorded in it.
+
+    :return bool:
+        True if jobs are up to date.
+    '''
+    from jobs_done10.jobs_done_job import JobsDoneJob
+    from xml.etree import ElementTree
+
+    jobs_done_file_sha = _GetJobsDoneFileSha(jobs_done_file_contents)
+
+    if record_filename is not None:
+        record = _ReadPublishRecord(record_filename)
+        return record.get(_GetPublishRecordKey(repository)) == [jobs_done_file_sha, GENERATOR_VERSION]
+
+    # Names of expected jobs only depend on the matrix, so jobs don't have to be generated
+    expected_jobs = set(
+        JenkinsXmlJobGenerator.GetJobName(repository, jobs_done_job.matrix, jobs_done_job.matrix_row)
+        for jobs_done_job in JobsDoneJob.CreateFromYAML(jobs_done_file_contents, repository)
+    )
+
+    publisher = JenkinsJobPublisher(repository, [], request_log=request_log)
+    jenkins_api = publisher._GetJenkinsApi(url, username, password)
+
+    matching_jobs = publisher._GetMatchingJobs(jenkins_api)
+    if matching_jobs != expected_jobs:
+        return False
+
+    for jenkins_job in matching_jobs:
+        config = publisher._GetJenkinsJobConfig(jenkins_api, jenkins_job)
+        if _ParseJobsDoneMetadata(config) != (jobs_done_file_sha, GENERATOR_VERSION):
+            return False
+
+        if isinstance(config, unicode):
+            config = config.encode('utf-8')
+        if ElementTree.fromstring(config).findtext('disabled') == 'true':
+            return False
+
+    return True
+
+
+
+def WritePublishRecord(repository, jobs_done_file_contents, record_filename):
+    '''
+    Records (in a local file) that jobs for a repository/branch were published from a jobs_done
+    file. .. seealso:: IsPublishUpToDate
+
+    :param Repository repository:
+        Repository/branch published.
+
+    :param unicode|None jobs_done_file_contents:
+        Contents of the jobs_done file published.
+
+    :param unicode record_filename:
+        Record filename (JSON). Records of other repositories/branches in this file are kept.
+    '''
+    import json
+
+    record = _ReadPublishRecord(record_filename)
+    record[_GetPublishRecordKey(repository)] = \
+        [_GetJobsDoneFileSha(jobs_done_file_contents), GENERATOR_VERSION]
+    _CreateFileAtomically(record_filename, json.dumps(record, indent=2, sort_keys=True))
+
+
+
+def _RemovePublishRecords(repositories, record_filename):
+    '''
+    Removes repositories/branches from a publish record, so their jobs are published again even if
+    their jobs_done file did not change. .. seealso:: WritePublishRecord
+
+    :param list(Repository) repositories:
+    :param unicode record_filename:
+    '''
+    import json
+
+    record = _ReadPublishRecord(record_filename)
+    keys = set(_GetPublishRecordKey(repository) for repository in repositories)
+    if keys.isdisjoint(record):
+        return
+
+    for key in keys:
+        record.pop(key, None)
+    _CreateFileAtomically(record_filename, json.dumps(record, indent=2, sort_keys=True))
+
+
+
+def _ReadPublishRecord(record_filename):
+    '''
+    :param unicode record_filename:
+        .. seealso:: WritePublishRecord
+
+    :return dict(unicode,list(unicode)):
+        Maps repository/branch keys to jobs_done file SHA and generator version.
+    '''
+    import json
+    import os
+
+    if not os.path.isfile(record_filename):
+        return {}
+    with open(record_filename, 'rb') as record_file:
+        return json.loads(record_file.read().decode('utf-8'))
+
+
+
+def _GetPublishRecordKey(repository):
+    '''
+    :param Repository repository:
+    :return unicode:
+        Key identifying a repository/branch in publish records.
+    '''
+    return repository.url + ' ' + repository.branch
+
+
+
+def _GetJobsDoneFileSha(jobs_done_file_contents):
+    '''
+    :param unicode|None jobs_done_file_contents:
+    :return unicode|None:
+        Git blob SHA of the jobs_done file, or None if there is no jobs_done file.
+    '''
+    from jobs_done10.git_repository import GetBlobSha
+
+    if jobs_done_file_contents is None:
+        return None
+    return GetBlobSha(jobs_done_file_contents)
+
+
+
+def DeleteOrphanJobs(
+    repository_url,
+    branches,
+    url,
+    username=None,
+    password=None,
+    dry_run=False,
+    max_rate=None,
+    use_script_console=False,
+    force=False,
+    ):
+    '''
+    Deletes jobs created for branches of a repository that do not exist anymore.
+
+    All jobs of the repository are found with a single listing, and grouped by branch.
+
+    :param unicode repository_url:
+        Url of the repository (as used in jobs SCM configuration).
+
+    :param set(unicode) branches:
+        Branches that still exist in that repository.
+
+    :param unicode url:
+        URL of a Jenkins server instance.
+
+    :param unicode|None username:
+        Username for Jenkins server.
+
+    :param unicode|None password:
+        Password for Jenkins server.
+
+    :param bool dry_run:
+        If True, jobs are only listed, not deleted.
+
+    :param float|None max_rate:
+        Maximum number of jobs deleted per second.
+
+    :param bool use_script_console:
+        .. seealso:: JenkinsJobPublisher.PublishToUrl
+
+    :param bool force:
+        If True, jobs are deleted even if `branches` is empty, or if all jobs of the repository
+        would be deleted (which usually means branches were not listed correctly).
+
+    :return dict(unicode,list(unicode)):
+        Maps each branch that does not exist anymore to names of its jobs that were deleted (or would
+        be deleted, in a dry run).
+
+    :raises OrphanJobsSafetyError:
+        If deleting jobs is not safe (.. seealso:: force).
+    '''
+    from jobs_done10.repository import Repository
+
+    publisher = JenkinsJobPublisher(Repository(url=repository_url), [])
+    job_branches = publisher.ListRepositoryJobs(url, username, password, use_script_console)
+
+    orphan_jobs = {}
+    for job_name, branch in job_branches.iteritems():
+        if branch not in branches:
+            orphan_jobs.setdefault(branch, []).append(job_name)
+
+    for branch in orphan_jobs:
+        orphan_jobs[branch].sort()
+
+    if orphan_jobs and not dry_run:
+        if not force:
+            if not branches:
+                raise OrphanJobsSafetyError(
+                    'No branches given for "%s": refusing to delete its jobs' % repository_url)
+            if len(job_branches) == sum(map(len, orphan_jobs.values())):
+                raise OrphanJobsSafetyError(
+                    'All %d jobs of "%s" would be deleted: refusing to delete them' % (
+                        len(job_branches), repository_url))
+
+        publisher.DeleteJobs(sum(orphan_jobs.values(), []), url, username, password, max_rate)
+
+    return orphan_jobs
+
+
+
+class OrphanJobsSafetyError(RuntimeError):
+    '''
+    Raised by `DeleteOrphanJobs` when deleting jobs is not safe.
+    '''
+
+
+
+def DisableInactiveJobs(
+    repository_url,
+    branch_commit_times,
+    url,
+    username=None,
+    password=None,
+    days=90,
+    dry_run=False,
+    use_script_console=False,
+    record_filename=None,
+    ):
+    '''
+    Disables jobs of branches that had no commits in a given number of days, reducing polling load
+    on Jenkins.
+
+    Generated jobs are always enabled, so the next publish for a branch enables its jobs again.
+
+    :param unicode repository_url:
+        Url of the repository (as used in jobs SCM configuration).
+
+    :param dict(unicode,int) branch_commit_times:
+        Maps branch names to the time (seconds since epoch) of their last commit.
+        .. seealso:: jobs_done10.git_repository.GetBranchesCommitTimes
+
+    :param unicode url:
+        URL of a Jenkins server instance.
+
+    :param unicode|None username:
+        Username for Jenkins server.
+
+    :param unicode|None password:
+        Password for Jenkins server.
+
+    :param int days:
+        Branches without commits in this number of days are considered inactive.
+
+    :param bool dry_run:
+        If True, jobs are only listed, not disabled.
+
+    :param bool use_script_console:
+        .. seealso:: JenkinsJobPublisher.PublishToUrl
+
+    :param unicode|None record_filename:
+        Publish record (.. seealso:: WritePublishRecord) where inactive branches are removed from,
+        so publishing them again (e.g. with `IsPublishUpToDate`) enables their jobs.
+
+    :return dict(unicode,list(unicode)):
+        Maps each inactive branch to names of its jobs that were disabled (or would be disabled, in a
+        dry run). Branches that do not exist anymore are not considered (.. seealso:: DeleteOrphanJobs)
+    '''
+    from jobs_done10.repository import Repository
+    import time
+
+    publisher = JenkinsJobPublisher(Repository(url=repository_url), [])
+    job_branches = publisher.ListRepositoryJobs(url, username, password, use_script_console)
+
+    oldest_active_time = time.time() - days * 24 * 60 * 60
+
+    inactive_jobs = {}
+    for job_name, branch in job_branches.iteritems():
+        if branch in branch_commit_times and branch_commit_times[branch] < oldest_active_time:
+            inactive_jobs.setdefault(branch, []).append(job_name)
+
+    for branch in inactive_jobs:
+        inactive_jobs[branch].sort()
+
+    if not dry_run:
+        if record_filename is not None:
+            _RemovePublishRecords(
+                [Repository(url=repository_url, branch=branch) for branch in inactive_jobs],
+                record_filename,
+            )
+        publisher.DisableJobs(sum(inactive_jobs.values(), []), url, username, password)
+
+    return inactive_jobs
+
+
+
+def GetJobsFromDirectory(directory='.', ref=None, object_reader=None):
+    '''
+    Looks in a directory for a jobs_done file and git repository information to create jobs.
+
+    :param directory:
+        Directory where we'll extract information to generate `JenkinsJob`s
+
+    :param unicode|None ref:
+        If given, the jobs_done file is read from this git ref (e.g. "origin/master"), straight
+        from the repository object database, instead of the working tree. Jobs are generated for
+        the branch of `ref`.
+
+    :param GitObjectReader|None object_reader:
+        Reader used to read files from `ref`. Share a reader among calls to read many refs with
+        a single git process.
+
+    :return tuple(Repository,set(JenkinsJob))
+        Repository information for the given directory, and jobs obtained from this directory.
+
+        .. seealso:: GetJobsFromFile
+    '''
+    repository, jobs = IterJobsFromDirectory(directory, ref, object_reader)
+    return repository, list(jobs)
+
+
+
+def IterJobsFromDirectory(directory='.', ref=None, object_reader=None):
+    '''
+    Same as `GetJobsFromDirectory`, but jobs are generated one by one, as they are consumed.
+
+    :param directory:
+    :param ref:
+    :param object_reader:
+        .. seealso:: GetJobsFromDirectory
+
+    :return tuple(Repository,iter(JenkinsJob))
+    '''
+    repository, jobs_done_file_contents = _ReadDirectory(directory, ref, object_reader)
+    return repository, IterJobsFromFile(repository, jobs_done_file_contents)
+
+
+
+def _ReadDirectory(directory, ref=None, object_reader=None):
+    '''
+    Reads git repository information and jobs_done file contents from a directory.
+
+    :param unicode directory:
+        Directory of a git repository.
+
+    :param unicode|None ref:
+    :param GitObjectReader|None object_reader:
+        .. seealso:: GetJobsFromDirectory
+
+    :return tuple(Repository,unicode|None):
+        Repository information, and jobs_done file contents (None if there is no jobs_done file).
+    '''
+    from ben10.filesystem import FileNotFoundError, GetFileContents
+    from jobs_done10.git_repository import (GetBranchFromRefName, GetCurrentBranch, GetRemoteUrl,
+        GitObjectReader)
+    from jobs_done10.jobs_done_job import JOBS_DONE_FILENAME
+    from jobs_done10.repository import Repository
+    import os
+
+    if ref is not None:
+        if object_reader is None:
+            with GitObjectReader(directory) as object_reader:
+                return _ReadDirectory(directory, ref, object_reader)
+
+        if object_reader.ResolveRef(ref) is None:
+            raise ValueError('Unknown git ref: "%s"' % ref)
+
+        repository = Repository(url=GetRemoteUrl(directory), branch=GetBranchFromRefName(ref))
+        jobs_done_file = object_reader.ReadFile(ref, JOBS_DONE_FILENAME)
+        if jobs_done_file is None:
+            return repository, None
+        return repository, jobs_done_file[1]
+
+    branch = GetCurrentBranch(directory)
+    if branch is None:
+        # Detached HEAD, let gitit find out which branch is checked out
+        from gitit.git import Git
+        branch = Git().GetCurrentBranch(repo_path=directory)
+
+    repository = Repository(url=GetRemoteUrl(directory), branch=branch)
+
+    try:
+        jobs_done_file_contents = GetFileContents(os.path.join(directory, JOBS_DONE_FILENAME))
+    except FileNotFoundError:
+        jobs_done_file_contents = None
+
+    return repository, jobs_done_file_contents
+
+
+
+def IterJobsFromAllBranches(directory='.', object_reader=None, shard=None):
+    '''
+    Creates jobs for every branch of a repository, reading jobs_done files straight from git.
+
+    Branches are grouped by the blob of their jobs_done file, so each distinct file is parsed only
+    once, and then used to create jobs for all branches that share it (rendering jobs only once
+    when possible, .. seealso:: JenkinsBranchJobsCache).
+
+    :param unicode directory:
+        Directory of a git repository (working copy, mirror or bare clone).
+
+    :param GitObjectReader|None object_reader:
+        .. seealso:: GetJobsFromDirectory
+
+    :param JenkinsShard|None shard:
+        If given, only branches whose job group belongs to this shard are considered.
+
+    :return iter(tuple(Repository,list(JenkinsJob))):
+        Repository information and jobs for each branch (sorted by name). Branches without a
+        jobs_done file have no jobs.
+    '''
+    from jobs_done10.git_repository import GetRemoteUrl, GitObjectReader, ListBranchRefs
+    from jobs_done10.jobs_done_job import JOBS_DONE_FILENAME, JobsDoneJob
+    from jobs_done10.repository import Repository
+
+    if object_reader is None:
+        with GitObjectReader(directory) as object_reader:
+            for branch_jobs in IterJobsFromAllBranches(directory, object_reader, shard):
+                yield branch_jobs
+        return
+
+    repository_url = GetRemoteUrl(directory)
+
+    # Group branches by jobs_done file blob (None for branches without jobs_done file)
+    branch_shas = {}
+    contents_by_sha = {None : None}
+    for branch, ref in ListBranchRefs(directory).iteritems():
+        if shard is not None and \
+                not shard.ContainsRepository(Repository(url=repository_url, branch=branch)):
+            continue
+
+        jobs_done_file = object_reader.ReadFile(ref, JOBS_DONE_FILENAME)
+        if jobs_done_file is None:
+            branch_shas[branch] = None
+        else:
+            branch_shas[branch] = jobs_done_file[0]
+            contents_by_sha[jobs_done_file[0]] = jobs_done_file[1]
+
+    parsed_files = {}
+    jobs_cache = JenkinsBranchJobsCache()
+    for branch in sorted(branch_shas):
+        sha = branch_shas[branch]
+        if sha not in parsed_files:
+            parsed_files[sha] = JobsDoneJob.ParseYAML(contents_by_sha[sha])
+
+        repository = Repository(url=repository_url, branch=branch)
+        yield repository, jobs_cache.GetJobs(repository, parsed_files[sha], sha)
+
+
+
+def GetJobsFromFile(repository, jobs_done_file_contents):
+    '''
+    Creates jobs from repository information and a jobs_done file.
+
+    :param Repository repository:
+        .. seealso:: Repository
+
+    :param unicode|None jobs_done_file_contents:
+        .. seealso:: JobsDoneJob.CreateFromYAML
+
+    :return list(JenkinsJob):
+        Jobs created, in the order of the matrix rows.
+    '''
+    return list(IterJobsFromFile(repository, jobs_done_file_contents))
+
+
+
+def IterJobsFromFile(repository, jobs_done_file_contents):
+    '''
+    Same as `GetJobsFromFile`, but jobs are generated one by one, as they are consumed.
+
+    :param Repository repository:
+    :param unicode|None jobs_done_file_contents:
+        .. seealso:: GetJobsFromFile
+
+    :return iter(JenkinsJob):
+        The jobs_done file is parsed right away, but each job is only generated when consumed.
+    '''
+    from jobs_done10.jobs_done_job import JobsDoneJob
+
+    jobs_done_jobs = JobsDoneJob.CreateFromYAML(jobs_done_file_contents, repository)
+    return _IterJobsFromJobsDoneJobs(jobs_done_jobs, _GetJobsDoneFileSha(jobs_done_file_contents))
+
+
+
+def _GenerateJobTuples(repository_url, branch, jobs_done_file_contents):
+    '''
+    Same as `GetJobsFromFile`, returning only names and xmls of jobs. Run in worker processes
+    (.. seealso:: jobs_done10.jenkins_session.JenkinsSession.worker_pool).
+
+    :param unicode repository_url:
+    :param unicode branch:
+        .. seealso:: Repository
+
+    :param unicode|None jobs_done_file_contents:
+        .. seealso:: GetJobsFromFile
+
+    :return list(tuple(unicode,unicode)):
+        Name and xml of each job.
+    '''
+    from jobs_done10.repository import Repository
+
+    repository = Repository(url=repository_url, branch=branch)
+    return [
+        (job.name, job.xml) for job in IterJobsFromFile(repository, jobs_done_file_contents)]
+
+
+
+def _IterJobsFromJobsDoneJobs(jobs_done_jobs, jobs_done_file_sha=None):
+    '''
+    :param list(JobsDoneJob) jobs_done_jobs:
+        Parsed jobs_done jobs.
+
+    :param unicode|None jobs_done_file_sha:
+        .. seealso:: JenkinsXmlJobGenerator.SetJobsDoneFileSha
+
+    :yield JenkinsJob:
+        One job for each of `jobs_done_jobs`.
+    '''
+    from jobs_done10 import metrics
+    from jobs_done10.job_generator import JobGeneratorConfigurator
+
+    jenkins_generator = JenkinsXmlJobGenerator()
+    jenkins_generator.SetJobsDoneFileSha(jobs_done_file_sha)
+    for jobs_done_job in jobs_done_jobs:
+        with metrics.GENERATE_DURATION.Time():
+            JobGeneratorConfigurator.Configure(jenkins_generator, jobs_done_job)
+            jenkins_job = jenkins_generator.GetJob()
+        yield jenkins_job
+
+
+
+#===================================================================================================
+# Job streams
+#===================================================================================================
+# Formats accepted by WriteJobsToArchive
+ARCHIVE_FORMATS = ('tar', 'tar.gz', 'zip')
+
+def WriteJobsToArchive(jobs, output_filename, archive_format):
+    '''
+    Writes jobs to a single archive, one entry (named after the job) per job.
+
+    Jobs are written as they are obtained from `jobs`, so generation and writing are interleaved
+    and the archive can be read in a single sequential pass.
+
+    :param iter(JenkinsJob) jobs:
+        Jobs to write.
+
+    :param unicode output_filename:
+        Archive filename.
+
+    :param unicode archive_format:
+        One of `ARCHIVE_FORMATS`.
+
+    :return int:
+        Number of jobs written.
+    '''
+    from StringIO import StringIO
+    import contextlib
+    import tarfile
+    import time
+    import zipfile
+
+    if archive_format not in ARCHIVE_FORMATS:
+        raise ValueError(
+            'Unknown archive format "%s", expected one of: %s' % (archive_format, ', '.join(ARCHIVE_FORMATS)))
+
+    count = 0
+    if archive_format == 'zip':
+        with contextlib.closing(zipfile.ZipFile(output_filename, 'w', zipfile.ZIP_DEFLATED)) as archive:
+            for job in jobs:
+                archive.writestr(job.name, job.xml.encode('utf-8'))
+                count += 1
+    else:
+        mode = 'w:gz' if archive_format == 'tar.gz' else 'w'
+        with contextlib.closing(tarfile.open(output_filename, mode)) as archive:
+            for job in jobs:
+                contents = job.xml.encode('utf-8')
+                info = tarfile.TarInfo(job.name)
+                info.size = len(contents)
+                info.mtime = time.time()
+                archive.addfile(info, StringIO(contents))
+                count += 1
+
+    return count
+
+
+
+def WriteJobsToJsonLines(jobs, stream):
+    '''
+    Writes jobs to a stream in JSON Lines format: one JSON object with "name" and "xml" per line.
+
+    Each line is flushed as soon as its job is generated.
+
+    :param iter(JenkinsJob) jobs:
+        Jobs to write.
+
+    :param file stream:
+        Output stream.
+
+    :return int:
+        Number of jobs written.
+    '''
+    import json
+
+    count = 0
+    for job in jobs:
+        stream.write(json.dumps({'name' : job.name, 'xml' : job.xml}) + '\n')
+        stream.flush()
+        count += 1
+    return count
+
+
+
+#===================================================================================================
+# ConfigureCommandLineInterface
+#===================================================================================================
+def ConfigureCommandLineInterface(jobs_done_application):
+    '''
+    Configures additional command line commands to the jobs_done application.
+
+    :param App jobs_done_application:
+        Command line application we are registering commands to.
+    '''
+    from jobs_done10.jenkins_batch import BATCH_PARALLEL
+
+    def _PrintPublishEvent(console_, event):
+        '''
+        Prints a `JenkinsPublishEvent` as soon as it happens, with a progress count.
+        '''
+        label = {
+            JenkinsPublishEvent.NEW : '<green>NEW</>',
+            JenkinsPublishEvent.UPDATED : '<yellow>UPD</>',
+            JenkinsPublishEvent.DELETED : '<red>DEL</>',
+        }[event.action]
+        console_.Print('[%d/%d] %s - %s (%.2fs)' % (
+            event.index, event.total, label, event.job_name, event.latency))
+
+
+    def _PrintPublishPlan(console_, plan):
+        '''
+        Prints a `JenkinsPublishPlan`, including diffs of updated jobs.
+        '''
+        for job in plan.new:
+            console_.Print('<green>NEW</> - ' + job)
+        for job in plan.updated:
+            console_.Print('<yellow>UPD</> - ' + job)
+            for line in plan.diffs[job].splitlines():
+                console_.Print('    ' + line)
+        for job in plan.deleted:
+            console_.Print('<red>DEL</> - ' + job)
+        console_.Print('%d unchanged' % len(plan.unchanged))
+
+    def _WatchJobs(console_, output):
+        '''
+        Updates jobs in `output` whenever the jobs_done file changes, until interrupted.
+        '''
+        from jobs_done10.jenkins_watcher import JenkinsJobsWatcher
+        import time
+
+        console_.Print('Watching jobs_done file, saving jobs in "%s" (Ctrl+C to stop)' % output)
+
+        watcher = JenkinsJobsWatcher('.', output)
+        try:
+            while True:
+                try:
+                    cycle = watcher.Update()
+                except Exception as e:
+                    # Keep watching, the file is probably being edited
+                    console_.Print('<red>ERROR</> - %s' % e)
+                    cycle = None
+
+                if cycle is not None:
+                    for job in cycle.new:
+                        console_.Print('<green>NEW</> - ' + job)
+                    for job in cycle.updated:
+                        console_.Print('<yellow>UPD</> - ' + job)
+                    for job in cycle.deleted:
+                        console_.Print('<red>DEL</> - ' + job)
+                    console_.Print(
+                        '%d unchanged, %d generated '
+                        '(parse: %.3fs, generate: %.3fs, write: %.3fs)' % (
+                            len(cycle.unchanged),
+                            cycle.generated,
+                            cycle.parse_time,
+                            cycle.generate_time,
+                            cycle.write_time,
+                        )
+                    )
+
+                time.sleep(JenkinsJobsWatcher.POLL_INTERVAL)
+        except KeyboardInterrupt:
+            pass
+
+
+    @jobs_done_application
+    def jenkins(
+        console_,
+        url,
+        username=None,
+        password=None,
+        deadline=None,
+        plan=False,
+        skip_unchanged=False,
+        record=None,
+        request_log=None,
+        ref=None,
+        all_branches=False,
+        shard=None,
+        metrics=None,
+        use_script_console=False,
+        ):
+        '''
+        Creates jobs for Jenkins and push them to a Jenkins instance.
+
+        If no parameters are given, this command will look for a configuration file that defines a
+        target url/username/password.
+
+        :param url: Jenkins instance URL where jobs will be uploaded to.
+
+        :param username: Jenkins username.
+
+        :param password: Jenkins password.
+
+        :param deadline: Time budget (in seconds) for the whole command. Operations still pending
+            when it is over are skipped, and reported.
+
+        :param plan: Only show which jobs would be created, updated (with a diff of their
+            configuration) and deleted, without making any changes in Jenkins.
+
+        :param skip_unchanged: Do nothing if jobs were already published from the same jobs_done
+            file (checked reading a single job from Jenkins, or `record`).
+
+        :param record: Local file recording jobs_done files published for each repository/branch.
+
+        :param request_log: File where every request made to Jenkins is logged (JSON lines),
+            followed by a summary of latencies.
+
+        :param ref: Git ref (e.g. "origin/master") to read the jobs_done file from, instead of the
+            working tree. Jobs are published for the branch of this ref.
+
+        :param all_branches: Publish jobs for every branch of the repository, reading jobs_done
+            files straight from git. Can't be combined with `plan`, `skip_unchanged`, `record` or
+            `ref`.
+
+        :param shard: Only publish (and delete) jobs of branches in this shard, given as
+            "index/count" (e.g. "2/4"). Workers running all shards cover every branch exactly once.
+
+        :param metrics: File where metrics are written in Prometheus text format when the command
+            finishes (e.g. in the directory read by node exporter's textfile collector).
+
+        :param use_script_console: Obtain SCM information of all jobs with a single request to
+            Jenkins script console, instead of fetching the config.xml of each job.
+        '''
+        from jobs_done10.deadline import DEADLINE_EXCEEDED_EXIT_CODE, Deadline, DeadlineExceededError
+        from jobs_done10.jobs_done_job import JobsDoneJob
+        from jobs_done10.metrics import REGISTRY
+
+        if all_branches and (plan or skip_unchanged or record is not None or ref is not None):
+            console_.Print(
+                '<red>all_branches can\'t be combined with plan, skip_unchanged, record or ref</>')
+            return 1
+
+        try:
+            jenkins_shard = JenkinsShard.CreateFromString(shard) if shard is not None else None
+        except ValueError as e:
+            console_.Print('<red>%s</>' % e)
+            return 1
+
+        console_.Print('Publishing jobs in "<white>%s</>"' % url)
+
+        jenkins_request_log = None
+        if request_log is not None:
+            jenkins_request_log = JenkinsRequestLog(open(request_log, 'wb'))
+
+        deadline = Deadline(float(deadline) if deadline is not None else None)
+        try:
+            if all_branches:
+                UploadJobsFromAllBranches(
+                    '.',
+                    url,
+                    username,
+                    password,
+                    use_script_console=use_script_console,
+                    deadline=deadline,
+                    on_operation=lambda event: _PrintPublishEvent(console_, event),
+                    request_log=jenkins_request_log,
+                    shard=jenkins_shard,
+                )
+                return
+
+            deadline.AddOperations([
+                'read git repository', 'parse jobs_done file', 'generate jobs', 'list jenkins jobs'])
+            repository, jobs_done_file_contents = deadline.Run(
+                'read git repository', _ReadDirectory, '.', ref)
+
+            if jenkins_shard is not None and not jenkins_shard.ContainsRepository(repository):
+                console_.Print('Jobs of "%s" belong to another shard' % (
+                    JenkinsXmlJobGenerator.GetJobGroup(repository)))
+                return
+
+            if skip_unchanged and not plan:
+                up_to_date = deadline.Run(
+                    'check published jobs_done file',
+                    IsPublishUpToDate,
+                    repository,
+                    jobs_done_file_contents,
+                    url,
+                    username,
+                    password,
+                    record_filename=record,
+                    request_log=jenkins_request_log,
+                )
+                if up_to_date:
+                    console_.Print('Jobs are up to date')
+                    return
+
+            # Jenkins jobs are listed in background, while jobs are parsed and generated
+            publisher = JenkinsJobPublisher(repository, [], request_log=jenkins_request_log)
+            publisher.PrefetchUrl(
+                url, username, password, use_script_console=use_script_console, deadline=deadline)
+
+            jobs_done_jobs = deadline.Run(
+                'parse jobs_done file', JobsDoneJob.CreateFromYAML, jobs_done_file_contents, repository)
+            publisher.SetJobs(deadline.Run(
+                'generate jobs',
+                lambda: list(_IterJobsFromJobsDoneJobs(
+                    jobs_done_jobs, _GetJobsDoneFileSha(jobs_done_file_contents))),
+            ))
+
+            if plan:
+                _PrintPublishPlan(console_, publisher.PlanUrl(
+                    url,
+                    username,
+                    password,
+                    use_script_console=use_script_console,
+                    deadline=deadline,
+                ))
+                return
+
+            # Only a publish that finishes is recorded: a publish cut by the deadline must not
+            # leave behind a record of previous jobs
+            if record is not None:
+                _RemovePublishRecords([repository], record)
+            publisher.PublishToUrl(
+                url,
+                username,
+                password,
+                use_script_console=use_script_console,
+                deadline=deadline,
+                on_operation=lambda event: _PrintPublishEvent(console_, event),
+            )
+            if record is not None:
+                WritePublishRecord(repository, jobs_done_file_contents, record)
+        except DeadlineExceededError as e:
+            console_.Print('<red>Deadline exceeded</>')
+            for operation in e.finished_operations:
+                console_.Print('<green>DONE</> - ' + operation)
+            for operation in e.skipped_operations:
+                console_.Print('<red>SKIP</> - ' + operation)
+            return DEADLINE_EXCEEDED_EXIT_CODE
+        finally:
+            if jenkins_request_log is not None:
+                jenkins_request_log.WriteSummary()
+                jenkins_request_log.stream.close()
+                for line in jenkins_request_log.FormatSummary():
+                    console_.Print(line)
+            if metrics is not None:
+                REGISTRY.WriteTextFile(metrics)
+
+
+    @jobs_done_application
+    def jenkins_batch(
+        console_,
+        url,
+        manifest,
+        username=None,
+        password=None,
+        parallel=BATCH_PARALLEL,
+        summary=None,
+        request_log=None,
+        shard=None,
+        metrics=None,
+        isolate=False,
+        ):
+        '''
+        Creates jobs for many repositories and push them to a Jenkins instance, in a single run.
+
+        :param url: Jenkins instance URL where jobs will be uploaded to.
+
+        :param manifest: File listing repositories to publish (a YAML list of repository
+            directories, or of mappings with "directory", "ref", "url" and "branch").
+
+        :param username: Jenkins username.
+
+        :param password: Jenkins password.
+
+        :param parallel: Maximum number of repositories published at the same time.
+
+        :param summary: File where a JSON summary of the result of each repository is written, or
+            "-" to write it to stdout.
+
+        :param request_log: File where every request made to Jenkins is logged (JSON lines),
+            followed by a summary of latencies.
+
+        :param shard: Only publish (and delete) jobs of repositories in this shard, given as
+            "index/count" (e.g. "2/4").
+
+        :param metrics: File where metrics are written in Prometheus text format when the command
+            finishes (e.g. in the directory read by node exporter's textfile collector).
+
+        :param isolate: Parse jobs_done files (and generate jobs) in worker processes, with limited
+            CPU time, memory and wall-clock time, so a single file can't exhaust resources used to
+            publish all repositories.
+        '''
+        from jobs_done10.jenkins_batch import (ReadBatchManifest, UploadJobsFromManifest,
+            WriteBatchSummary)
+        from jobs_done10.metrics import REGISTRY
+        from jobs_done10.worker_pool import WorkerPool
+        import sys
+
+        try:
+            jenkins_shard = JenkinsShard.CreateFromString(shard) if shard is not None else None
+        except ValueError as e:
+            console_.Print('<red>%s</>' % e)
+            return 1
+
+        entries = ReadBatchManifest(manifest)
+        console_.Print('Publishing jobs of %d repositories in "<white>%s</>"' % (len(entries), url))
+
+        def _PrintResult(result):
+            if result.error is not None:
+                console_.Print('<red>ERROR</> - %s: %s' % (result.entry.directory, result.error))
+                return
+            if result.skipped:
+                console_.Print('SKIP - %s (branch "%s"): another shard' % (
+                    result.repository.url, result.repository.branch))
+                return
+            if result.superseded:
+                console_.Print('SKIP - %s (branch "%s"): superseded by a later entry' % (
+                    result.repository.url, result.repository.branch))
+                return
+            console_.Print(
+                '<green>OK</> - %s (branch "%s"): %d new, %d updated, %d deleted (%.2fs)' % (
+                    result.repository.url,
+                    result.repository.branch,
+                    len(result.new),
+                    len(result.updated),
+                    len(result.deleted),
+                    result.time,
+                )
+            )
+
+        jenkins_request_log = None
+        if request_log is not None:
+            jenkins_request_log = JenkinsRequestLog(open(request_log, 'wb'))
+
+        worker_pool = WorkerPool(processes=int(parallel)) if isolate else None
+        try:
+            if worker_pool is not None:
+                worker_pool.Start()  # Before publishing starts threads
+            results = UploadJobsFromManifest(
+                entries,
+                url,
+                username,
+                password,
+                parallel=int(parallel),
+                on_result=_PrintResult,
+                request_log=jenkins_request_log,
+                shard=jenkins_shard,
+                worker_pool=worker_pool,
+            )
+        finally:
+            if worker_pool is not None:
+                worker_pool.Close()
+            if jenkins_request_log is not None:
+                jenkins_request_log.WriteSummary()
+                jenkins_request_log.stream.close()
+                for line in jenkins_request_log.FormatSummary():
+                    console_.Print(line)
+            if metrics is not None:
+                REGISTRY.WriteTextFile(metrics)
+
+        if summary == '-':
+            WriteBatchSummary(results, sys.stdout)
+        elif summary is not None:
+            with open(summary, 'wb') as stream:
+                WriteBatchSummary(results, stream)
+
+        errors = [result for result in results if result.error is not None]
+        if errors:
+            console_.Print('<red>%d of %d repositories failed</>' % (len(errors), len(results)))
+            return 1
+
+
+    @jobs_done_application
+    def serve(
+        console_,
+        url,
+        mirrors,
+        username=None,
+        password=None,
+        host='',
+        port=8080,
+        workers=2,
+        debounce=5,
+        secret=None,
+        isolate=False,
+        ):
+        '''
+        Starts a server that publishes jobs of branches as soon as they are pushed, receiving push
+        notifications (webhooks) from GitHub or Bitbucket.
+
+        Pushed branches are fetched into local mirrors, and their jobs published. State (Jenkins
+        connections, job index, parsed jobs_done files) is kept between pushes.
+
+        :param url: Jenkins instance URL where jobs will be uploaded to.
+
+        :param mirrors: Directory with local mirrors (or clones) of repositories.
+
+        :param username: Jenkins username.
+
+        :param password: Jenkins password.
+
+        :param host: Host (interface) where the server listens.
+
+        :param port: Port where the server listens.
+
+        :param workers: Number of branches published at the same time.
+
+        :param debounce: Seconds to wait for more pushes of a branch before publishing it.
+
+        :param secret: Secret shared with GitHub/Bitbucket, to only accept signed payloads.
+
+        :param isolate: Parse jobs_done files (and generate jobs) in worker processes, with limited
+            CPU time, memory and wall-clock time, so a single pushed file can't exhaust resources
+            used to publish all repositories.
+        '''
+        from jobs_done10.jenkins_session import JenkinsSession, UploadJobsFromMirror
+        from jobs_done10.scheduler import RegenerationScheduler
+        from jobs_done10.webhook import MirrorIndex, WebhookServer
+        from jobs_done10.worker_pool import WorkerPool
+        import threading
+        import time
+
+        log_lock = threading.Lock()
+        def _Log(message):
+            with log_lock:
+                console_.Print(message)
+
+        worker_pool = WorkerPool(processes=int(workers)) if isolate else None
+        if worker_pool is not None:
+            worker_pool.Start()  # Before starting any threads
+        session = JenkinsSession(url, username, password, worker_pool=worker_pool)
+
+        def _Regenerate(key):
+            mirror_path, branch = key
+            repository, (new_jobs, updated_jobs, deleted_jobs) = \
+                UploadJobsFromMirror(session, mirror_path, branch)
+            _Log('%s (branch "%s"): %d new, %d updated, %d deleted' % (
+                repository.url, branch, len(new_jobs), len(updated_jobs), len(deleted_jobs)))
+
+        def _OnError(key, error):
+            mirror_path, branch = key
+            _Log('<red>ERROR</> - %s (branch "%s"): %s' % (mirror_path, branch, error))
+
+        # Ready as soon as Jenkins jobs are listed (retrying while Jenkins can't be reached)
+        ready = threading.Event()
+        def _WarmUp():
+            while True:
+                try:
+                    session.GetJobNames()
+                except Exception as e:
+                    _Log('<red>ERROR</> - listing jobs in "%s": %s' % (url, e))
+                    time.sleep(10)
+                else:
+                    ready.set()
+                    return
+        warm_up_thread = threading.Thread(target=_WarmUp)
+        warm_up_thread.daemon = True
+        warm_up_thread.start()
+
+        mirror_index = MirrorIndex(mirrors)
+        _Log('%d mirrors in "%s"' % (mirror_index.Refresh(), mirrors))
+
+        scheduler = RegenerationScheduler(
+            _Regenerate,
+            workers=int(workers),
+            max_per_master=int(workers),
+            debounce=float(debounce),
+            on_error=_OnError,
+        )
+        server = WebhookServer(
+            (host, int(port)),
+            mirror_index,
+            scheduler,
+            secret=secret,
+            is_ready=ready.is_set,
+            log=_Log,
+        )
+
+        scheduler.Start()
+        _Log('Listening on port %d, publishing jobs in "<white>%s</>"' % (
+            server.server_address[1], url))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            scheduler.Stop()
+            if worker_pool is not None:
+                worker_pool.Close()
+
+
+    @jobs_done_application
+    def gc(
+        console_,
+        url,
+        mirror,
+        username=None,
+        password=None,
+        repository_url=None,
+        dry_run=False,
+        max_rate=None,
+        use_script_console=False,
+        force=False,
+        ):
+        '''
+        Deletes jobs of branches that do not exist anymore in a repository.
+
+        :param url: Jenkins instance URL.
+
+        :param mirror: Path to a local mirror (or bare clone) of the repository, used to list
+            existing branches.
+
+        :param username: Jenkins username.
+
+        :param password: Jenkins password.
+
+        :param repository_url: Repository url used in jobs. Defaults to the url of "origin" in
+            `mirror`.
+
+        :param dry_run: Only show jobs that would be deleted.
+
+        :param max_rate: Maximum number of jobs deleted per second.
+
+        :param use_script_console: Obtain SCM information of all jobs with a single request to
+            Jenkins script console, instead of fetching the config.xml of each job.
+
+        :param force: Delete jobs even if no branches were found in `mirror`, or if all jobs of the
+            repository would be deleted.
+        '''
+        from jobs_done10.git_repository import GetRemoteUrl, ListBranches
+
+        if repository_url is None:
+            repository_url = GetRemoteUrl(mirror)
+
+        try:
+            orphan_jobs = DeleteOrphanJobs(
+                repository_url,
+                ListBranches(mirror),
+                url,
+                username,
+                password,
+                dry_run=dry_run,
+                max_rate=float(max_rate) if max_rate is not None else None,
+                use_script_console=use_script_console,
+                force=force,
+            )
+        except OrphanJobsSafetyError as e:
+            console_.Print('<red>%s (use --force to delete them anyway)</>' % e)
+            return 1
+
+        label = 'DRY' if dry_run else '<red>DEL</>'
+        for branch, job_names in sorted(orphan_jobs.iteritems()):
+            for job_name in job_names:
+                console_.Print('%s - %s (branch "%s")' % (label, job_name, branch))
+
+
+    @jobs_done_application
+    def disable_inactive(
+        console_,
+        url,
+        repository_path,
+        days=90,
+        username=None,
+        password=None,
+        repository_url=None,
+        dry_run=False,
+        record=None,
+        ):
+        '''
+        Disables jobs of branches without commits in a number of days. Jobs are enabled again the
+        next time their branch is published.
+
+        :param url: Jenkins instance URL.
+
+        :param repository_path: Path to a local clone or mirror of the repository, used to find
+            the last commit in each branch.
+
+        :param days: Branches without commits in this number of days are considered inactive.
+
+        :param username: Jenkins username.
+
+        :param password: Jenkins password.
+
+        :param repository_url: Repository url used in jobs. Defaults to the url of "origin" in
+            `repository_path`.
+
+        :param dry_run: Only show jobs that would be disabled.
+
+        :param record: Local publish record (.. seealso:: jenkins) where inactive branches are
+            removed from, so they are published again.
+        '''
+        from jobs_done10.git_repository import GetBranchesCommitTimes, GetRemoteUrl
+
+        if repository_url is None:
+            repository_url = GetRemoteUrl(repository_path)
+
+        inactive_jobs = DisableInactiveJobs(
+            repository_url,
+            GetBranchesCommitTimes(repository_path),
+            url,
+            username,
+            password,
+            days=int(days),
+            dry_run=dry_run,
+            record_filename=record,
+        )
+
+        label = 'DRY' if dry_run else '<yellow>OFF</>'
+        for branch, job_names in sorted(inactive_jobs.iteritems()):
+            for job_name in job_names:
+                console_.Print('%s - %s (branch "%s")' % (label, job_name, branch))
+
+
+    @jobs_done_application
+    def jenkins_test(
+        console_, output_directory, output_format='directory', ref=None, watch=False, shard=None):
+        '''
+        Creates jobs for Jenkins and save the resulting .xml's in a directory, or stream them to a
+        single file.
+
+        :param output_directory: Directory to output job xmls instead of uploading to `url`.
+            For archive formats, the archive filename. For "jsonl", the output filename, or "-" to
+            write to stdout.
+
+        :param output_format: Either "directory", "jsonl" or an archive format ("tar", "tar.gz" or
+            "zip").
+
+        :param ref: Git ref (e.g. "origin/master") to read the jobs_done file from, instead of the
+            working tree.
+
+        :param watch: Keep running, updating jobs in `output_directory` each time the jobs_done
+            file changes (only jobs that changed are generated and written again). Only for the
+            "directory" format, reading the working tree.
+
+        :param shard: Only create jobs if their branch is in this shard, given as "index/count"
+            (e.g. "2/4").
+        '''
+        import sys
+
+        # Not only directories, depending on `output_format` (the argument keeps its original name)
+        output = output_directory
+
+        if watch:
+            if output_format != 'directory' or ref is not None:
+                console_.Print(
+                    '<red>watch is only available for "directory" format, without ref</>')
+                return 1
+            _WatchJobs(console_, output)
+            return
+
+        try:
+            jenkins_shard = JenkinsShard.CreateFromString(shard) if shard is not None else None
+        except ValueError as e:
+            console_.Print('<red>%s</>' % e)
+            return 1
+
+        # Jobs are only generated when consumed
+        repository, jobs = IterJobsFromDirectory(ref=ref)
+        if jenkins_shard is not None and not jenkins_shard.ContainsRepository(repository):
+            console_.Print('Jobs of "%s" belong to another shard' % (
+                JenkinsXmlJobGenerator.GetJobGroup(repository)))
+            return
+
+        if output_format == 'jsonl':
+            if output == '-':
+                WriteJobsToJsonLines(jobs, sys.stdout)
+            else:
+                with open(output, 'wb') as stream:
+                    WriteJobsToJsonLines(jobs, stream)
+            return
+
+        console_.Print('Saving jobs in "%s"' % output)
+
+        if output_format != 'directory':
+            count = WriteJobsToArchive(jobs, output, output_format)
+            console_.Print('%d jobs' % count)
+            console_.ProgressOk()
+            return
+
+        publisher = JenkinsJobPublisher(repository, list(jobs))
+        new_jobs, updated_jobs, unchanged_jobs, deleted_jobs = \
+            publisher.PublishToDirectory(output)
+
+        for job in new_jobs:
+            console_.Print('<green>NEW</> - ' + job)
+        for job in updated_jobs:
+            console_.Print('<yellow>UPD</> - ' + job)
+        for job in deleted_jobs:
+            console_.Print('<red>DEL</> - ' + job)
+        console_.Print('%d unchanged' % len(unchanged_jobs))
 
         console_.ProgressOk()
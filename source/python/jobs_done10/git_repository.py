@@ -0,0 +1,572 @@
+'''
+Helpers to read information from local git repositories (working copies, mirrors or bare clones).
+'''
+from __future__ import unicode_literals
+
+
+
+def ListBranches(repo_path):
+    '''
+    Lists branches of a local repository.
+
+    For mirrors and bare clones, these are the local branches. For regular clones, these are the
+    branches of the "origin" remote (local branches may have never been pushed, and are ignored).
+
+    :param unicode repo_path:
+        Path to a local git repository.
+
+    :return set(unicode):
+        Branch names (without "refs/heads/" or "origin/" prefixes).
+    '''
+    return set(ListBranchRefs(repo_path))
+
+
+
+def ListBranchRefs(repo_path):
+    '''
+    Lists branches of a local repository, with the ref that should be read for each one.
+
+    :param unicode repo_path:
+        .. seealso:: ListBranches
+
+    :return dict(unicode,unicode):
+        Maps branch names (.. seealso:: ListBranches) to full ref names.
+    '''
+    branch_refs = {}
+    output = _ExecuteGit(
+        repo_path, ['for-each-ref', '--format=%(refname)'] + _GetBranchRefPatterns(repo_path))
+    for ref in output.splitlines():
+        branch = _GetBranchFromRef(ref)
+        if branch is not None:
+            branch_refs[branch] = ref
+    return branch_refs
+
+
+
+def GetBranchesCommitTimes(repo_path):
+    '''
+    Obtains the time of the last commit in each branch of a local repository.
+
+    :param unicode repo_path:
+        .. seealso:: ListBranches
+
+    :return dict(unicode,int):
+        Maps branch names (.. seealso:: ListBranches) to the commit time (seconds since epoch) of
+        their last commit.
+    '''
+    output = _ExecuteGit(
+        repo_path,
+        ['for-each-ref', '--format=%(refname) %(committerdate:raw)'] +
+        _GetBranchRefPatterns(repo_path),
+    )
+
+    commit_times = {}
+    for line in output.splitlines():
+        # Refs not pointing to commits (e.g. annotated tags) have no committer date
+        parts = line.rsplit(' ', 2)
+        if len(parts) != 3 or not parts[1].isdigit():
+            continue
+        ref, commit_time, _timezone = parts
+        branch = _GetBranchFromRef(ref)
+        if branch is not None:
+            commit_times[branch] = int(commit_time)
+    return commit_times
+
+
+
+def FetchBranch(repo_path, branch):
+    '''
+    Updates a single branch of a local repository from "origin".
+
+    :param unicode repo_path:
+        .. seealso:: ListBranches
+
+    :param unicode branch:
+        Branch name.
+
+    :return unicode|None:
+        Ref where `branch` was fetched ("refs/heads/<branch>" for mirrors and bare clones,
+        "refs/remotes/origin/<branch>" for regular clones), or None if `branch` does not exist in
+        "origin" anymore (its ref is deleted too).
+    '''
+    if _IsBareRepository(repo_path):
+        ref = 'refs/heads/' + branch
+    else:
+        ref = 'refs/remotes/origin/' + branch
+
+    remote_ref = 'refs/heads/' + branch
+    remote_refs = [
+        line.split('\t')[-1]
+        for line in _ExecuteGit(repo_path, ['ls-remote', 'origin', remote_ref]).splitlines()
+    ]
+    if remote_ref not in remote_refs:
+        if _ExecuteGit(repo_path, ['for-each-ref', ref]).strip():
+            _ExecuteGit(repo_path, ['update-ref', '-d', ref])
+        return None
+
+    _ExecuteGit(repo_path, ['fetch', '--quiet', 'origin', '+%s:%s' % (remote_ref, ref)])
+    return ref
+
+
+
+def GetRemoteUrl(repo_path, remote='origin'):
+    '''
+    :param unicode repo_path:
+        Path to a local git repository.
+
+    :param unicode remote:
+        Name of a remote in that repository.
+
+    :return unicode:
+        Url of `remote`.
+    '''
+    # Read git files directly, executing git only when they are not simple enough
+    git_dirs = _FindGitDirs(repo_path)
+    if git_dirs is not None:
+        config = _ReadGitConfig(git_dirs[1])
+        if config is not None and ('remote', remote, 'url') in config:
+            return config[('remote', remote, 'url')]
+
+    return _ExecuteGit(repo_path, ['config', '--get', 'remote.%s.url' % remote]).strip()
+
+
+
+def GetCurrentBranch(repo_path):
+    '''
+    :param unicode repo_path:
+        Path to a local git repository (or one of its linked worktrees).
+
+    :return unicode|None:
+        Name of the branch checked out, or None if HEAD is detached.
+    '''
+    import subprocess
+
+    head = _ReadHead(_FindGitDirs(repo_path))
+    if head is None:
+        try:
+            head = 'ref: ' + _ExecuteGit(repo_path, ['symbolic-ref', '-q', 'HEAD']).strip()
+        except subprocess.CalledProcessError:
+            return None
+
+    if head.startswith('ref: refs/heads/'):
+        return head[len('ref: refs/heads/'):]
+    return None
+
+
+
+def GetHeadCommit(repo_path):
+    '''
+    :param unicode repo_path:
+        Path to a local git repository (or one of its linked worktrees).
+
+    :return unicode:
+        SHA of the commit checked out.
+    '''
+    git_dirs = _FindGitDirs(repo_path)
+    head = _ReadHead(git_dirs)
+    if head is not None:
+        if not head.startswith('ref: '):
+            return head
+
+        commit = _ReadRef(git_dirs, head[len('ref: '):])
+        if commit is not None:
+            return commit
+
+    return _ExecuteGit(repo_path, ['rev-parse', 'HEAD']).strip()
+
+
+
+def GetBranchFromRefName(ref):
+    '''
+    :param unicode ref:
+        A ref, as given by users (e.g. "master", "origin/master" or "refs/heads/master").
+
+    :return unicode:
+        Branch name for `ref` (`ref` itself if it is not recognized as a branch).
+    '''
+    branch = _GetBranchFromRef(ref)
+    if branch is not None:
+        return branch
+    if ref.startswith('origin/'):
+        return ref[len('origin/'):]
+    return ref
+
+
+
+def GetBlobSha(contents):
+    '''
+    :param unicode contents:
+        File contents (encoded as utf-8).
+
+    :return unicode:
+        SHA of a git blob with `contents` (same as `git hash-object`).
+    '''
+    import hashlib
+
+    if isinstance(contents, unicode):
+        contents = contents.encode('utf-8')
+    return unicode(hashlib.sha1(b'blob %d\0' % len(contents) + contents).hexdigest())
+
+
+
+#===================================================================================================
+# GitObjectReader
+#===================================================================================================
+class GitObjectReader(object):
+    '''
+    Reads files of any ref of a repository straight from its object database (no checkout needed).
+
+    All reads are served by a single `git cat-file --batch` process, started on the first read.
+    Use as a context manager (or call `Close`) to finish that process.
+
+    Reads from many threads are serialized.
+    '''
+
+    def __init__(self, repo_path):
+        '''
+        :param unicode repo_path:
+            Path to a local git repository (working copy, mirror or bare clone).
+        '''
+        import threading
+
+        self.repo_path = repo_path
+        self._process = None
+        self._lock = threading.Lock()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.Close()
+
+
+    def ResolveRef(self, ref):
+        '''
+        :param unicode ref:
+            Any ref accepted by git (branch, remote branch, tag, commit SHA...).
+
+        :return unicode|None:
+            SHA of the commit `ref` points to, or None if `ref` does not exist.
+        '''
+        result = self._Read(ref + '^{commit}')
+        if result is None:
+            return None
+        return result[0]
+
+
+    def ReadFile(self, ref, path):
+        '''
+        :param unicode ref:
+            .. seealso:: ResolveRef
+
+        :param unicode path:
+            Path of a file in the repository (using "/" as separator).
+
+        :return tuple(unicode,unicode)|None:
+            SHA of the blob with the file contents, and the contents decoded as utf-8.
+            None if `ref` does not exist, or has no such file.
+        '''
+        result = self._Read('%s:%s' % (ref, path))
+        if result is None or result[1] != 'blob':
+            return None
+        sha, _object_type, contents = result
+        return sha, contents.decode('utf-8')
+
+
+    def Close(self):
+        '''
+        Finishes the git process (a new one is started if more reads are made).
+        '''
+        with self._lock:
+            if self._process is not None:
+                self._process.stdin.close()
+                self._process.wait()
+                self._process = None
+
+
+    def _Read(self, object_name):
+        '''
+        :param unicode object_name:
+            Object name, in any form accepted by `git cat-file`.
+
+        :return tuple(unicode,unicode,str)|None:
+            SHA, type, and raw contents of the object, or None if it does not exist.
+        '''
+        import subprocess
+
+        if '\n' in object_name:
+            return None
+
+        with self._lock:
+            if self._process is None:
+                self._process = subprocess.Popen(
+                    ['git', 'cat-file', '--batch'],
+                    cwd=self.repo_path,
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    bufsize=-1,
+                )
+
+            self._process.stdin.write(object_name.encode('utf-8') + b'\n')
+            self._process.stdin.flush()
+
+            header = self._process.stdout.readline().decode('utf-8')
+            if not header:
+                self._process = None
+                raise RuntimeError('git cat-file finished unexpectedly in "%s"' % self.repo_path)
+
+            # Either "<sha> <type> <size>", or "<object name> missing" (or "ambiguous")
+            header = header.rstrip('\n').rsplit(' ', 2)
+            if len(header) != 3 or not header[2].isdigit():
+                return None
+
+            sha, object_type, size = header
+            contents = self._process.stdout.read(int(size))
+            self._process.stdout.read(1)  # New line after contents
+            return sha, object_type, contents
+
+
+
+def _ExecuteGit(repo_path, args):
+    '''
+    :param unicode repo_path:
+        Directory where git is executed.
+
+    :param list(unicode) args:
+        Arguments for git.
+
+    :return unicode:
+        Output of git.
+    '''
+    import subprocess
+    return subprocess.check_output(['git'] + args, cwd=repo_path).decode('utf-8')
+
+
+
+def _FindGitDirs(repo_path):
+    '''
+    Finds git directories of a repository, the same way git does (looking in parent directories,
+    and following ".git" files of linked worktrees and submodules).
+
+    :param unicode repo_path:
+        Path to a local git repository (or a directory inside it).
+
+    :return tuple(unicode,unicode)|None:
+        The git directory of `repo_path` (with HEAD), and the common git directory (with config
+        and refs, different from the first one for linked worktrees).
+        None if git directories can't be found without executing git (e.g. if they are defined by
+        environment variables).
+    '''
+    import os
+
+    if any(var in os.environ for var in ('GIT_DIR', 'GIT_COMMON_DIR', 'GIT_WORK_TREE')):
+        return None
+
+    directory = os.path.abspath(repo_path)
+    while True:
+        dot_git = os.path.join(directory, '.git')
+        if os.path.isdir(dot_git):
+            git_dir = dot_git
+            break
+
+        if os.path.isfile(dot_git):
+            # Linked worktrees (and submodules) have a file pointing to their git directory
+            contents = _ReadGitFile(dot_git)
+            if contents is None or not contents.startswith('gitdir: '):
+                return None
+            git_dir = os.path.join(directory, contents[len('gitdir: '):])
+            break
+
+        # Bare repositories
+        if all(os.path.exists(os.path.join(directory, i)) for i in ('HEAD', 'objects', 'refs')):
+            git_dir = directory
+            break
+
+        parent = os.path.dirname(directory)
+        if parent == directory:
+            return None
+        directory = parent
+
+    common_dir = git_dir
+    contents = _ReadGitFile(os.path.join(git_dir, 'commondir'))
+    if contents is not None:
+        common_dir = os.path.join(git_dir, contents)
+
+    return os.path.normpath(git_dir), os.path.normpath(common_dir)
+
+
+
+def _ReadHead(git_dirs):
+    '''
+    :param tuple(unicode,unicode)|None git_dirs:
+        .. seealso:: _FindGitDirs
+
+    :return unicode|None:
+        Contents of HEAD: either "ref: <ref name>", or the SHA of a commit (detached HEAD).
+        None if HEAD can't be read without executing git.
+    '''
+    import os
+
+    if git_dirs is None:
+        return None
+    return _ReadGitFile(os.path.join(git_dirs[0], 'HEAD'))
+
+
+
+def _ReadRef(git_dirs, ref):
+    '''
+    :param tuple(unicode,unicode) git_dirs:
+        .. seealso:: _FindGitDirs
+
+    :param unicode ref:
+        Full ref name (e.g. "refs/heads/master").
+
+    :return unicode|None:
+        SHA of the commit `ref` points to, from loose or packed refs.
+        None if it can't be found without executing git (e.g. symbolic refs).
+    '''
+    import os
+
+    git_dir, common_dir = git_dirs
+
+    # Some refs (e.g. "HEAD", "refs/bisect/*") are specific to each worktree
+    for directory in (git_dir, common_dir):
+        contents = _ReadGitFile(os.path.join(directory, *ref.split('/')))
+        if contents is not None:
+            if contents.startswith('ref: '):
+                return None
+            return contents
+
+    packed_refs = _ReadGitFile(os.path.join(common_dir, 'packed-refs'))
+    if packed_refs is not None:
+        for line in packed_refs.splitlines():
+            # Skip comments, and peeled tags ("^<sha>")
+            if line.startswith(('#', '^')):
+                continue
+            commit, _, packed_ref = line.partition(' ')
+            if packed_ref == ref:
+                return commit
+
+    return None
+
+
+
+def _ReadGitConfig(common_dir):
+    '''
+    Reads a git config file.
+
+    Only the subset of the syntax used by git itself when writing config files is supported.
+
+    :param unicode common_dir:
+        Common git directory (.. seealso:: _FindGitDirs).
+
+    :return dict(tuple(unicode,unicode|None,unicode),unicode)|None:
+        Maps (section, subsection, key) to values. Section and key names are lower case.
+        If a key is repeated, the last value is kept.
+        None if config can't be read without executing git (e.g. config includes other files).
+    '''
+    import os
+    import re
+
+    contents = _ReadGitFile(os.path.join(common_dir, 'config'))
+    if contents is None or os.path.isfile(os.path.join(common_dir, 'config.worktree')):
+        return None
+
+    section_re = re.compile(r'^\[\s*([\w.-]+)(?:\s+"((?:[^"\\]|\\.)*)")?\s*\]$')
+    key_re = re.compile(r'^([A-Za-z][\w-]*)\s*(?:=\s*(.*))?$')
+
+    config = {}
+    section = None
+    for line in contents.splitlines():
+        line = line.strip()
+        if not line or line.startswith(('#', ';')):
+            continue
+
+        match = section_re.match(line)
+        if match is not None:
+            name, subsection = match.groups()
+            if subsection is not None:
+                subsection = re.sub(r'\\(.)', r'\1', subsection)
+            section = (name.lower(), subsection)
+            if name.lower() in ('include', 'includeif'):
+                return None
+            continue
+
+        match = key_re.match(line)
+        if match is None or section is None:
+            return None
+
+        key, value = match.groups()
+        if value is None:
+            value = 'true'
+        elif any(char in value for char in '"\\;#'):
+            # Quoted values, escapes, inline comments and continuation lines are left to git
+            return None
+
+        config[section + (key.lower(),)] = value
+
+    return config
+
+
+
+def _ReadGitFile(filename):
+    '''
+    :param unicode filename:
+        Path of a file inside a git directory.
+
+    :return unicode|None:
+        Contents of `filename` (without trailing new lines), or None if it does not exist.
+    '''
+    import io
+
+    try:
+        with io.open(filename, 'r', encoding='utf-8') as git_file:
+            return git_file.read().rstrip('\n')
+    except (IOError, OSError):
+        return None
+
+
+
+def _IsBareRepository(repo_path):
+    '''
+    :param unicode repo_path:
+        Path to a local git repository.
+
+    :return bool:
+        True for mirrors and bare clones (without a working copy).
+    '''
+    return _ExecuteGit(repo_path, ['rev-parse', '--is-bare-repository']).strip() == 'true'
+
+
+
+def _GetBranchRefPatterns(repo_path):
+    '''
+    :param unicode repo_path:
+        Path to a local git repository.
+
+    :return list(unicode):
+        Patterns of refs with branches of `repo_path` (.. seealso:: ListBranches), given to
+        "git for-each-ref" so other refs (e.g. tags) are not even listed.
+    '''
+    if _IsBareRepository(repo_path):
+        return ['refs/heads']
+    return ['refs/remotes/origin']
+
+
+
+def _GetBranchFromRef(ref):
+    '''
+    :param unicode ref:
+        Full ref name (e.g. "refs/heads/master").
+
+    :return unicode|None:
+        Branch name for local branches and branches of "origin", None for other refs.
+    '''
+    if ref == 'refs/remotes/origin/HEAD':
+        return None
+    for prefix in ('refs/heads/', 'refs/remotes/origin/'):
+        if ref.startswith(prefix):
+            return ref[len(prefix):]
+    return None
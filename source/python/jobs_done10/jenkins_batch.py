@@ -0,0 +1,330 @@
+'''
+Publishing of jobs of many repositories (listed in a manifest) to a single Jenkins instance, in a
+single run (.. seealso:: the "jenkins_batch" command).
+'''
+from __future__ import unicode_literals
+from ben10.foundation.bunch import Bunch
+from jobs_done10.generators.jenkins import JenkinsXmlJobGenerator, _BackgroundCall, _ReadDirectory
+from jobs_done10.jenkins_session import JenkinsSession
+
+
+
+#===================================================================================================
+# JenkinsBatchEntry
+#===================================================================================================
+class JenkinsBatchEntry(Bunch):
+    '''
+    Repository published by `UploadJobsFromManifest`.
+
+    :cvar unicode directory:
+        Directory of a git repository (working copy, mirror or bare clone).
+
+    :cvar unicode|None ref:
+        Git ref to read the jobs_done file from. If None, reads the working tree.
+
+    :cvar unicode|None url:
+        Repository url used in jobs. Defaults to the url of "origin" in `directory`.
+
+    :cvar unicode|None branch:
+        Branch used in jobs. Defaults to the branch of `ref` (or the current branch).
+    '''
+    directory = None
+    ref = None
+    url = None
+    branch = None
+
+
+
+#===================================================================================================
+# JenkinsBatchResult
+#===================================================================================================
+class JenkinsBatchResult(Bunch):
+    '''
+    Result of publishing a `JenkinsBatchEntry`.
+
+    :cvar JenkinsBatchEntry entry:
+        Entry published.
+
+    :cvar Repository|None repository:
+        Repository jobs were published for (None if it could not be read).
+
+    :cvar list(unicode) new:
+    :cvar list(unicode) updated:
+    :cvar list(unicode) deleted:
+        .. seealso:: JenkinsJobPublisher.PublishToUrl
+
+    :cvar unicode|None error:
+        Error that stopped publishing this entry, if any.
+
+    :cvar bool skipped:
+        True if this entry was not published because it belongs to another shard.
+
+    :cvar bool superseded:
+        True if this entry was not published because a later entry publishes the same job group.
+
+    :cvar float time:
+        Time (seconds) spent publishing this entry.
+    '''
+    entry = None
+    repository = None
+    new = None
+    updated = None
+    deleted = None
+    error = None
+    skipped = False
+    superseded = False
+    time = 0.0
+
+
+
+# Default number of repositories published at the same time by `UploadJobsFromManifest`
+BATCH_PARALLEL = 4
+
+def ReadBatchManifest(manifest_filename):
+    '''
+    Reads a manifest of repositories to be published by `UploadJobsFromManifest`.
+
+    The manifest is a YAML (or JSON) list, where each item is either the directory of a repository,
+    or a mapping with a "directory" and, optionally, "ref", "url" and "branch" (.. seealso::
+    JenkinsBatchEntry):
+
+        - /mirrors/space
+        - directory: /mirrors/space
+          ref: origin/milky_way
+        - directory: /mirrors/space
+          ref: 2f6e1d0
+          branch: milky_way
+
+    Relative directories are relative to the manifest.
+
+    :param unicode manifest_filename:
+
+    :return list(JenkinsBatchEntry):
+
+    :raises ValueError:
+        If the manifest is not in the format above.
+    '''
+    from ben10.filesystem import GetFileContents
+    import os
+    import yaml
+
+    items = yaml.safe_load(GetFileContents(manifest_filename))
+    if not isinstance(items, list):
+        raise ValueError('Batch manifest must be a list of repositories: "%s"' % manifest_filename)
+
+    base_directory = os.path.dirname(os.path.abspath(manifest_filename))
+    entries = []
+    for item in items:
+        if isinstance(item, basestring):
+            item = {'directory' : item}
+        if not isinstance(item, dict) or not isinstance(item.get('directory'), basestring):
+            raise ValueError('Invalid batch manifest entry: %r' % (item,))
+
+        unknown_keys = set(item).difference(['directory', 'ref', 'url', 'branch'])
+        if unknown_keys:
+            raise ValueError(
+                'Unknown keys in batch manifest entry: %s' % ', '.join(sorted(unknown_keys)))
+
+        entries.append(JenkinsBatchEntry(
+            directory=os.path.join(base_directory, item['directory']),
+            ref=item.get('ref'),
+            url=item.get('url'),
+            branch=item.get('branch'),
+        ))
+
+    return entries
+
+
+
+def UploadJobsFromManifest(
+    entries,
+    url,
+    username=None,
+    password=None,
+    parallel=BATCH_PARALLEL,
+    on_result=None,
+    request_log=None,
+    shard=None,
+    worker_pool=None,
+    ):
+    '''
+    Publishes jobs of many repositories to a single Jenkins instance.
+
+    All repositories are published through a single `JenkinsSession`: they share the same Jenkins
+    API (and its connections), jobs in Jenkins are listed only once (in background, while the first
+    jobs are generated), and a jobs_done file shared by many entries is only parsed once. Up to
+    `parallel` repositories are published at the same time.
+
+    Errors publishing a repository are reported in its result, and don't stop other repositories.
+
+    When many entries publish the same job group (e.g. the same repository/branch), only the last
+    of them is published (others are reported as superseded), so they never race each other.
+
+    :param list(JenkinsBatchEntry) entries:
+        Repositories to publish (.. seealso:: ReadBatchManifest).
+
+    :param unicode url:
+        URL of a Jenkins server instance.
+
+    :param unicode|None username:
+        Username for Jenkins server.
+
+    :param unicode|None password:
+        Password for Jenkins server.
+
+    :param int parallel:
+        Maximum number of repositories published at the same time.
+
+    :param callable on_result:
+        If given, called with each `JenkinsBatchResult` as soon as its entry is finished (from
+        worker threads, one call at a time).
+
+    :param JenkinsRequestLog|None request_log:
+        .. seealso:: JenkinsJobPublisher
+
+    :param JenkinsShard|None shard:
+        If given, only repositories whose job group belongs to this shard are published (others
+        are reported as skipped).
+
+    :param WorkerPool|None worker_pool:
+        .. seealso:: JenkinsSession
+
+    :return list(JenkinsBatchResult):
+        Results, in the same order as `entries`.
+    '''
+    from multiprocessing.pool import ThreadPool
+    import threading
+
+    if not entries:
+        return []
+
+    session = JenkinsSession(
+        url, username, password, request_log=request_log, worker_pool=worker_pool)
+
+    # Jobs are listed in background (publishes wait for this listing, instead of listing again)
+    _BackgroundCall(session.GetJobNames)
+
+    on_result_lock = threading.Lock()
+
+    def _Publish(read_entry):
+        result, jobs_done_file_contents = read_entry
+        _PublishBatchEntry(result, jobs_done_file_contents, session)
+        if on_result is not None:
+            with on_result_lock:
+                on_result(result)
+        return result
+
+    pool = ThreadPool(max(1, min(parallel, len(entries))))
+    try:
+        read_entries = pool.map(lambda entry: _ReadBatchEntry(entry, shard), entries)
+
+        # Only the last entry of each job group is published
+        results = [
+            result
+            for result, _jobs_done_file_contents in read_entries
+            if result.error is None and not result.skipped
+        ]
+        last_results = dict(
+            (JenkinsXmlJobGenerator.GetJobGroup(result.repository), result) for result in results)
+        for result in results:
+            job_group = JenkinsXmlJobGenerator.GetJobGroup(result.repository)
+            result.superseded = last_results[job_group] is not result
+
+        return pool.map(_Publish, read_entries)
+    finally:
+        pool.close()
+        pool.join()
+
+
+
+def _ReadBatchEntry(entry, shard):
+    '''
+    Reads the repository of a single entry in `UploadJobsFromManifest`.
+
+    :return tuple(JenkinsBatchResult,unicode|None):
+        Result for `entry` (with its repository, or an error), and the contents of its jobs_done
+        file.
+    '''
+    from jobs_done10.repository import Repository
+    import time
+
+    start_time = time.time()
+    result = JenkinsBatchResult(entry=entry)
+    jobs_done_file_contents = None
+    try:
+        repository, jobs_done_file_contents = _ReadDirectory(entry.directory, entry.ref)
+        if entry.url is not None or entry.branch is not None:
+            repository = Repository(
+                url=entry.url or repository.url,
+                branch=entry.branch or repository.branch,
+            )
+        result.repository = repository
+        result.skipped = shard is not None and not shard.ContainsRepository(repository)
+    except Exception as e:
+        result.error = '%s: %s' % (e.__class__.__name__, e)
+    result.time = time.time() - start_time
+
+    return result, jobs_done_file_contents
+
+
+
+def _PublishBatchEntry(result, jobs_done_file_contents, session):
+    '''
+    Publishes jobs of a single entry in `UploadJobsFromManifest`, if it was read successfully, and
+    is not skipped nor superseded.
+
+    :param JenkinsBatchResult result:
+        Result of `_ReadBatchEntry`, updated with the jobs published.
+
+    :param unicode|None jobs_done_file_contents:
+        Contents of the jobs_done file of the entry.
+
+    :param JenkinsSession session:
+        Session used to publish.
+    '''
+    import time
+
+    if result.error is not None or result.skipped or result.superseded:
+        return
+
+    start_time = time.time()
+    try:
+        result.new, result.updated, result.deleted = \
+            session.UploadJobsFromFile(result.repository, jobs_done_file_contents)
+    except Exception as e:
+        result.error = '%s: %s' % (e.__class__.__name__, e)
+    result.time += time.time() - start_time
+
+
+
+def WriteBatchSummary(results, stream):
+    '''
+    Writes results of `UploadJobsFromManifest` as JSON.
+
+    :param list(JenkinsBatchResult) results:
+
+    :param file stream:
+        Stream where the summary is written: a JSON list with one object for each result, with
+        keys "directory", "ref", "url", "branch", "new", "updated", "deleted", "error", "skipped",
+        "superseded" and "time".
+    '''
+    import json
+
+    summary = []
+    for result in results:
+        summary.append({
+            'directory' : result.entry.directory,
+            'ref' : result.entry.ref,
+            'url' : result.repository.url if result.repository is not None else result.entry.url,
+            'branch' : \
+                result.repository.branch if result.repository is not None else result.entry.branch,
+            'new' : result.new,
+            'updated' : result.updated,
+            'deleted' : result.deleted,
+            'error' : result.error,
+            'skipped' : result.skipped,
+            'superseded' : result.superseded,
+            'time' : result.time,
+        })
+
+    stream.write(json.dumps(summary, indent=4, separators=(',', ': '), sort_keys=True) + '\n')
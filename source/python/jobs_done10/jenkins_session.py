@@ -0,0 +1,372 @@
+'''
+Publishing of jobs of many repositories/branches to a single Jenkins instance by long running
+processes (e.g. the "serve" command), keeping state (Jenkins connections, job index, parsed
+jobs_done files) between publishes.
+'''
+from __future__ import absolute_import, unicode_literals
+from ben10.foundation.bunch import Bunch
+from jobs_done10.generators.jenkins import (JenkinsBranchJobsCache, JenkinsJob,
+    JenkinsJobPublisher, JenkinsXmlJobGenerator, _GenerateJobTuples, _GetJobsDoneFileSha,
+    _ReadDirectory)
+
+
+
+#===================================================================================================
+# JenkinsSessionStatistics
+#===================================================================================================
+class JenkinsSessionStatistics(Bunch):
+    '''
+    Statistics of a `JenkinsSession`.
+
+    :cvar int uploads:
+        Number of uploads (.. seealso:: JenkinsSession.UploadJobsFromFile).
+
+    :cvar int listings:
+        Number of times all jobs were listed from Jenkins.
+
+    :cvar int invalidations:
+        Number of times cached Jenkins state was invalidated.
+
+    :cvar int parses:
+        Number of jobs_done files parsed.
+
+    :cvar int parse_hits:
+        Number of times a jobs_done file parsed before was reused.
+
+    :cvar int render_hits:
+    :cvar int render_misses:
+        Number of times jobs were created from cached jobs, or rendered (.. seealso::
+        JenkinsBranchJobsCache).
+
+    :cvar int cached_job_names:
+        Number of job names currently in the job index.
+
+    :cvar int cached_configs:
+        Number of job configs currently cached.
+    '''
+    uploads = 0
+    listings = 0
+    invalidations = 0
+    parses = 0
+    parse_hits = 0
+    render_hits = 0
+    render_misses = 0
+    cached_job_names = 0
+    cached_configs = 0
+
+
+
+#===================================================================================================
+# JenkinsSession
+#===================================================================================================
+class JenkinsSession(object):
+    '''
+    Publishes jobs of many repositories/branches to a single Jenkins instance, keeping state
+    between publishes. Meant to be used by long running processes, instead of `UploadJobsFromFile`.
+
+    A session keeps:
+    - a single Jenkins API (and its connections);
+    - an index of job names, listed once, and updated with jobs created and deleted by the
+      session;
+    - job configs fetched from Jenkins (and configs of jobs published by the session);
+    - parsed jobs_done files, and jobs rendered from them (.. seealso:: JenkinsBranchJobsCache),
+      or jobs generated by worker processes (.. seealso:: worker_pool).
+
+    All methods are thread-safe. Publishes of the same repository/branch are serialized, while
+    publishes of different branches run concurrently.
+
+    Cached Jenkins state is assumed to be changed only by this session: when jobs are changed by
+    others (e.g. by hand, or by another process), call `Invalidate`. Parsed files and rendered
+    jobs only depend on the contents of jobs_done files, and are never invalidated.
+    '''
+
+    # Maximum number of distinct jobs_done files kept parsed (and with rendered jobs) in memory.
+    # When exceeded, these caches are cleared.
+    MAX_CACHED_FILES = 256
+
+    def __init__(self, url, username=None, password=None, request_log=None, worker_pool=None):
+        '''
+        :param unicode url:
+            URL of a Jenkins server instance.
+
+        :param unicode|None username:
+            Username for Jenkins server.
+
+        :param unicode|None password:
+            Password for Jenkins server.
+
+        :param JenkinsRequestLog|None request_log:
+            .. seealso:: JenkinsJobPublisher
+
+        :param WorkerPool|None worker_pool:
+            If given, jobs_done files are parsed (and their jobs generated) in worker processes of
+            this pool, with limited resources, instead of in this process.
+        '''
+        import threading
+
+        self.url = url
+        self.username = username
+        self.password = password
+        self.request_log = request_log
+        self.worker_pool = worker_pool
+
+        self._jenkins_api = None
+        self._job_names = None
+        self._job_configs = {}
+        self._parsed_files = {}
+        self._generated_jobs = {}
+        self._jobs_cache = JenkinsBranchJobsCache()
+        self._group_locks = {}
+        self._statistics = JenkinsSessionStatistics()
+
+        # Protects all state above
+        self._lock = threading.Lock()
+
+        # Held while listing jobs, so concurrent callers wait for a single listing
+        self._listing_lock = threading.Lock()
+
+        # Held while parsing and rendering jobs (caches used are not thread-safe)
+        self._generation_lock = threading.Lock()
+
+
+    def GetJenkinsApi(self):
+        '''
+        :return jenkins.Jenkins:
+            Jenkins API shared by all requests made by this session.
+        '''
+        import jenkins
+
+        with self._lock:
+            if self._jenkins_api is None:
+                self._jenkins_api = jenkins.Jenkins(self.url, self.username, self.password)
+            return self._jenkins_api
+
+
+    def GetJobNames(self):
+        '''
+        :return list(unicode):
+            Names of all jobs in Jenkins, listed only once (until `Invalidate` is called).
+        '''
+        jenkins_api = self.GetJenkinsApi()
+
+        with self._listing_lock:
+            with self._lock:
+                if self._job_names is not None:
+                    return list(self._job_names)
+
+            lister = JenkinsJobPublisher(None, [], request_log=self.request_log)
+            job_names = lister._ListJobNames(jenkins_api)
+
+            with self._lock:
+                self._job_names = set(job_names)
+                self._statistics.listings += 1
+                return list(self._job_names)
+
+
+    def GetJobs(self, repository, jobs_done_file_contents):
+        '''
+        Same as `GetJobsFromFile`, reusing jobs_done files parsed before, and jobs rendered for
+        other branches with the same jobs_done file.
+
+        :param Repository repository:
+        :param unicode|None jobs_done_file_contents:
+            .. seealso:: GetJobsFromFile
+
+        :return list(JenkinsJob):
+
+        :raises JobsDoneFileResourceError:
+            If the jobs_done file goes over the limits of `worker_pool`.
+        '''
+        from jobs_done10.jobs_done_job import JobsDoneJob
+
+        if self.worker_pool is not None:
+            return self._GetJobsFromWorkers(repository, jobs_done_file_contents)
+
+        jobs_done_file_sha = _GetJobsDoneFileSha(jobs_done_file_contents)
+
+        with self._generation_lock:
+            if jobs_done_file_sha in self._parsed_files:
+                parsed_file = self._parsed_files[jobs_done_file_sha]
+                parse_hits, parses = 1, 0
+            else:
+                if len(self._parsed_files) >= self.MAX_CACHED_FILES:
+                    self._parsed_files.clear()
+                    self._jobs_cache = JenkinsBranchJobsCache()
+                parsed_file = JobsDoneJob.ParseYAML(jobs_done_file_contents)
+                self._parsed_files[jobs_done_file_sha] = parsed_file
+                parse_hits, parses = 0, 1
+
+            hits, misses = self._jobs_cache.hits, self._jobs_cache.misses
+            jobs = self._jobs_cache.GetJobs(repository, parsed_file, jobs_done_file_sha)
+            hits, misses = self._jobs_cache.hits - hits, self._jobs_cache.misses - misses
+
+        with self._lock:
+            self._statistics.parses += parses
+            self._statistics.parse_hits += parse_hits
+            self._statistics.render_hits += hits
+            self._statistics.render_misses += misses
+
+        return jobs
+
+
+    def _GetJobsFromWorkers(self, repository, jobs_done_file_contents):
+        '''
+        Same as `GetJobs`, parsing and generating jobs in `worker_pool`.
+
+        Jobs generated are kept for each repository/branch and jobs_done file (rendering jobs for
+        other branches is done by workers, so it can't be shared).
+        '''
+        jobs_done_file_sha = _GetJobsDoneFileSha(jobs_done_file_contents)
+        key = (repository.url, repository.branch, jobs_done_file_sha)
+
+        with self._lock:
+            job_tuples = self._generated_jobs.get(key)
+            if job_tuples is not None:
+                self._statistics.parse_hits += 1
+
+        if job_tuples is None:
+            job_tuples = self.worker_pool.Run(
+                _GenerateJobTuples, repository.url, repository.branch, jobs_done_file_contents)
+
+            with self._lock:
+                if len(self._generated_jobs) >= self.MAX_CACHED_FILES:
+                    self._generated_jobs.clear()
+                self._generated_jobs[key] = job_tuples
+                self._statistics.parses += 1
+
+        return [
+            JenkinsJob(
+                name=name, repository=repository, xml=xml, jobs_done_file_sha=jobs_done_file_sha)
+            for name, xml in job_tuples
+        ]
+
+
+    def UploadJobsFromFile(
+        self, repository, jobs_done_file_contents, deadline=None, on_operation=None):
+        '''
+        Same as `UploadJobsFromFile`, reusing state kept by this session.
+
+        :param Repository repository:
+        :param unicode|None jobs_done_file_contents:
+            .. seealso:: GetJobsFromFile
+
+        :param Deadline|None deadline:
+        :param callable on_operation:
+            .. seealso:: JenkinsJobPublisher.PublishToUrl
+
+        :return tuple(list(unicode),list(unicode),list(unicode)):
+            .. seealso:: JenkinsJobPublisher.PublishToUrl
+        '''
+        jobs = self.GetJobs(repository, jobs_done_file_contents)
+
+        with self._GetGroupLock(JenkinsXmlJobGenerator.GetJobGroup(repository)):
+            publisher = JenkinsJobPublisher(repository, jobs, request_log=self.request_log)
+            publisher.UseJenkinsApi(
+                self.url,
+                self.username,
+                self.password,
+                self.GetJenkinsApi(),
+                job_names=self.GetJobNames(),
+                job_configs=self._job_configs,
+            )
+            try:
+                new_jobs, updated_jobs, deleted_jobs = publisher.PublishToUrl(
+                    self.url,
+                    self.username,
+                    self.password,
+                    deadline=deadline,
+                    on_operation=on_operation,
+                )
+            except Exception:
+                # Jobs may have been partially published
+                self.Invalidate()
+                raise
+
+            with self._lock:
+                self._statistics.uploads += 1
+                if self._job_names is not None:
+                    self._job_names.update(new_jobs)
+                    self._job_names.difference_update(deleted_jobs)
+                for job_name in new_jobs + updated_jobs:
+                    self._job_configs[job_name] = publisher.jobs[job_name].xml
+                for job_name in deleted_jobs:
+                    self._job_configs.pop(job_name, None)
+
+        return new_jobs, updated_jobs, deleted_jobs
+
+
+    def Invalidate(self):
+        '''
+        Discards Jenkins state cached by this session (job names and configs), so it is read again
+        from Jenkins when needed.
+        '''
+        with self._lock:
+            self._job_names = None
+            self._job_configs.clear()
+            self._statistics.invalidations += 1
+
+
+    def GetStatistics(self):
+        '''
+        :return JenkinsSessionStatistics:
+            Statistics of this session so far.
+        '''
+        with self._lock:
+            statistics = JenkinsSessionStatistics(**dict(
+                (name, getattr(self._statistics, name))
+                for name in (
+                    'uploads',
+                    'listings',
+                    'invalidations',
+                    'parses',
+                    'parse_hits',
+                    'render_hits',
+                    'render_misses',
+                )
+            ))
+            statistics.cached_job_names = len(self._job_names or ())
+            statistics.cached_configs = len(self._job_configs)
+            return statistics
+
+
+    def _GetGroupLock(self, job_group):
+        '''
+        :return threading.Lock:
+            Lock held while publishing jobs of `job_group`.
+        '''
+        import threading
+
+        with self._lock:
+            return self._group_locks.setdefault(job_group, threading.Lock())
+
+
+
+def UploadJobsFromMirror(session, directory, branch):
+    '''
+    Updates a branch in a local mirror from "origin", and publishes its jobs.
+
+    Jobs of branches deleted in "origin" are deleted.
+
+    :param JenkinsSession session:
+        Session used to publish.
+
+    :param unicode directory:
+        Directory of a git repository (mirror, bare clone or working copy).
+
+    :param unicode branch:
+        Branch to publish.
+
+    :return tuple(Repository,tuple(list(unicode),list(unicode),list(unicode))):
+        Repository/branch published, and .. seealso:: JenkinsJobPublisher.PublishToUrl
+    '''
+    from jobs_done10.git_repository import FetchBranch, GetRemoteUrl
+    from jobs_done10.repository import Repository
+
+    ref = FetchBranch(directory, branch)
+    if ref is None:
+        repository = Repository(url=GetRemoteUrl(directory), branch=branch)
+        jobs_done_file_contents = None
+    else:
+        repository, jobs_done_file_contents = _ReadDirectory(directory, ref)
+
+    return repository, session.UploadJobsFromFile(repository, jobs_done_file_contents)
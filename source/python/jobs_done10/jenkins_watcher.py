@@ -0,0 +1,207 @@
+'''
+Watches a jobs_done file while it is edited, keeping its jobs in memory and publishing only jobs
+that changed to a directory (.. seealso:: the "jenkins_test --watch" command).
+'''
+from __future__ import unicode_literals
+from ben10.foundation.bunch import Bunch
+from jobs_done10.generators.jenkins import (JenkinsJobPublisher, _CreateFileAtomically,
+    _GetJobsDoneFileSha, _IterJobsFromJobsDoneJobs, _ReadDirectory)
+
+
+
+#===================================================================================================
+# JenkinsWatchCycle
+#===================================================================================================
+class JenkinsWatchCycle(Bunch):
+    '''
+    Result of a `JenkinsJobsWatcher` update.
+
+    :cvar list(unicode) new:
+    :cvar list(unicode) updated:
+    :cvar list(unicode) unchanged:
+    :cvar list(unicode) deleted:
+        Names of jobs whose files were created, rewritten, left untouched or deleted.
+
+    :cvar int generated:
+        Number of jobs (matrix rows) generated in this cycle. Other jobs were reused from previous
+        cycles.
+
+    :cvar float parse_time:
+    :cvar float generate_time:
+    :cvar float write_time:
+        Time spent (seconds) parsing the jobs_done file, generating jobs and writing files.
+    '''
+    new = None
+    updated = None
+    unchanged = None
+    deleted = None
+    generated = 0
+    parse_time = 0.0
+    generate_time = 0.0
+    write_time = 0.0
+
+
+
+#===================================================================================================
+# JenkinsJobsWatcher
+#===================================================================================================
+class JenkinsJobsWatcher(object):
+    '''
+    Keeps jobs of a jobs_done file in memory, publishing them to a directory each time that file
+    changes.
+
+    Only jobs whose inputs (options of their matrix row) changed are generated again, and only
+    files of jobs that changed are written. Files written are the same written by
+    `JenkinsJobPublisher.PublishToDirectory`.
+    '''
+
+    # Time (seconds) between checks for changes in the jobs_done file
+    POLL_INTERVAL = 0.5
+
+    def __init__(self, directory, output_directory):
+        '''
+        :param unicode directory:
+            Directory of a git repository, with a jobs_done file.
+
+        :param unicode output_directory:
+            .. seealso:: JenkinsJobPublisher.PublishToDirectory
+        '''
+        self.directory = directory
+        self.output_directory = output_directory
+
+        self._repository = None
+        self._file_sha = None
+        self._cached_jobs = {}
+        self._published_jobs = None
+
+
+    def Update(self):
+        '''
+        Publishes jobs again if the jobs_done file changed since the last update (always publishes
+        on the first update).
+
+        :return JenkinsWatchCycle|None:
+            What was done, or None if the jobs_done file did not change.
+        '''
+        from ben10.filesystem import GetFileContents
+        from jobs_done10.jobs_done_job import JOBS_DONE_FILENAME, JobsDoneJob
+        import os
+        import time
+
+        # Contents are compared (not modification time and size), since changes in the same
+        # second that keep the size (e.g. replacing a value by another of the same size) are
+        # common while editing
+        start_time = time.time()
+        filename = os.path.join(self.directory, JOBS_DONE_FILENAME)
+        if os.path.isfile(filename):
+            jobs_done_file_contents = GetFileContents(filename)
+            file_sha = _GetJobsDoneFileSha(jobs_done_file_contents)
+        else:
+            jobs_done_file_contents = None
+            file_sha = None
+
+        if self._repository is not None and file_sha == self._file_sha:
+            return None
+        self._file_sha = file_sha
+
+        cycle = JenkinsWatchCycle()
+
+        if self._repository is None:
+            self._repository = _ReadDirectory(self.directory)[0]
+        jobs_done_jobs = JobsDoneJob.CreateFromYAML(jobs_done_file_contents, self._repository)
+        cycle.parse_time = time.time() - start_time
+
+        start_time = time.time()
+        jobs = self._GenerateJobs(jobs_done_jobs, cycle)
+        cycle.generate_time = time.time() - start_time
+
+        start_time = time.time()
+        self._PublishJobs(jobs, cycle)
+        cycle.write_time = time.time() - start_time
+
+        return cycle
+
+
+    def _GenerateJobs(self, jobs_done_jobs, cycle):
+        '''
+        Generates jobs, reusing jobs generated in previous cycles for the same inputs.
+
+        :return list(JenkinsJob):
+        '''
+        keys = [self._GetJobKey(jobs_done_job) for jobs_done_job in jobs_done_jobs]
+
+        missing = [
+            (key, jobs_done_job)
+            for key, jobs_done_job in zip(keys, jobs_done_jobs)
+            if key not in self._cached_jobs
+        ]
+        generated_jobs = _IterJobsFromJobsDoneJobs(
+            [jobs_done_job for _key, jobs_done_job in missing], self._file_sha)
+        for (key, _jobs_done_job), job in zip(missing, generated_jobs):
+            self._cached_jobs[key] = job
+        cycle.generated = len(missing)
+
+        # Only keep jobs of the current file version (jobs reused are now created from it)
+        self._cached_jobs = dict((key, self._cached_jobs[key]) for key in keys)
+        for job in self._cached_jobs.itervalues():
+            job.jobs_done_file_sha = self._file_sha
+
+        return [self._cached_jobs[key] for key in keys]
+
+
+    def _PublishJobs(self, jobs, cycle):
+        '''
+        Writes files of jobs that changed since the last cycle (on the first cycle, .. seealso::
+        JenkinsJobPublisher.PublishToDirectory).
+        '''
+        import os
+
+        jobs = dict((job.name, job) for job in jobs)
+
+        if self._published_jobs is None:
+            publisher = JenkinsJobPublisher(self._repository, jobs.values())
+            cycle.new, cycle.updated, cycle.unchanged, cycle.deleted = \
+                publisher.PublishToDirectory(self.output_directory)
+        else:
+            cycle.new, cycle.updated, cycle.unchanged = [], [], []
+            for job_name, job in sorted(jobs.iteritems()):
+                published_xml = self._published_jobs.get(job_name)
+                if published_xml == job.xml:
+                    cycle.unchanged.append(job_name)
+                    continue
+
+                if published_xml is None:
+                    cycle.new.append(job_name)
+                else:
+                    cycle.updated.append(job_name)
+                _CreateFileAtomically(os.path.join(self.output_directory, job_name), job.xml)
+
+            cycle.deleted = sorted(set(self._published_jobs).difference(jobs))
+            for job_name in cycle.deleted:
+                filename = os.path.join(self.output_directory, job_name)
+                if os.path.isfile(filename):
+                    os.remove(filename)
+
+        self._published_jobs = dict((job_name, job.xml) for job_name, job in jobs.iteritems())
+
+
+    @classmethod
+    def _GetJobKey(cls, jobs_done_job):
+        '''
+        :param JobsDoneJob jobs_done_job:
+
+        :return unicode:
+            Key with all inputs used to generate `jobs_done_job`.
+        '''
+        import json
+
+        options = dict(jobs_done_job.__dict__)
+        repository = options.pop('repository')
+
+        # Only matrix variables with many values affect jobs of a row (their names), so other
+        # changes in the matrix (e.g. a new row) don't generate all jobs again
+        options['matrix'] = sorted(
+            name for name, values in (options['matrix'] or {}).iteritems() if len(values) > 1)
+
+        return json.dumps(
+            [repository.url, repository.branch, options], sort_keys=True, default=unicode)
@@ -218,9 +218,41 @@ class JobsDoneJob(object):
         .. seealso: pytest_jobs_done_job
             For other examples
         '''
+        return cls.CreateFromParsedYAML(cls.ParseYAML(yaml_contents), repository)
+
+
+    @classmethod
+    def ParseYAML(cls, yaml_contents):
+        '''
+        Parses and validates a jobs_done file, without creating any jobs.
+
+        The result does not depend on a repository, so a file shared by many branches only needs to
+        be parsed once (.. seealso:: CreateFromParsedYAML).
+
+        :param unicode|None yaml_contents:
+            .. seealso:: CreateFromYAML
+
+        :return ParsedJobsDoneFile|None:
+            Parsed file, or None if `yaml_contents` is None.
+        '''
+        from jobs_done10 import metrics
+
         if yaml_contents is None:
-            return []
+            return None
+
+        with metrics.PARSE_DURATION.Time():
+            try:
+                return cls._ParseYAML(yaml_contents)
+            except Exception:
+                metrics.PARSE_ERRORS.Inc()
+                raise
+
 
+    @classmethod
+    def _ParseYAML(cls, yaml_contents):
+        '''
+        .. seealso:: ParseYAML
+        '''
         # Avoid errors with tabs at the end of file
         yaml_contents = yaml_contents.strip()
 
@@ -244,6 +276,12 @@ class JobsDoneJob(object):
         # List all possible matrix_rows
         matrix_rows = cls._MatrixRow.CreateFromDict(jd_data.get('matrix', {}))
 
+        # List all conditions used in options
+        conditions = set()
+        for yaml_dict in cls._IterDicts(jd_data):
+            for key in yaml_dict:
+                conditions.update(key.split(':')[:-1])
+
         from ben10.foundation.types_ import Boolean
         ignore_unmatchable = Boolean(jd_data.get('ignore_unmatchable', 'false'))
         if not ignore_unmatchable:
@@ -251,31 +289,60 @@ class JobsDoneJob(object):
             for yaml_dict in cls._IterDicts(jd_data):
                 for key, _value in yaml_dict.iteritems():
                     if ':' in key:
-                        conditions = key.split(':')[:-1]
+                        key_conditions = key.split(':')[:-1]
 
                         for row in matrix_rows:
-                            if cls._MatchConditions(conditions, row.full_dict, branch=cls._MATCH_ANY):
+                            if cls._MatchConditions(
+                                key_conditions, row.full_dict, branch=cls._MATCH_ANY):
                                 break
                         else:
                             raise UnmatchableConditionError(key)
 
-        import re
+        return ParsedJobsDoneFile(
+            jd_string=yaml.dump(jd_data, default_flow_style=False)[:-1],
+            matrix_rows=matrix_rows,
+            conditions=conditions,
+        )
+
+
+    @classmethod
+    def CreateFromParsedYAML(cls, parsed_file, repository, match_branch_patterns=True):
+        '''
+        Creates JobsDoneJob's from a parsed jobs_done file.
+
+        :param ParsedJobsDoneFile|None parsed_file:
+            .. seealso:: ParseYAML
+
+        :param Repository repository:
+            .. seealso:: CreateFromYAML
+
+        :param bool match_branch_patterns:
+            If False, jobs are created even if `repository` branch does not match their
+            `branch_patterns` (so callers can match them later).
+
+        :return list(JobsDoneJob):
+            .. seealso:: CreateFromYAML
+        '''
+        from jobs_done10 import metrics
+
+        if parsed_file is None:
+            return []
+
         jobs_done_jobs = []
-        for matrix_row in matrix_rows:
+        for matrix_row in parsed_file.matrix_rows:
             jobs_done_job = JobsDoneJob()
 
             jobs_done_job.repository = repository
             jobs_done_job.matrix_row = matrix_row.simple_dict
 
-            # Re-read jd_data replacing all matrix variables with their values in the current
+            # Re-read parsed file replacing all matrix variables with their values in the current
             # matrix_row and special replacement variables 'branch' and 'name', based on repository.
             format_dict = {
                 'branch':repository.branch,
                 'name':repository.name
             }
             format_dict.update(matrix_row.simple_dict)
-            jd_string = (yaml.dump(jd_data, default_flow_style=False)[:-1])
-            formatted_jd_string = jd_string.format(**format_dict)
+            formatted_jd_string = parsed_file.jd_string.format(**format_dict)
             jd_formatted_data = yaml.load(formatted_jd_string)
 
             # Re-write formatted_data dict ignoring/replacing dict keys based on matrix
@@ -298,18 +365,35 @@ class JobsDoneJob(object):
 
             # Do not create a job if exclude=='yes'
             if jd_formatted_data.get('exclude', 'no') == 'yes':
+                metrics.MATRIX_ROWS.Inc(result='excluded')
                 continue
 
             # Do not create a job if there is no match for this branch
-            branch_patterns = jobs_done_job.branch_patterns or ['.*']
-            if not any([re.match(pattern, repository.branch) for pattern in branch_patterns]):
+            if match_branch_patterns and not jobs_done_job.MatchesBranch(repository.branch):
+                metrics.MATRIX_ROWS.Inc(result='branch_mismatch')
                 continue
 
+            metrics.MATRIX_ROWS.Inc(result='expanded')
             jobs_done_jobs.append(jobs_done_job)
 
         return jobs_done_jobs
 
 
+    def MatchesBranch(self, branch):
+        '''
+        :param unicode branch:
+            A branch name.
+
+        :return bool:
+            True if `branch` matches `branch_patterns` of this job (jobs without `branch_patterns`
+            match any branch).
+        '''
+        import re
+
+        branch_patterns = self.branch_patterns or ['.*']
+        return any([re.match(pattern, branch) for pattern in branch_patterns])
+
+
     @classmethod
     def CreateFromFile(cls, filename, repository):
         '''
@@ -444,6 +528,31 @@ class JobsDoneJob(object):
                     yield x
 
 
+#===================================================================================================
+# ParsedJobsDoneFile
+#===================================================================================================
+class ParsedJobsDoneFile(object):
+    '''
+    A jobs_done file parsed by `JobsDoneJob.ParseYAML`, ready to create jobs for any repository.
+
+    :ivar unicode jd_string:
+        File contents (validated), normalized as YAML. Contains replacement fields that depend on
+        matrix rows and repository.
+
+    :ivar list(JobsDoneJob._MatrixRow) matrix_rows:
+        All rows of the file matrix.
+
+    :ivar set(unicode) conditions:
+        All conditions used in options (e.g. "planet-earth", "branch-master").
+    '''
+
+    def __init__(self, jd_string, matrix_rows, conditions):
+        self.jd_string = jd_string
+        self.matrix_rows = matrix_rows
+        self.conditions = conditions
+
+
+
 #===================================================================================================
 # UnknownJobsDoneJobOption
 #===================================================================================================
@@ -462,6 +571,10 @@ class UnknownJobsDoneFileOption(RuntimeError):
             (str(option_name), '\n'.join('- ' + str(o) for o in sorted(JobsDoneJob.PARSEABLE_OPTIONS)))
         )
 
+    def __reduce__(self):
+        # Pickled when raised in worker processes (.. seealso:: jobs_done10.worker_pool)
+        return (self.__class__, (self.option_name,))
+
 
 
 #===================================================================================================
@@ -496,6 +609,9 @@ class JobsDoneFileTypeError(TypeError):
             (option_name, accepted_types, obtained_type)
         )
 
+    def __reduce__(self):
+        return (self.__class__, (self.option_name, self.obtained_type, self.accepted_types))
+
 
 
 #===================================================================================================
@@ -517,3 +633,24 @@ class UnmatchableConditionError(ValueError):
             self,
             'Condition "%s" can never be matched based on possible matrix rows.' % option
         )
+
+    def __reduce__(self):
+        return (self.__class__, (self.option,))
+
+
+
+#===================================================================================================
+# JobsDoneFileResourceError
+#===================================================================================================
+class JobsDoneFileResourceError(RuntimeError):
+    '''
+    Raised when parsing a jobs_done file (and generating its jobs) goes over the resources allowed
+    (.. seealso:: jobs_done10.worker_pool.ResourceLimits).
+
+    :ivar unicode limit:
+        Limit exceeded: "cpu_time", "memory" or "timeout", or None if the worker process running
+        it exited unexpectedly (e.g. killed by the system when out of memory).
+    '''
+    def __init__(self, message, limit=None):
+        self.limit = limit
+        RuntimeError.__init__(self, message)
@@ -0,0 +1,506 @@
+'''
+Metrics collected while parsing jobs_done files, generating jobs and publishing them, exported in
+Prometheus text format (to a file read by node exporter's textfile collector, or from an HTTP
+endpoint, .. seealso:: jobs_done10.webhook.WebhookServer).
+
+Metrics are collected in a process wide registry (`REGISTRY`), so they can be updated anywhere
+without passing it around.
+'''
+from __future__ import unicode_literals
+
+
+
+#===================================================================================================
+# Counter
+#===================================================================================================
+class Counter(object):
+    '''
+    A value that only goes up (e.g. number of requests), for each combination of label values.
+    '''
+
+    TYPE = 'counter'
+
+    def __init__(self, name, help, label_names=()):
+        '''
+        :param unicode name:
+            Metric name.
+
+        :param unicode help:
+            Description of this metric.
+
+        :param tuple(unicode) label_names:
+            Names of labels this metric is partitioned by.
+        '''
+        import threading
+
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+
+        self._values = {}
+        self._lock = threading.Lock()
+
+
+    def Inc(self, amount=1, **labels):
+        '''
+        :param float amount:
+            Amount to add (must not be negative).
+
+        :param unicode labels:
+            Value of each label in `label_names`.
+        '''
+        if amount < 0:
+            raise ValueError('Counters can only be increased (got %s)' % amount)
+
+        key = _GetLabelValues(self, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+    def GetValue(self, **labels):
+        '''
+        :return float:
+            Current value for `labels`.
+        '''
+        key = _GetLabelValues(self, labels)
+        with self._lock:
+            return self._values.get(key, 0)
+
+
+    def Reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+    def TakeValues(self):
+        '''
+        Resets this metric, returning its values.
+
+        :return dict:
+            Values (picklable) collected since the last reset, to be added to the same metric in
+            another process (.. seealso:: AddValues).
+        '''
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+
+    def AddValues(self, values):
+        '''
+        :param dict values:
+            Values returned by `TakeValues`, added to the values of this metric.
+        '''
+        with self._lock:
+            for key, value in values.iteritems():
+                self._values[key] = self._values.get(key, 0) + value
+
+
+    def IterSamples(self):
+        '''
+        :yield tuple(unicode,tuple,float):
+            Sample name, labels (name/value pairs) and value of each sample of this metric.
+        '''
+        with self._lock:
+            values = sorted(self._values.items())
+
+        if not values and not self.label_names:
+            values = [((), 0)]
+
+        for label_values, value in values:
+            yield self.name, zip(self.label_names, label_values), value
+
+
+
+#===================================================================================================
+# Histogram
+#===================================================================================================
+class Histogram(object):
+    '''
+    Distribution of observed values (e.g. durations), counted in cumulative buckets, for each
+    combination of label values.
+    '''
+
+    TYPE = 'histogram'
+
+    # Default upper bounds of buckets, suited for durations in seconds
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+    def __init__(self, name, help, label_names=(), buckets=DEFAULT_BUCKETS):
+        '''
+        :param unicode name:
+        :param unicode help:
+        :param tuple(unicode) label_names:
+            .. seealso:: Counter
+
+        :param tuple(float) buckets:
+            Upper bounds of buckets (an extra "+Inf" bucket is always added).
+        '''
+        import threading
+
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets))
+
+        # Maps label values to (bucket counts, sum, count)
+        self._values = {}
+        self._lock = threading.Lock()
+
+
+    def Observe(self, value, **labels):
+        '''
+        :param float value:
+            Value observed.
+
+        :param unicode labels:
+            Value of each label in `label_names`.
+        '''
+        import bisect
+
+        key = _GetLabelValues(self, labels)
+        with self._lock:
+            bucket_counts, total, count = self._values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(bucket_counts):
+                bucket_counts[index] += 1
+            self._values[key] = (bucket_counts, total + value, count + 1)
+
+
+    def Time(self, **labels):
+        '''
+        :return context manager:
+            Observes the time (seconds) spent inside the context.
+        '''
+        return _HistogramTimer(self, labels)
+
+
+    def GetCount(self, **labels):
+        '''
+        :return int:
+            Number of values observed for `labels`.
+        '''
+        key = _GetLabelValues(self, labels)
+        with self._lock:
+            return self._values.get(key, (None, 0.0, 0))[2]
+
+
+    def GetSum(self, **labels):
+        '''
+        :return float:
+            Sum of values observed for `labels`.
+        '''
+        key = _GetLabelValues(self, labels)
+        with self._lock:
+            return self._values.get(key, (None, 0.0, 0))[1]
+
+
+    def Reset(self):
+        with self._lock:
+            self._values.clear()
+
+
+    def TakeValues(self):
+        '''
+        .. seealso:: Counter.TakeValues
+        '''
+        with self._lock:
+            values, self._values = self._values, {}
+        return values
+
+
+    def AddValues(self, values):
+        '''
+        .. seealso:: Counter.AddValues
+        '''
+        with self._lock:
+            for key, (bucket_counts, total, count) in values.iteritems():
+                current_bucket_counts, current_total, current_count = self._values.get(
+                    key, ([0] * len(self.buckets), 0.0, 0))
+                self._values[key] = (
+                    [a + b for a, b in zip(current_bucket_counts, bucket_counts)],
+                    current_total + total,
+                    current_count + count,
+                )
+
+
+    def IterSamples(self):
+        '''
+        .. seealso:: Counter.IterSamples
+        '''
+        with self._lock:
+            values = sorted(
+                (key, (list(bucket_counts), total, count))
+                for key, (bucket_counts, total, count) in self._values.iteritems()
+            )
+
+        if not values and not self.label_names:
+            values = [((), ([0] * len(self.buckets), 0.0, 0))]
+
+        for label_values, (bucket_counts, total, count) in values:
+            labels = zip(self.label_names, label_values)
+            cumulative_count = 0
+            for upper_bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative_count += bucket_count
+                yield (
+                    self.name + '_bucket',
+                    labels + [('le', _FormatValue(upper_bound))],
+                    cumulative_count,
+                )
+            yield self.name + '_bucket', labels + [('le', '+Inf')], count
+            yield self.name + '_sum', labels, total
+            yield self.name + '_count', labels, count
+
+
+
+class _HistogramTimer(object):
+
+    def __init__(self, histogram, labels):
+        self._histogram = histogram
+        self._labels = labels
+        self._start_time = None
+
+
+    def __enter__(self):
+        import time
+
+        self._start_time = time.time()
+        return self
+
+
+    def __exit__(self, *exc_info):
+        import time
+
+        self._histogram.Observe(time.time() - self._start_time, **self._labels)
+
+
+
+def _GetLabelValues(metric, labels):
+    '''
+    :return tuple(unicode):
+        Values of `labels`, in the order of `metric.label_names`.
+
+    :raises ValueError:
+        If `labels` are not exactly the labels of `metric`.
+    '''
+    if set(labels) != set(metric.label_names):
+        raise ValueError('Metric "%s" expects labels %s, got %s' % (
+            metric.name, sorted(metric.label_names), sorted(labels)))
+    return tuple(unicode(labels[label_name]) for label_name in metric.label_names)
+
+
+
+#===================================================================================================
+# MetricsRegistry
+#===================================================================================================
+class MetricsRegistry(object):
+    '''
+    Collection of metrics, exported together.
+    '''
+
+    # Content type of `FormatText` output, for HTTP responses
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self):
+        self._metrics = []
+
+
+    def Counter(self, name, help, label_names=()):
+        '''
+        Creates and registers a `Counter`.
+        '''
+        return self._Register(Counter(name, help, label_names))
+
+
+    def Histogram(self, name, help, label_names=(), buckets=Histogram.DEFAULT_BUCKETS):
+        '''
+        Creates and registers a `Histogram`.
+        '''
+        return self._Register(Histogram(name, help, label_names, buckets))
+
+
+    def GetMetric(self, name):
+        '''
+        :return Counter|Histogram|None:
+            Metric registered with `name`, if any.
+        '''
+        for metric in self._metrics:
+            if metric.name == name:
+                return metric
+        return None
+
+
+    def Reset(self):
+        '''
+        Resets values of all metrics.
+        '''
+        for metric in self._metrics:
+            metric.Reset()
+
+
+    def ResetAfterFork(self):
+        '''
+        Resets all metrics in a forked process, without waiting for their locks (copied from the
+        parent process, they may be held by threads that don't exist in the forked process).
+        '''
+        import threading
+
+        for metric in self._metrics:
+            metric._lock = threading.Lock()
+            metric.Reset()
+
+
+    def TakeValues(self):
+        '''
+        Resets all metrics, returning their values (e.g. to report metrics collected in a worker
+        process to its parent process).
+
+        :return dict(unicode,dict):
+            Maps names of metrics to their values (.. seealso:: Counter.TakeValues). Metrics
+            without values are omitted.
+        '''
+        values = {}
+        for metric in self._metrics:
+            metric_values = metric.TakeValues()
+            if metric_values:
+                values[metric.name] = metric_values
+        return values
+
+
+    def AddValues(self, values):
+        '''
+        :param dict(unicode,dict) values:
+            Values returned by `TakeValues` (possibly in another process), added to the values of
+            metrics with the same names. Unknown metrics are ignored.
+        '''
+        for name, metric_values in values.iteritems():
+            metric = self.GetMetric(name)
+            if metric is not None:
+                metric.AddValues(metric_values)
+
+
+    def FormatText(self):
+        '''
+        :return unicode:
+            All metrics in Prometheus text exposition format.
+        '''
+        lines = []
+        for metric in self._metrics:
+            lines.append('# HELP %s %s' % (metric.name, _EscapeHelp(metric.help)))
+            lines.append('# TYPE %s %s' % (metric.name, metric.TYPE))
+            for sample_name, labels, value in metric.IterSamples():
+                if labels:
+                    sample_name += '{%s}' % ','.join(
+                        '%s="%s"' % (label_name, _EscapeLabelValue(label_value))
+                        for label_name, label_value in labels
+                    )
+                lines.append('%s %s' % (sample_name, _FormatValue(value)))
+        return '\n'.join(lines) + '\n'
+
+
+    def WriteTextFile(self, filename):
+        '''
+        Writes all metrics (.. seealso:: FormatText) to a file, atomically, so node exporter's
+        textfile collector never reads a partially written file.
+
+        :param unicode filename:
+            Target file (the textfile collector only reads files ending with ".prom"). Parent
+            directories are created if necessary.
+        '''
+        import os
+        import sys
+        import tempfile
+
+        directory = os.path.dirname(os.path.abspath(filename))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        fd, temp_filename = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(filename))
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                temp_file.write(self.FormatText().encode('utf-8'))
+
+            # os.rename does not overwrite files in Windows
+            if sys.platform == 'win32' and os.path.exists(filename):
+                os.remove(filename)
+            os.rename(temp_filename, filename)
+        except:
+            if os.path.exists(temp_filename):
+                os.remove(temp_filename)
+            raise
+
+
+    def _Register(self, metric):
+        if self.GetMetric(metric.name) is not None:
+            raise ValueError('Metric "%s" already registered' % metric.name)
+        self._metrics.append(metric)
+        return metric
+
+
+
+def _FormatValue(value):
+    if isinstance(value, float):
+        if value == float('inf'):
+            return '+Inf'
+        return repr(value)
+    return unicode(value)
+
+
+def _EscapeHelp(text):
+    return text.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+def _EscapeLabelValue(text):
+    return _EscapeHelp(text).replace('"', '\\"')
+
+
+
+#===================================================================================================
+# Metrics collected by jobs_done10
+#===================================================================================================
+REGISTRY = MetricsRegistry()
+
+MATRIX_ROWS = REGISTRY.Counter(
+    'jobs_done_matrix_rows_total',
+    'Matrix rows of jobs_done files, by result ("expanded" into jobs, "excluded" by the exclude '
+    'option, or not matching the branch "branch_mismatch").',
+    ['result'],
+)
+PARSE_DURATION = REGISTRY.Histogram(
+    'jobs_done_parse_duration_seconds',
+    'Time spent parsing (and validating) jobs_done files.',
+)
+PARSE_ERRORS = REGISTRY.Counter(
+    'jobs_done_parse_errors_total',
+    'jobs_done files that could not be parsed.',
+)
+GENERATE_DURATION = REGISTRY.Histogram(
+    'jobs_done_generate_duration_seconds',
+    'Time spent generating each job.',
+)
+PUBLISH_DURATION = REGISTRY.Histogram(
+    'jobs_done_publish_duration_seconds',
+    'Time spent publishing the jobs of a repository/branch, by target ("jenkins" or '
+    '"directory").',
+    ['target'],
+)
+PUBLISHED_JOBS = REGISTRY.Counter(
+    'jobs_done_published_jobs_total',
+    'Jobs published, by target ("jenkins" or "directory") and action ("new", "updated", '
+    '"unchanged" or "deleted").',
+    ['target', 'action'],
+)
+REQUEST_DURATION = REGISTRY.Histogram(
+    'jobs_done_jenkins_request_duration_seconds',
+    'Latency of requests made to Jenkins (including retries), by kind of request.',
+    ['kind'],
+)
+REQUEST_RETRIES = REGISTRY.Counter(
+    'jobs_done_jenkins_request_retries_total',
+    'Requests to Jenkins retried after proxy errors, by kind of request.',
+    ['kind'],
+)
+REQUEST_ERRORS = REGISTRY.Counter(
+    'jobs_done_jenkins_request_errors_total',
+    'Requests to Jenkins that failed, by kind of request.',
+    ['kind'],
+)
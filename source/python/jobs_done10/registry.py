@@ -0,0 +1,96 @@
+'''
+Registry of command line commands, found without importing the generators that implement them.
+
+Importing a generator (and its dependencies) is only done when one of its commands is executed,
+keeping the command line fast to start.
+'''
+from __future__ import unicode_literals
+
+
+
+# Entry point group where other packages register commands. Each entry point maps a command name
+# to a function that configures commands in a clikit App
+# (.. seealso:: jobs_done10.generators.jenkins.ConfigureCommandLineInterface).
+COMMANDS_ENTRY_POINT_GROUP = 'jobs_done10.commands'
+
+# Commands of generators shipped with jobs_done10, by the function that configures them, with a
+# short description. These are found without scanning entry points (which is slow to import), and
+# are available even when jobs_done10 is not installed (e.g. running from sources).
+_BUILTIN_CONFIGURATORS = [
+    ('jobs_done10.generators.jenkins:ConfigureCommandLineInterface', {
+        'jenkins' : 'Creates jobs for Jenkins and push them to a Jenkins instance.',
+        'jenkins_test' : 'Creates jobs for Jenkins and save the resulting .xml\'s locally.',
+        'jenkins_batch' :
+            'Creates jobs for many repositories and push them to a Jenkins instance.',
+        'serve' : 'Starts a server that publishes jobs of branches as soon as they are pushed.',
+        'gc' : 'Deletes jobs of branches that do not exist anymore in a repository.',
+        'disable_inactive' : 'Disables jobs of branches without commits in a number of days.',
+    }),
+]
+
+# Maps names of builtin commands to their configure function and description
+BUILTIN_COMMANDS = dict(
+    (name, (configurator, description))
+    for configurator, descriptions in _BUILTIN_CONFIGURATORS
+    for name, description in descriptions.iteritems()
+)
+
+
+
+def ListCommands(include_plugins=False):
+    '''
+    :param bool include_plugins:
+        If True, also lists commands registered by other packages, which requires scanning
+        installed packages (slow, importing setuptools).
+
+    :return dict(unicode,unicode|None):
+        Maps names of available commands to their descriptions (None for commands registered
+        by other packages, which are only known after importing them).
+    '''
+    commands = {}
+    if include_plugins:
+        commands.update((name, None) for name in _GetEntryPointCommands())
+    commands.update((name, description) for name, (_, description) in BUILTIN_COMMANDS.iteritems())
+    return commands
+
+
+
+def GetCommandConfigurator(command):
+    '''
+    Imports the module that implements a command.
+
+    :param unicode command:
+        Command name.
+
+    :return callable|None:
+        Function that configures `command` (and possibly other commands of the same module) in a
+        clikit App, or None if `command` is unknown.
+    '''
+    import importlib
+
+    if command in BUILTIN_COMMANDS:
+        module_name, function_name = BUILTIN_COMMANDS[command][0].split(':')
+        return getattr(importlib.import_module(module_name), function_name)
+
+    entry_point = _GetEntryPointCommands().get(command)
+    if entry_point is None:
+        return None
+    return entry_point.load()
+
+
+
+def _GetEntryPointCommands():
+    '''
+    :return dict(unicode,EntryPoint):
+        Commands registered by installed packages, mapped to their entry points. Empty if
+        setuptools is not available.
+    '''
+    try:
+        import pkg_resources
+    except ImportError:
+        return {}
+
+    return dict(
+        (entry_point.name, entry_point)
+        for entry_point in pkg_resources.iter_entry_points(COMMANDS_ENTRY_POINT_GROUP)
+    )
@@ -30,3 +30,23 @@ class Repository(Bunch):
     def name(self):
         import re
         return re.match('.*/([^\./]+)(\.git/?)?$', self.url).groups()[0]
+
+
+
+def NormalizeUrl(url):
+    '''
+    :return unicode:
+        `url` without user, scheme, port and ".git" suffix, so urls for the same repository using
+        different protocols can be compared (e.g. "ssh://git@server:7999/space.git" and
+        "https://server/scm/space.git" are both "server/space").
+    '''
+    import re
+
+    url = url.lower().rstrip('/')
+    url = re.sub(r'\.git$', '', url)
+    url = re.sub(r'^[a-z+]+://', '', url)
+    url = re.sub(r'^[^@/]+@', '', url)
+    url = re.sub(r'^([^/:]+):\d*/?', r'\1/', url)
+
+    # Bitbucket Server serves http clones under "scm/"
+    return re.sub(r'^([^/]+)/scm/', r'\1/', url)
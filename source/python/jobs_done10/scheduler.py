@@ -0,0 +1,293 @@
+'''
+Scheduling of job regenerations requested by many sources (push notifications, scripts, batch
+runs), merging bursts of requests for the same repository/branch.
+'''
+from __future__ import unicode_literals
+
+
+
+#===================================================================================================
+# RegenerationScheduler
+#===================================================================================================
+class RegenerationScheduler(object):
+    '''
+    Runs regenerations of jobs (e.g. of a repository/branch) in worker threads.
+
+    - Debounce: a regeneration only starts `debounce` seconds after the last request for it
+      (but never more than `max_delay` seconds after the first one). Requests arriving in the
+      meantime are merged.
+    - Requests arriving while the same regeneration is running are merged into a single new run,
+      after the current one finishes (so the last request is always seen).
+    - Concurrency is limited per master (e.g. Jenkins instance), so a single master is not
+      overloaded by many regenerations.
+    - Regenerations of the same group (e.g. job group of a repository/branch) never run at the
+      same time.
+
+    :ivar int processed:
+        Number of regenerations finished so far.
+
+    :ivar int failed:
+        Number of regenerations that raised errors.
+
+    :ivar int merged:
+        Number of requests merged with requests already waiting.
+    '''
+
+    # Maximum number of regenerations waiting
+    MAX_PENDING = 1000
+
+    def __init__(
+        self,
+        regenerate,
+        workers=4,
+        max_per_master=2,
+        debounce=0.0,
+        max_delay=None,
+        on_error=None,
+        ):
+        '''
+        :param callable regenerate:
+            Called (from worker threads) with the key of each regeneration.
+
+        :param int workers:
+            Number of worker threads (maximum number of regenerations running, for all masters).
+
+        :param int max_per_master:
+            Maximum number of regenerations running at the same time for the same master.
+
+        :param float debounce:
+            Seconds to wait for more requests for the same key before running it.
+
+        :param float|None max_delay:
+            Maximum seconds a request waits because of debounce. Defaults to 10 times `debounce`.
+
+        :param callable on_error:
+            If given, called with a key and the exception raised by `regenerate` for it.
+        '''
+        import collections
+        import threading
+
+        self._regenerate = regenerate
+        self._workers = workers
+        self._max_per_master = max_per_master
+        self._debounce = debounce
+        self._max_delay = max_delay if max_delay is not None else 10 * debounce
+        self._on_error = on_error
+
+        self._pending = collections.OrderedDict()
+        self._running_groups = set()
+        self._running_per_master = collections.defaultdict(int)
+        self._condition = threading.Condition()
+        self._threads = []
+        self._stopped = False
+
+        self.processed = 0
+        self.failed = 0
+        self.merged = 0
+
+
+    def Start(self):
+        '''
+        Starts worker threads.
+        '''
+        import threading
+
+        self._stopped = False
+        for _ in range(self._workers):
+            thread = threading.Thread(target=self._Work)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+
+    def Stop(self):
+        '''
+        Stops worker threads, after the regenerations running finish. Regenerations still waiting
+        are discarded.
+        '''
+        with self._condition:
+            self._stopped = True
+            self._pending.clear()
+            self._condition.notify_all()
+
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+
+    def IsRunning(self):
+        '''
+        :return bool:
+            True if worker threads are running regenerations.
+        '''
+        return bool(self._threads) and not self._stopped
+
+
+    def Request(self, key, master=None, group=None):
+        '''
+        Requests a regeneration.
+
+        :param object key:
+            Regeneration requested (e.g. repository and branch), passed to `regenerate`.
+
+        :param object master:
+            Master affected by this regeneration (e.g. Jenkins url).
+
+        :param object group:
+            Group of this regeneration. Defaults to `key`.
+
+        :return bool:
+            True if a new regeneration was scheduled, False if it was merged with one already
+            waiting.
+
+        :raises SchedulerFullError:
+            If `MAX_PENDING` regenerations are already waiting.
+        '''
+        import time
+
+        now = time.time()
+        with self._condition:
+            request = self._pending.get(key)
+            if request is not None:
+                request.due_time = min(now + self._debounce, request.first_time + self._max_delay)
+                self.merged += 1
+                return False
+
+            if len(self._pending) >= self.MAX_PENDING:
+                raise SchedulerFullError(
+                    'Too many regenerations waiting (%d)' % len(self._pending))
+
+            self._pending[key] = _ScheduledRegeneration(
+                key=key,
+                master=master,
+                group=group if group is not None else key,
+                first_time=now,
+                due_time=now + self._debounce,
+            )
+            self._condition.notify_all()
+            return True
+
+
+    def Join(self, timeout=None):
+        '''
+        Waits until there are no regenerations waiting or running.
+
+        :param float|None timeout:
+            Maximum time to wait (seconds). If None, waits forever.
+
+        :return bool:
+            True if all regenerations finished, False on timeout.
+        '''
+        import time
+
+        end_time = time.time() + timeout if timeout is not None else None
+        with self._condition:
+            while self._pending or self._running_groups:
+                if end_time is None:
+                    self._condition.wait()
+                else:
+                    remaining_time = end_time - time.time()
+                    if remaining_time <= 0:
+                        return False
+                    self._condition.wait(remaining_time)
+            return True
+
+
+    def GetStatus(self):
+        '''
+        :return dict(unicode,int):
+            Number of regenerations "pending" and "running", and number of regenerations
+            "processed", "failed" and "merged" so far.
+        '''
+        with self._condition:
+            return {
+                'pending' : len(self._pending),
+                'running' : len(self._running_groups),
+                'processed' : self.processed,
+                'failed' : self.failed,
+                'merged' : self.merged,
+            }
+
+
+    def _Work(self):
+        while True:
+            with self._condition:
+                request = self._WaitNext()
+                if request is None:
+                    return
+
+                del self._pending[request.key]
+                self._running_groups.add(request.group)
+                self._running_per_master[request.master] += 1
+
+            failed = True
+            try:
+                try:
+                    self._regenerate(request.key)
+                    failed = False
+                except Exception as e:
+                    if self._on_error is not None:
+                        self._on_error(request.key, e)
+            finally:
+                # Always, even if `on_error` fails: its group and master would be blocked forever
+                with self._condition:
+                    self._running_groups.remove(request.group)
+                    self._running_per_master[request.master] -= 1
+                    self.processed += 1
+                    self.failed += failed
+                    self._condition.notify_all()
+
+
+    def _WaitNext(self):
+        '''
+        Waits for the next regeneration that can run (must be called holding `_condition`).
+
+        :return _ScheduledRegeneration|None:
+            The oldest regeneration that is due, whose group is not running and whose master is
+            not running `max_per_master` regenerations. None when stopped.
+        '''
+        import time
+
+        while not self._stopped:
+            now = time.time()
+            next_due_time = None
+            for request in self._pending.itervalues():
+                if request.group in self._running_groups:
+                    continue
+                if self._running_per_master[request.master] >= self._max_per_master:
+                    continue
+                if request.due_time <= now:
+                    return request
+                if next_due_time is None or request.due_time < next_due_time:
+                    next_due_time = request.due_time
+
+            if next_due_time is None:
+                self._condition.wait()
+            else:
+                self._condition.wait(next_due_time - now)
+
+        return None
+
+
+
+class _ScheduledRegeneration(object):
+    '''
+    A regeneration waiting in `RegenerationScheduler`.
+    '''
+
+    def __init__(self, key, master, group, first_time, due_time):
+        self.key = key
+        self.master = master
+        self.group = group
+        self.first_time = first_time
+        self.due_time = due_time
+
+
+
+#===================================================================================================
+# SchedulerFullError
+#===================================================================================================
+class SchedulerFullError(RuntimeError):
+    '''
+    Raised when too many regenerations are waiting in a `RegenerationScheduler`.
+    '''
@@ -0,0 +1,431 @@
+'''
+Server receiving push notifications (webhooks) from git hosting services, so jobs of a branch can
+be regenerated as soon as it is pushed.
+
+Supported payloads are push events from GitHub, Bitbucket Server (Stash, both the native
+"repo:refs_changed" event and the older post-receive hook plugin) and Bitbucket Cloud.
+'''
+from __future__ import unicode_literals
+from ben10.foundation.bunch import Bunch
+import BaseHTTPServer
+import SocketServer
+
+
+
+#===================================================================================================
+# PushEvent
+#===================================================================================================
+class PushEvent(Bunch):
+    '''
+    A branch pushed (created, updated or deleted) to a repository.
+
+    :cvar unicode repository_name:
+        Name of the repository (as in `Repository.name`).
+
+    :cvar list(unicode) urls:
+        Urls of the repository given in the payload (clone urls, when available).
+
+    :cvar unicode branch:
+        Branch pushed.
+    '''
+    repository_name = None
+    urls = None
+    branch = None
+
+
+
+def ParsePushPayload(headers, body):
+    '''
+    :param dict(unicode,unicode) headers:
+        HTTP headers of the request (with case insensitive names, e.g. `mimetools.Message`).
+
+    :param unicode body:
+        JSON payload.
+
+    :return list(PushEvent):
+        One event for each branch pushed (tags and other refs are ignored). Empty for other
+        events (e.g. "ping").
+
+    :raises ValueError:
+        If `body` is not a push payload of a supported service.
+    '''
+    import json
+
+    payload = json.loads(body)
+    if not isinstance(payload, dict) or not isinstance(payload.get('repository'), dict):
+        raise ValueError('Unknown payload: no repository information')
+
+    try:
+        if headers.get('X-GitHub-Event') is not None:
+            if headers.get('X-GitHub-Event') != 'push':
+                return []
+            events = _ParseGitHubPayload(payload)
+        elif 'push' in payload:
+            events = _ParseBitbucketCloudPayload(payload)
+        elif 'changes' in payload or 'refChanges' in payload:
+            events = _ParseBitbucketServerPayload(payload)
+        else:
+            raise ValueError('Unknown payload: not a push event')
+    except (KeyError, TypeError, AttributeError) as e:
+        raise ValueError('Invalid push payload: %s' % e)
+
+    # Many changes in the same branch are a single event
+    unique_events = []
+    for event in events:
+        if event not in unique_events:
+            unique_events.append(event)
+    return unique_events
+
+
+
+def _ParseGitHubPayload(payload):
+    repository = payload['repository']
+    branch = _GetBranchFromRef(payload['ref'])
+    if branch is None:
+        return []
+
+    return [PushEvent(
+        repository_name=repository['name'],
+        urls=_GetUrls(repository.get(key) for key in ('clone_url', 'ssh_url', 'git_url')),
+        branch=branch,
+    )]
+
+
+def _ParseBitbucketServerPayload(payload):
+    repository = payload['repository']
+    urls = _GetUrls(link.get('href') for link in repository.get('links', {}).get('clone', []))
+
+    events = []
+    for change in payload.get('changes') or payload.get('refChanges') or []:
+        ref = change.get('refId') or change['ref']['id']
+        branch = _GetBranchFromRef(ref)
+        if branch is not None:
+            events.append(PushEvent(repository_name=repository['slug'], urls=urls, branch=branch))
+    return events
+
+
+def _ParseBitbucketCloudPayload(payload):
+    repository = payload['repository']
+    urls = _GetUrls([repository.get('links', {}).get('html', {}).get('href')])
+
+    events = []
+    for change in payload['push']['changes']:
+        # "new" is None when a branch is deleted
+        ref = change.get('new') or change.get('old') or {}
+        if ref.get('type') == 'branch':
+            events.append(PushEvent(
+                repository_name=repository['full_name'].split('/')[-1],
+                urls=urls,
+                branch=ref['name'],
+            ))
+    return events
+
+
+def _GetBranchFromRef(ref):
+    '''
+    :return unicode|None:
+        Branch of a ref pushed ("refs/heads/<branch>"), or None for other refs.
+    '''
+    if ref.startswith('refs/heads/'):
+        return ref[len('refs/heads/'):]
+    return None
+
+
+def _GetUrls(urls):
+    return [url for url in urls if url]
+
+
+
+def IsValidSignature(secret, headers, body):
+    '''
+    Checks the signature of a payload (HMAC of the payload using a secret shared with the service
+    sending it), as sent by GitHub and Bitbucket Server ("X-Hub-Signature-256" or
+    "X-Hub-Signature" headers).
+
+    :param unicode secret:
+    :param dict(unicode,unicode) headers:
+    :param str body:
+
+    :return bool:
+        True if `body` is signed with `secret`.
+    '''
+    import hashlib
+    import hmac
+
+    for header in ('X-Hub-Signature-256', 'X-Hub-Signature'):
+        signature = headers.get(header)
+        if not signature or '=' not in signature:
+            continue
+
+        algorithm, digest = signature.split('=', 1)
+        if algorithm not in ('sha1', 'sha256'):
+            continue
+
+        expected = hmac.new(secret.encode('utf-8'), body, getattr(hashlib, algorithm)).hexdigest()
+        return hmac.compare_digest(expected.encode('ascii'), digest.strip().encode('ascii'))
+
+    return False
+
+
+
+#===================================================================================================
+# MirrorIndex
+#===================================================================================================
+class MirrorIndex(object):
+    '''
+    Finds local mirrors of repositories pushed.
+
+    Mirrors are git repositories (mirrors, bare clones or working copies) directly inside a
+    directory, found by the name of their "origin" url. When many mirrors have the same name, the
+    urls in a push event are used to tell them apart.
+    '''
+
+    def __init__(self, mirrors_directory):
+        '''
+        :param unicode mirrors_directory:
+            Directory with mirrors.
+        '''
+        import threading
+
+        self.mirrors_directory = mirrors_directory
+        self._mirrors = {}
+        self._lock = threading.Lock()
+
+
+    def Refresh(self):
+        '''
+        Looks for mirrors again (e.g. after new mirrors were added).
+
+        :return int:
+            Number of mirrors found.
+        '''
+        from jobs_done10.git_repository import GetRemoteUrl
+        from jobs_done10.repository import Repository
+        import os
+
+        mirrors = {}
+        for filename in sorted(os.listdir(self.mirrors_directory)):
+            mirror_path = os.path.join(self.mirrors_directory, filename)
+            if not _IsGitRepository(mirror_path):
+                continue
+
+            try:
+                url = GetRemoteUrl(mirror_path)
+                name = Repository(url=url).name
+            except Exception:
+                # Without a valid "origin"
+                continue
+            mirrors.setdefault(name.lower(), []).append((url, mirror_path))
+
+        with self._lock:
+            self._mirrors = mirrors
+        return sum(len(name_mirrors) for name_mirrors in mirrors.itervalues())
+
+
+    def Find(self, event):
+        '''
+        :param PushEvent event:
+
+        :return unicode|None:
+            Path to the mirror of the repository in `event`, or None if it can't be found (or
+            many mirrors match it).
+        '''
+        mirror_path = self._Find(event)
+        if mirror_path is None:
+            # Mirrors might have been added since the last refresh
+            self.Refresh()
+            mirror_path = self._Find(event)
+        return mirror_path
+
+
+    def _Find(self, event):
+        from jobs_done10.repository import NormalizeUrl
+
+        with self._lock:
+            candidates = self._mirrors.get(event.repository_name.lower(), [])
+
+        if len(candidates) > 1:
+            event_urls = set(NormalizeUrl(url) for url in event.urls)
+            candidates = [
+                (url, mirror_path)
+                for url, mirror_path in candidates
+                if NormalizeUrl(url) in event_urls
+            ]
+
+        if len(candidates) != 1:
+            return None
+        return candidates[0][1]
+
+
+
+def _IsGitRepository(path):
+    '''
+    :return bool:
+        True if `path` is the top directory of a git repository (working copy or bare), not just
+        a directory inside one.
+    '''
+    import os
+
+    if os.path.exists(os.path.join(path, '.git')):
+        return True
+    return os.path.isfile(os.path.join(path, 'HEAD')) and \
+        os.path.isdir(os.path.join(path, 'objects'))
+
+
+
+#===================================================================================================
+# WebhookServer
+#===================================================================================================
+class WebhookServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    '''
+    HTTP server receiving push payloads, queuing pushed branches (of repositories with a local
+    mirror) to be regenerated.
+
+    Endpoints:
+    - POST (any path): push payload. Responds 202 with a JSON object listing branches "queued",
+      "merged" (already waiting) and "ignored" (without a mirror).
+    - GET /health: 200 while the server is running.
+    - GET /ready: 200 when ready to process pushes (.. seealso:: is_ready), 503 otherwise.
+    - GET /metrics: metrics in Prometheus text format (.. seealso:: jobs_done10.metrics).
+    '''
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    # Maximum size of payloads accepted (bytes)
+    MAX_PAYLOAD_SIZE = 10 * 1024 * 1024
+
+    def __init__(self, address, mirror_index, scheduler, secret=None, is_ready=None, log=None):
+        '''
+        :param tuple(unicode,int) address:
+            Host and port where the server listens.
+
+        :param MirrorIndex mirror_index:
+            Finds mirrors of pushed repositories.
+
+        :param RegenerationScheduler scheduler:
+            Scheduler receiving (mirror path, branch) keys to regenerate.
+
+        :param unicode|None secret:
+            If given, only payloads signed with this secret are accepted (.. seealso::
+            IsValidSignature).
+
+        :param callable|None is_ready:
+            Returns True when pushes can be processed (e.g. after connecting to Jenkins). If None,
+            the server is ready as soon as `scheduler` is running.
+
+        :param callable|None log:
+            If given, called with messages about requests received.
+        '''
+        BaseHTTPServer.HTTPServer.__init__(self, address, _WebhookRequestHandler)
+        self.mirror_index = mirror_index
+        self.scheduler = scheduler
+        self.secret = secret
+        self.is_ready = is_ready
+        self.log = log
+
+
+    def IsReady(self):
+        '''
+        :return bool:
+            True if pushes can be processed.
+        '''
+        if not self.scheduler.IsRunning():
+            return False
+        return self.is_ready is None or self.is_ready()
+
+
+    def HandlePush(self, headers, body):
+        '''
+        Queues branches in a push payload.
+
+        :return tuple(int,dict):
+            HTTP status and JSON response.
+        '''
+        from jobs_done10.scheduler import SchedulerFullError
+
+        if self.secret is not None and not IsValidSignature(self.secret, headers, body):
+            return 403, {'error' : 'Invalid signature'}
+
+        try:
+            events = ParsePushPayload(headers, body)
+        except ValueError as e:
+            return 400, {'error' : unicode(e)}
+
+        response = {'queued' : [], 'merged' : [], 'ignored' : []}
+        for event in events:
+            description = '%s:%s' % (event.repository_name, event.branch)
+            mirror_path = self.mirror_index.Find(event)
+            if mirror_path is None:
+                response['ignored'].append(description)
+                continue
+
+            try:
+                queued = self.scheduler.Request((mirror_path, event.branch))
+            except SchedulerFullError as e:
+                return 503, {'error' : unicode(e)}
+            response['queued' if queued else 'merged'].append(description)
+
+        self.Log('push: %s' % ', '.join(
+            '%s %s' % (status, description)
+            for status in ('queued', 'merged', 'ignored')
+            for description in response[status]
+        ) or 'push: no branches')
+        return 202, response
+
+
+    def Log(self, message):
+        if self.log is not None:
+            self.log(message)
+
+
+
+class _WebhookRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._Respond(200, {'status' : 'ok'})
+        elif self.path == '/ready':
+            ready = self.server.IsReady()
+            self._Respond(
+                200 if ready else 503,
+                {'ready' : ready, 'scheduler' : self.server.scheduler.GetStatus()},
+            )
+        elif self.path == '/metrics':
+            from jobs_done10.metrics import REGISTRY
+            self._RespondBody(200, REGISTRY.CONTENT_TYPE, REGISTRY.FormatText().encode('utf-8'))
+        else:
+            self._Respond(404, {'error' : 'Not found'})
+
+
+    def do_POST(self):
+        try:
+            size = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            size = -1
+
+        if not 0 <= size <= self.server.MAX_PAYLOAD_SIZE:
+            self._Respond(413, {'error' : 'Invalid payload size'})
+            return
+
+        status, response = self.server.HandlePush(self.headers, self.rfile.read(size))
+        self._Respond(status, response)
+
+
+    def _Respond(self, status, response):
+        import json
+
+        self._RespondBody(status, 'application/json', json.dumps(response, sort_keys=True))
+
+
+    def _RespondBody(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+    def log_message(self, format, *args):
+        # Requests are logged by the server (.. seealso:: WebhookServer.log)
+        pass
@@ -0,0 +1,346 @@
+'''
+Runs parsing of jobs_done files (and generation of their jobs) in worker processes with limited
+resources, so a single file (e.g. with a huge matrix or deeply nested YAML anchors) can't take
+over the memory and CPU of a process publishing jobs for many repositories.
+'''
+from __future__ import unicode_literals
+from ben10.foundation.bunch import Bunch
+
+
+
+#===================================================================================================
+# ResourceLimits
+#===================================================================================================
+class ResourceLimits(Bunch):
+    '''
+    Resources each task run by a `WorkerPool` may use.
+
+    CPU time and memory limits are only enforced where the `resource` module is available (not on
+    Windows). The wall-clock timeout is always enforced.
+
+    :cvar int|None cpu_time:
+        CPU time (seconds).
+
+    :cvar int|None memory:
+        Memory (MB) a task may allocate (address space over what the worker was already using).
+
+    :cvar float|None timeout:
+        Wall-clock time (seconds).
+    '''
+    cpu_time = 60
+    memory = 1024
+    timeout = 120
+
+
+
+#===================================================================================================
+# WorkerPool
+#===================================================================================================
+class WorkerPool(object):
+    '''
+    Bounded pool of worker processes running tasks (functions) within `ResourceLimits`.
+
+    Tasks that go over their limits raise `JobsDoneFileResourceError`, and their worker process is
+    replaced: other tasks (running or waiting) are not affected.
+
+    Any other error raised by a task is raised again by `Run`. Metrics updated by tasks
+    (.. seealso:: jobs_done10.metrics) are sent back with their results, and added to the metrics of
+    this process (metrics of tasks that go over their limits are lost).
+
+    Worker processes are forked: call `Start` before starting threads, so workers don't inherit
+    locks held by threads that don't exist in them.
+    '''
+
+    # Worker processes are replaced after running this number of tasks, so memory fragmented by
+    # previous tasks does not count towards the limits of later ones
+    MAX_TASKS_PER_WORKER = 100
+
+    def __init__(self, processes=2, limits=None):
+        '''
+        :param int processes:
+            Maximum number of worker processes (tasks running at the same time). Workers are
+            started by `Start`, or when needed.
+
+        :param ResourceLimits|None limits:
+            Limits of each task. Defaults to `ResourceLimits()`.
+        '''
+        import threading
+
+        self.limits = limits if limits is not None else ResourceLimits()
+
+        self._processes = processes
+        self._semaphore = threading.Semaphore(processes)
+        self._idle_workers = []
+        self._lock = threading.Lock()
+
+
+    def Start(self):
+        '''
+        Starts all worker processes.
+
+        Workers replaced later (after going over their limits, or running MAX_TASKS_PER_WORKER
+        tasks) are still started when needed.
+        '''
+        with self._lock:
+            while len(self._idle_workers) < self._processes:
+                self._idle_workers.append(_WorkerProcess(self.limits))
+
+
+    def Run(self, func, *args):
+        '''
+        Runs a task in a worker process, waiting for a free worker.
+
+        :param callable func:
+            Task function. Must be defined at module level (it is pickled by name), as well as its
+            arguments and result.
+
+        :return object:
+            Whatever `func` returns.
+
+        :raises JobsDoneFileResourceError:
+            If `func` goes over `limits`.
+        '''
+        from jobs_done10 import metrics
+
+        with self._semaphore:
+            worker = self._GetWorker()
+            try:
+                status, value, metric_values = worker.Run(func, args, self.limits.timeout)
+            except:
+                worker.Terminate()
+                raise
+
+            if status in ('result', 'error') and worker.tasks < self.MAX_TASKS_PER_WORKER:
+                with self._lock:
+                    self._idle_workers.append(worker)
+            else:
+                worker.Terminate()
+
+        if metric_values:
+            metrics.REGISTRY.AddValues(metric_values)
+
+        if status == 'result':
+            return value
+        if status == 'error':
+            raise value
+        raise self._CreateResourceError(status, value)
+
+
+    def Close(self):
+        '''
+        Terminates idle worker processes.
+        '''
+        with self._lock:
+            workers, self._idle_workers = self._idle_workers, []
+
+        for worker in workers:
+            worker.Terminate()
+
+
+    def _GetWorker(self):
+        with self._lock:
+            while self._idle_workers:
+                worker = self._idle_workers.pop()
+                if worker.process.is_alive():
+                    return worker
+                worker.Terminate()
+
+        return _WorkerProcess(self.limits)
+
+
+    def _CreateResourceError(self, status, exit_code):
+        '''
+        :param unicode status:
+            Status of a task that did not finish: "timeout", "memory" or "exit".
+
+        :param int|None exit_code:
+            Exit code of the worker process (for "exit").
+
+        :return JobsDoneFileResourceError:
+        '''
+        from jobs_done10.jobs_done_job import JobsDoneFileResourceError
+        import signal
+
+        prefix = 'Parsing the jobs_done file (and generating its jobs)'
+        if status == 'timeout':
+            return JobsDoneFileResourceError(
+                '%s took longer than %ss' % (prefix, self.limits.timeout), 'timeout')
+
+        if status == 'memory':
+            return JobsDoneFileResourceError(
+                '%s exceeded the memory limit (%s MB)' % (prefix, self.limits.memory), 'memory')
+
+        sigxcpu = getattr(signal, 'SIGXCPU', None)  # Not available on Windows
+        if sigxcpu is not None and exit_code == -sigxcpu:
+            return JobsDoneFileResourceError(
+                '%s exceeded the CPU time limit (%ss)' % (prefix, self.limits.cpu_time),
+                'cpu_time',
+            )
+
+        return JobsDoneFileResourceError(
+            '%s failed: worker process exited unexpectedly (exit code %s, possibly killed when out '
+            'of memory)' % (prefix, exit_code))
+
+
+
+class _WorkerProcess(object):
+    '''
+    A worker process, receiving tasks through a pipe.
+
+    :ivar multiprocessing.Process process:
+    :ivar int tasks:
+        Number of tasks sent to this worker.
+    '''
+
+    def __init__(self, limits):
+        import multiprocessing
+
+        self.connection, child_connection = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=_WorkerMain, args=(child_connection, limits))
+        self.process.daemon = True
+        self.process.start()
+        child_connection.close()
+        self.tasks = 0
+
+
+    def Run(self, func, args, timeout):
+        '''
+        :return tuple(unicode,object,dict|None):
+            Status, value and metric values updated by the task
+            (.. seealso:: MetricsRegistry.TakeValues). Status and value are:
+            - "result", and the value returned by the task;
+            - "error", and the exception raised by the task;
+            - "memory", if the task ran out of memory (worker must be terminated);
+            - "timeout", if the task did not finish in `timeout` seconds (worker must be
+              terminated);
+            - "exit", and the worker exit code, if the worker process exited.
+        '''
+        self.tasks += 1
+        self.connection.send((func, args))
+
+        if not self.connection.poll(timeout):
+            return 'timeout', None, None
+
+        try:
+            return self.connection.recv()
+        except EOFError:
+            self.process.join()
+            return 'exit', self.process.exitcode, None
+
+
+    def Terminate(self):
+        if self.process.is_alive():
+            self.process.terminate()
+        self.process.join()
+        self.connection.close()
+
+
+
+def _WorkerMain(connection, limits):
+    '''
+    Main function of worker processes: runs tasks received from `connection`, sending back their
+    results (and metrics they updated), until `connection` is closed.
+    '''
+    from jobs_done10 import metrics
+    import os
+
+    # Locks copied from the parent process may be held by threads that don't exist here
+    metrics.REGISTRY.ResetAfterFork()
+
+    while True:
+        try:
+            func, args = connection.recv()
+        except EOFError:
+            return
+
+        _LimitResources(limits)
+        metric_values = None
+        try:
+            result = func(*args)
+            metric_values = metrics.REGISTRY.TakeValues()
+            connection.send(('result', result, metric_values))
+        except MemoryError:
+            # Memory may be fragmented (or still held by the task): never reuse this worker
+            connection.send(('memory', None, None))
+            os._exit(1)
+        except Exception as e:
+            # Raised by the task, or pickling its result
+            if metric_values is None:
+                metric_values = metrics.REGISTRY.TakeValues()
+            connection.send(('error', _GetPicklableError(e), metric_values))
+
+
+
+def _LimitResources(limits):
+    '''
+    Limits CPU time and memory of the current process for the next task: limits are relative to
+    what was used by previous tasks.
+
+    Going over the CPU time limit kills the process (SIGXCPU), and going over the memory limit
+    raises MemoryError.
+    '''
+    try:
+        import resource
+    except ImportError:
+        return  # Not available on Windows: only the wall-clock timeout is enforced
+
+    def _SetLimit(limit_type, value):
+        _soft, hard = resource.getrlimit(limit_type)
+        if hard != resource.RLIM_INFINITY:
+            value = min(value, hard)
+        try:
+            resource.setrlimit(limit_type, (value, hard))
+        except (ValueError, resource.error):
+            pass  # Limit not supported on this platform
+
+    if limits.cpu_time is not None:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        _SetLimit(resource.RLIMIT_CPU, int(usage.ru_utime + usage.ru_stime + limits.cpu_time) + 1)
+
+    if limits.memory is not None:
+        _SetLimit(resource.RLIMIT_AS, _GetAddressSpaceSize() + limits.memory * 1024 * 1024)
+
+
+
+def _GetAddressSpaceSize():
+    '''
+    :return int:
+        Size of the address space (virtual memory) of the current process, in bytes, or 0 if it
+        can't be obtained (only available in Linux).
+    '''
+    import os
+
+    try:
+        with open('/proc/self/statm', 'rb') as statm_file:
+            pages = int(statm_file.read().split()[0])
+        return pages * os.sysconf(str('SC_PAGE_SIZE'))
+    except (IOError, OSError, ValueError):
+        return 0
+
+
+
+def _GetPicklableError(error):
+    '''
+    :param Exception error:
+        Error raised by a task.
+
+    :return Exception:
+        `error`, if it can be sent back to the parent process keeping its message, or a
+        RuntimeError with its type and message otherwise.
+    '''
+    import pickle
+
+    def _GetMessage(e):
+        try:
+            return unicode(e)
+        except UnicodeError:
+            return repr(e)
+
+    try:
+        copied_error = pickle.loads(pickle.dumps(error, pickle.HIGHEST_PROTOCOL))
+        if type(copied_error) is type(error) and _GetMessage(copied_error) == _GetMessage(error):
+            return error
+    except Exception:
+        pass
+    return RuntimeError('%s: %s' % (error.__class__.__name__, _GetMessage(error)))